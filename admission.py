@@ -0,0 +1,270 @@
+"""
+Admission control in front of the detector.
+
+Only max_concurrent verifications run at once; the rest wait in a bounded
+queue instead of all competing for Tesseract and the model until every client
+times out together. Waiting requests are served by lane (interactive before
+batch) and, within a lane, earliest deadline first. A request whose deadline
+passes while it waits is dropped rather than run for a client that has given
+up, and once the queue is full new requests are refused straight away with a
+Retry-After estimate.
+
+Under pressure the controller degrades instead of stalling: a request admitted
+while the queue is deep, or with less of its deadline left than a full
+verification has been taking, is marked degraded so the caller can skip OCR
+and return a visual-only verdict flagged as partial.
+
+Lanes are chosen by the server, not the caller: a request may only pick its
+lane when it comes from one of the configured priority networks; all others
+get the default lane, whatever they ask for.
+"""
+import heapq
+import ipaddress
+import itertools
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+LANES = ('interactive', 'batch')
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is refused or dropped before it reaches the detector."""
+
+    def __init__(self, message, status_code=429, retry_after=1):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """A request's place in the admission queue, and then its slot."""
+
+    def __init__(self, lane, client, deadline, seq):
+        self.lane = lane
+        self.client = client
+        self.deadline = deadline
+        self.seq = seq
+        self.enqueued_at = time.monotonic()
+        self.admitted_at = None
+        self.degraded = False
+        self.state = 'queued'
+
+    def remaining(self):
+        """Seconds left before the deadline, or None without one."""
+        return self.deadline - time.monotonic() if self.deadline is not None else None
+
+
+class AdmissionController:
+    """Bounded, prioritized, deadline-aware admission of verification requests."""
+
+    def __init__(self, max_concurrent=8, max_queue=32, max_queued_per_client=None, lanes=LANES,
+                 degrade_queue_fraction=0.5, on_decision=None, priority_networks=None):
+        """
+        Args:
+            max_concurrent (int): Verifications allowed to run at once.
+            max_queue (int): Requests allowed to wait; more are refused with a 429.
+            max_queued_per_client (int): Requests one client may have waiting; None for no limit.
+            lanes (tuple): Lane names, highest priority first.
+            degrade_queue_fraction (float): Requests admitted while at least this share
+                of max_queue is waiting run degraded.
+            on_decision (callable): Called as on_decision(lane, outcome) for every request,
+                with outcome 'admitted', 'degraded', 'rejected' or 'expired'; e.g. a metric.
+            priority_networks (list): Networks, e.g. '10.0.0.0/8', whose clients may choose
+                their lane; None lets no client choose.
+        """
+        if max_concurrent < 1:
+            raise ValueError("max_concurrent must be at least 1")
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_queued_per_client = max_queued_per_client
+        self.lanes = tuple(lanes)
+        self.degrade_depth = max(1, int(math.ceil(max_queue * degrade_queue_fraction))) if max_queue else 1
+        self.on_decision = on_decision
+        self.priority_networks = [ipaddress.ip_network(network, strict=False)
+                                  for network in priority_networks or ()]
+
+        self._cond = threading.Condition()
+        self._heap = []
+        self._seq = itertools.count()
+        self._active = 0
+        self._queued = 0
+        self._queued_by_client = {}
+        # Moving averages of how long full and degraded verifications take
+        self._service_seconds = {False: None, True: None}
+
+    def lane_for(self, name, default, address=None):
+        """
+        Choose the lane of a request.
+
+        Args:
+            name (str): Lane the caller asked for, if any.
+            default (str): Lane of callers that may not choose, or asked for no known lane.
+            address (str): The caller's network address.
+
+        Returns:
+            str: name if it is a known lane and address is in a priority network, else default.
+        """
+        if name not in self.lanes or not self.may_choose_lane(address):
+            return default
+        return name
+
+    def may_choose_lane(self, address):
+        """Return whether a caller at address is trusted to choose its own lane."""
+        if not address or not self.priority_networks:
+            return False
+        try:
+            address = ipaddress.ip_address(address)
+        except ValueError:
+            return False
+        return any(address in network for network in self.priority_networks)
+
+    def queued(self):
+        """Return the number of requests waiting for a slot."""
+        return self._queued
+
+    def active(self):
+        """Return the number of requests holding a slot."""
+        return self._active
+
+    def retry_after(self):
+        """Estimate, in whole seconds, when a refused request is worth retrying."""
+        per_request = self._service_seconds[False] or 1.0
+        return max(1, int(math.ceil((self._queued + 1) * per_request / self.max_concurrent)))
+
+    def check(self, lane, client=None):
+        """
+        Refuse a request early, e.g. before its body is read, if it would be refused anyway.
+
+        Raises:
+            AdmissionRejected: If the queue, or the client's share of it, is full.
+        """
+        with self._cond:
+            self._check_capacity(lane, client)
+
+    def _check_capacity(self, lane, client):
+        if self._active < self.max_concurrent and not self._queued:
+            return
+        if self._queued >= self.max_queue:
+            self._decide(lane, 'rejected')
+            raise AdmissionRejected("Server is overloaded; retry later", 429, self.retry_after())
+        if (self.max_queued_per_client is not None and client is not None
+                and self._queued_by_client.get(client, 0) >= self.max_queued_per_client):
+            self._decide(lane, 'rejected')
+            raise AdmissionRejected("Too many queued requests from this client; retry later", 429,
+                                    self.retry_after())
+
+    @contextmanager
+    def admit(self, lane, client=None, deadline=None, block=False):
+        """
+        Wait for a slot and hold it for the duration of the block.
+
+        Args:
+            lane (str): One of self.lanes.
+            client (str): Identifies the caller for the per-client queue limit.
+            deadline (float): time.monotonic() value after which the answer is
+                useless. Requests without one wait as long as it takes and are
+                never degraded.
+            block (bool): Wait even if the queue is full, e.g. for internal batch workers.
+
+        Yields:
+            Ticket: The admitted request; ticket.degraded says whether to run the
+                cheaper, partial pipeline.
+
+        Raises:
+            AdmissionRejected: 429 if the queue is full, 503 if the deadline passed
+                while waiting.
+        """
+        if lane not in self.lanes:
+            raise ValueError(f"Unknown admission lane '{lane}'")
+        ticket = self._acquire(lane, client, deadline, block)
+        try:
+            yield ticket
+        finally:
+            self._release(ticket)
+
+    def _acquire(self, lane, client, deadline, block):
+        with self._cond:
+            if not block:
+                self._check_capacity(lane, client)
+            ticket = Ticket(lane, client, deadline, next(self._seq))
+            heapq.heappush(self._heap, (self.lanes.index(lane),
+                                        deadline if deadline is not None else math.inf,
+                                        ticket.seq, ticket))
+            self._queued += 1
+            self._queued_by_client[client] = self._queued_by_client.get(client, 0) + 1
+            self._dispatch()
+
+            while ticket.state == 'queued':
+                remaining = ticket.remaining()
+                if remaining is not None and remaining <= 0:
+                    # Still in the heap; _dispatch discards it
+                    self._dequeue(ticket, 'expired')
+                    break
+                self._cond.wait(remaining)
+
+            if ticket.state == 'expired':
+                self._decide(lane, 'expired')
+                raise AdmissionRejected("Request deadline passed while waiting for capacity", 503,
+                                        self.retry_after())
+            self._decide(lane, 'degraded' if ticket.degraded else 'admitted')
+            return ticket
+
+    def _dispatch(self):
+        """Hand free slots to the best waiting requests; called with the lock held."""
+        granted = False
+        now = time.monotonic()
+        while self._heap and self._active < self.max_concurrent:
+            _, deadline, _, ticket = heapq.heappop(self._heap)
+            if ticket.state != 'queued':
+                continue
+            if deadline <= now:
+                self._dequeue(ticket, 'expired')
+                granted = True
+                continue
+            self._dequeue(ticket, 'admitted')
+            self._active += 1
+            ticket.admitted_at = now
+            if ticket.deadline is not None:
+                full = self._service_seconds[False]
+                ticket.degraded = (self._queued >= self.degrade_depth
+                                   or (full is not None and ticket.deadline - now < full))
+            granted = True
+        if granted:
+            self._cond.notify_all()
+
+    def _dequeue(self, ticket, state):
+        ticket.state = state
+        self._queued -= 1
+        count = self._queued_by_client[ticket.client] - 1
+        if count:
+            self._queued_by_client[ticket.client] = count
+        else:
+            del self._queued_by_client[ticket.client]
+
+    def _release(self, ticket):
+        elapsed = time.monotonic() - ticket.admitted_at
+        with self._cond:
+            average = self._service_seconds[ticket.degraded]
+            self._service_seconds[ticket.degraded] = elapsed if average is None else 0.8 * average + 0.2 * elapsed
+            self._active -= 1
+            self._dispatch()
+
+    def _decide(self, lane, outcome):
+        if self.on_decision is not None:
+            self.on_decision(lane, outcome)
+
+    def snapshot(self):
+        """Return the controller's load and settings as a dict."""
+        with self._cond:
+            return {
+                'active': self._active,
+                'queued': self._queued,
+                'max_concurrent': self.max_concurrent,
+                'max_queue': self.max_queue,
+                'lanes': list(self.lanes),
+                'priority_networks': [str(network) for network in self.priority_networks],
+                'mean_seconds': {'full': self._service_seconds[False], 'degraded': self._service_seconds[True]},
+                'retry_after': self.retry_after(),
+            }
@@ -0,0 +1,268 @@
+"""
+Append-only audit log of verification results.
+
+Every verdict is recorded in a SQLite database with the scores, the extracted
+metadata, the content hash of the upload and the model version that scored
+it, so questions about past verifications are answered from an indexed lookup
+instead of by running the CNN and OCR again.
+
+Writes are batched and happen behind the request: record() only queues the
+result, and a writer thread inserts whatever has queued up while its last
+transaction was committing, up to batch_size rows at a time, in one
+transaction. Requests never wait on the disk, and the busier the server, the
+more records share each commit. If the writer falls behind by max_pending
+records, new ones are dropped and counted rather than letting the queue grow
+without bound. Records are serialized one at a time, so a result that can't
+be stored is counted as failed without taking the rest of its batch with it.
+
+Records can't be changed or deleted through SQLite once written; triggers
+abort any UPDATE or DELETE. Queries page through the records newest first
+with a keyset cursor, so deep pages cost as little as the first one.
+"""
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS verifications (
+    id INTEGER PRIMARY KEY,
+    verified_at REAL NOT NULL,
+    digest TEXT,
+    filename TEXT,
+    source TEXT,
+    model_version TEXT,
+    is_authentic INTEGER NOT NULL,
+    partial INTEGER NOT NULL,
+    authenticity_score REAL,
+    document_id TEXT,
+    issue_date TEXT,
+    metadata TEXT NOT NULL,
+    result TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS verifications_document_id ON verifications (document_id);
+CREATE INDEX IF NOT EXISTS verifications_issue_date ON verifications (issue_date);
+CREATE INDEX IF NOT EXISTS verifications_digest ON verifications (digest);
+CREATE INDEX IF NOT EXISTS verifications_verified_at ON verifications (verified_at);
+CREATE TRIGGER IF NOT EXISTS verifications_no_update BEFORE UPDATE ON verifications
+BEGIN SELECT RAISE(ABORT, 'audit records are append-only'); END;
+CREATE TRIGGER IF NOT EXISTS verifications_no_delete BEFORE DELETE ON verifications
+BEGIN SELECT RAISE(ABORT, 'audit records are append-only'); END;
+"""
+
+SUMMARY_COLUMNS = ('id', 'verified_at', 'digest', 'filename', 'source', 'model_version', 'is_authentic',
+                   'partial', 'authenticity_score', 'document_id', 'issue_date', 'metadata')
+
+
+class AuditStore:
+    """Records verification results behind the request and answers indexed queries over them."""
+
+    def __init__(self, db_path, batch_size=256, max_pending=10000):
+        """
+        Open (or create) the store and start its writer thread.
+
+        Args:
+            db_path (str): SQLite database file.
+            batch_size (int): Most records inserted per transaction.
+            max_pending (int): Records allowed to wait for the writer; more are dropped.
+        """
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.dropped = 0
+        self.failed = 0
+        self.written = 0
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._dropped_lock = threading.Lock()
+
+        db_dir = os.path.dirname(os.path.abspath(db_path))
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+        self._writer = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+        self._writer.start()
+
+    @contextmanager
+    def _connect(self):
+        """Open a connection that commits on success and is always closed."""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        # With WAL, a crash can lose the last few records but never corrupt the store
+        conn.execute("PRAGMA synchronous=NORMAL")
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def record(self, result, digest=None, model_version=None, filename=None, source=None):
+        """
+        Queue a verification result to be written; returns immediately.
+
+        The result is serialized by the writer thread, so it must not be
+        modified afterwards.
+
+        Args:
+            result (dict): The verification result.
+            digest (str): SHA-256 of the uploaded document.
+            model_version (str): Name of the model version that scored it.
+            filename (str): Name the document was uploaded under.
+            source (str): Where the verification came from, e.g. 'verify' or 'batch'.
+        """
+        try:
+            self._queue.put_nowait((time.time(), result, digest, model_version, filename, source))
+        except queue.Full:
+            # record() runs on request threads, so the count is updated under a lock
+            with self._dropped_lock:
+                self.dropped += 1
+                dropped = self.dropped
+            if dropped == 1 or dropped % 1000 == 0:
+                logger.warning(f"Audit writer is behind; {dropped} records dropped so far")
+
+    def pending(self):
+        """Return the number of records waiting to be written."""
+        return self._queue.qsize()
+
+    def flush(self, timeout=None):
+        """
+        Wait until every record queued so far has been written.
+
+        Returns:
+            bool: False if the timeout expired first.
+        """
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def _run(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        while True:
+            batch = [self._queue.get()]
+            # Everything that queued up while the last transaction committed goes into this one
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            flushes = [item for item in batch if isinstance(item, threading.Event)]
+            rows = []
+            for item in batch:
+                if isinstance(item, threading.Event):
+                    continue
+                try:
+                    rows.append(self._row(*item))
+                except Exception as e:
+                    self.failed += 1
+                    logger.error(f"Failed to serialize an audit record of document {item[2]}: {str(e)}")
+            if rows:
+                try:
+                    with conn:
+                        conn.executemany(
+                            "INSERT INTO verifications (verified_at, digest, filename, source, model_version, "
+                            "is_authentic, partial, authenticity_score, document_id, issue_date, metadata, result) "
+                            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                    self.written += len(rows)
+                except Exception as e:
+                    self.failed += len(rows)
+                    logger.error(f"Failed to write {len(rows)} audit records: {str(e)}")
+            for done in flushes:
+                done.set()
+
+    @staticmethod
+    def _row(verified_at, result, digest, model_version, filename, source):
+        """Turn a queued record into a row of the verifications table."""
+        metadata = result.get('text_extraction', {}).get('metadata', {})
+        return (verified_at, digest, filename, source, model_version,
+                int(bool(result.get('is_authentic'))), int(bool(result.get('partial'))),
+                result.get('visual_analysis', {}).get('authenticity_score'),
+                metadata.get('document_id'), metadata.get('issue_date'),
+                json.dumps(metadata), json.dumps(result))
+
+    def query(self, document_id=None, issue_date=None, digest=None, since=None, until=None, is_authentic=None,
+              limit=50, cursor=None):
+        """
+        Find recorded verifications, newest first, a page at a time.
+
+        Args:
+            document_id (str): Document number extracted from the text.
+            issue_date (str): Issue date, exactly as extracted.
+            digest (str): SHA-256 of the uploaded document.
+            since (float): Earliest verification time, as a Unix timestamp.
+            until (float): Latest verification time, as a Unix timestamp.
+            is_authentic (bool): Only authentic, or only forged, verdicts.
+            limit (int): Records per page.
+            cursor (int): next_cursor of the previous page.
+
+        Returns:
+            dict: 'items', summaries without the full result, and 'next_cursor',
+                None on the last page.
+        """
+        conditions, params = [], []
+        for column, value in (('document_id', document_id), ('issue_date', issue_date), ('digest', digest)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        if since is not None:
+            conditions.append("verified_at >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("verified_at <= ?")
+            params.append(until)
+        if is_authentic is not None:
+            conditions.append("is_authentic = ?")
+            params.append(int(is_authentic))
+        if cursor is not None:
+            # Ids grow with time, so the cursor is the last id of the previous page
+            conditions.append("id < ?")
+            params.append(cursor)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        with self._connect() as conn:
+            rows = conn.execute(f"SELECT {', '.join(SUMMARY_COLUMNS)} FROM verifications {where} "
+                                "ORDER BY id DESC LIMIT ?", params + [limit + 1]).fetchall()
+        items = [self._summary(row) for row in rows[:limit]]
+        return {
+            'items': items,
+            'next_cursor': items[-1]['id'] if len(rows) > limit else None,
+        }
+
+    def get(self, record_id):
+        """
+        Return one recorded verification with its full result, or None.
+
+        Args:
+            record_id (int): The record's id.
+        """
+        with self._connect() as conn:
+            row = conn.execute(f"SELECT {', '.join(SUMMARY_COLUMNS)}, result FROM verifications WHERE id = ?",
+                               (record_id,)).fetchone()
+        if row is None:
+            return None
+        record = self._summary(row[:-1])
+        record['result'] = json.loads(row[-1])
+        return record
+
+    @staticmethod
+    def _summary(row):
+        record = dict(zip(SUMMARY_COLUMNS, row))
+        record['is_authentic'] = bool(record['is_authentic'])
+        record['partial'] = bool(record['partial'])
+        record['metadata'] = json.loads(record['metadata'])
+        return record
+
+    def count(self):
+        """Return the number of recorded verifications."""
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM verifications").fetchone()[0]
@@ -0,0 +1,160 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """Collects concurrent single-image predictions into batched forward passes."""
+
+    def __init__(self, predict_fn, max_batch_size=16, max_wait_ms=5.0, name="micro-batcher"):
+        """
+        Initialize the micro-batcher and start its scheduler thread.
+
+        Args:
+            predict_fn (callable): Function taking a (N, H, W, C) array and returning
+                an array of N predictions.
+            max_batch_size (int): Largest number of inputs run in one forward pass.
+            max_wait_ms (float): How long the first queued input waits for others
+                to join its batch before the batch is dispatched.
+            name (str): Name of the scheduler thread.
+        """
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self.predict_fn = predict_fn
+        self.max_batch_size = int(max_batch_size)
+        self.max_wait = max(float(max_wait_ms), 0.0) / 1000.0
+        self._queue = queue.Queue()
+        # Reused for every batch; only the scheduler thread touches it
+        self._buffer = None
+        # A whole batch that arrived while singles were being gathered; runs next
+        self._held = None
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, sample):
+        """
+        Queue a single input for prediction.
+
+        The sample is read when its batch is assembled, so the caller must not
+        modify it before the future resolves.
+
+        Args:
+            sample (np.ndarray): One model input without the batch axis.
+
+        Returns:
+            concurrent.futures.Future: Resolves to the prediction row for this input.
+        """
+        if self._closed.is_set():
+            raise RuntimeError("MicroBatcher is closed")
+        future = Future()
+        self._queue.put((sample, future, False))
+        return future
+
+    def submit_batch(self, batch):
+        """
+        Queue an already stacked batch to run as one forward pass of its own.
+
+        The batch goes to the model as it is, without being copied, and isn't
+        split or merged with other inputs, so it may be larger than max_batch_size.
+        As with submit(), the caller must not modify it before the future resolves.
+
+        Args:
+            batch (np.ndarray): Model inputs with the batch axis, e.g. (N, 224, 224, 3).
+
+        Returns:
+            concurrent.futures.Future: Resolves to the N predictions.
+        """
+        if self._closed.is_set():
+            raise RuntimeError("MicroBatcher is closed")
+        future = Future()
+        self._queue.put((batch, future, True))
+        return future
+
+    def predict(self, sample, timeout=None):
+        """Submit a single input and block until its prediction is available."""
+        return self.submit(sample).result(timeout=timeout)
+
+    def pending(self):
+        """Return the approximate number of inputs waiting to be batched."""
+        return self._queue.qsize()
+
+    def close(self, timeout=None):
+        """Stop the scheduler thread after the queued inputs have been served."""
+        self._closed.set()
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _collect(self):
+        """Block for the first input, then gather more until the batch is full or the wait expires."""
+        if self._held is not None:
+            first, self._held = self._held, None
+        else:
+            first = self._queue.get()
+        if first is None or first[2]:
+            return first
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # Re-queue the sentinel so the loop exits after this batch
+                self._queue.put(None)
+                break
+            if item[2]:
+                # Stacked batches run on their own, after this one
+                self._held = item
+                break
+            batch.append(item)
+        return batch
+
+    def _stack(self, samples):
+        """Copy the samples into the reusable batch buffer and return the filled rows."""
+        first = samples[0]
+        if self._buffer is None or self._buffer.shape[1:] != first.shape or self._buffer.dtype != first.dtype:
+            self._buffer = np.empty((self.max_batch_size,) + first.shape, dtype=first.dtype)
+        return np.stack(samples, out=self._buffer[:len(samples)])
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            if isinstance(batch, tuple):
+                self._run_stacked(*batch[:2])
+                continue
+            # Drop inputs whose callers cancelled while they were queued
+            live = [(sample, future) for sample, future, _ in batch if future.set_running_or_notify_cancel()]
+            if not live:
+                continue
+            samples = [sample for sample, _ in live]
+            futures = [future for _, future in live]
+            try:
+                predictions = self.predict_fn(self._stack(samples))
+            except Exception as e:
+                logger.error(f"Batched prediction failed for {len(samples)} inputs: {str(e)}")
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            for future, prediction in zip(futures, predictions):
+                future.set_result(prediction)
+
+    def _run_stacked(self, batch, future):
+        """Run a batch queued by submit_batch() as one forward pass."""
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(self.predict_fn(batch))
+        except Exception as e:
+            logger.error(f"Batched prediction failed for {len(batch)} inputs: {str(e)}")
+            future.set_exception(e)
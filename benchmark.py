@@ -0,0 +1,419 @@
+"""
+Benchmark harness for the document verification pipeline.
+
+Generates synthetic document images offline and times each pipeline stage
+(decode, preprocess, predict, OCR, metadata extraction, response encoding),
+the full DocumentAuthenticityDetector.verify_document call, and the /verify
+route through the Flask test client. --metadata-scaling instead times metadata
+extraction against the number of configured fields, and --preprocessing compares
+the fused model-input preprocessing with the old resize-and-divide path.
+
+Usage:
+    python benchmark.py --iterations 50 --width 2480 --height 3508 --save baseline.json
+    python benchmark.py --compare baseline.json
+    python benchmark.py --metadata-scaling
+    python benchmark.py --preprocessing --width 2480 --height 3508
+"""
+import argparse
+import base64
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import cv2
+import numpy as np
+
+WORDS = ["PASSPORT", "REPUBLIC", "NAME", "SURNAME", "NATIONALITY", "DATE", "OF", "BIRTH",
+         "ISSUED", "EXPIRES", "AUTHORITY", "SIGNATURE", "HOLDER", "PLACE", "SEX", "DOCUMENT"]
+
+
+def make_document(width, height, text_lines, seed=0, image_format='.png', quality=90):
+    """
+    Render a synthetic document image.
+
+    Args:
+        width (int): Image width in pixels.
+        height (int): Image height in pixels.
+        text_lines (int): Number of text lines; controls text density.
+        seed (int): Random seed, so each variant has different content.
+        image_format (str): Encoding extension, e.g. '.png' or '.jpg'.
+        quality (int): JPEG quality when encoding as JPEG.
+
+    Returns:
+        bytes: The encoded image.
+    """
+    rng = random.Random(seed)
+    image = np.full((height, width, 3), 245, dtype=np.uint8)
+
+    # A photo box, then paper/scanner texture over the whole page, like a typical ID scan
+    cv2.rectangle(image, (width // 20, height // 10), (width // 4, height // 3), (120, 110, 100), -1)
+    noise = np.random.default_rng(seed).integers(0, 12, size=(height, width, 1), dtype=np.uint8)
+    image -= noise
+
+    scale = max(width, height) / 1200.0
+    line_height = max(int(height * 0.8 / max(text_lines, 1)), 12)
+    x = width // 3
+    y = height // 10
+    for line in range(text_lines):
+        if line == 0:
+            text = f"DOCUMENT NO {rng.randrange(10**7, 10**8)}{rng.choice('ABCDEFGH')}"
+        elif line == 1:
+            text = f"DATE OF ISSUE {rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/{rng.randint(2000, 2030)}"
+        else:
+            text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 6)))
+        cv2.putText(image, text, (x, y), cv2.FONT_HERSHEY_SIMPLEX, 0.6 * scale, (20, 20, 20),
+                    max(int(scale), 1), cv2.LINE_AA)
+        y += line_height
+        if y >= height:
+            break
+
+    params = [cv2.IMWRITE_JPEG_QUALITY, quality] if image_format in ('.jpg', '.jpeg') else []
+    ok, encoded = cv2.imencode(image_format, image, params)
+    if not ok:
+        raise ValueError(f"Could not encode synthetic document as {image_format}")
+    return encoded.tobytes()
+
+
+def summarize(samples, wall_seconds=None):
+    """
+    Summarize a list of durations.
+
+    Args:
+        samples (list): Durations in seconds.
+        wall_seconds (float): Wall-clock time for the samples when run concurrently;
+            defaults to their sum.
+
+    Returns:
+        dict: Count, mean, p50/p95/p99 in milliseconds and throughput per second.
+    """
+    if not samples:
+        return None
+    ms = np.asarray(samples) * 1000.0
+    wall = wall_seconds if wall_seconds is not None else float(np.sum(samples))
+    return {
+        'count': len(samples),
+        'mean_ms': round(float(ms.mean()), 3),
+        'p50_ms': round(float(np.percentile(ms, 50)), 3),
+        'p95_ms': round(float(np.percentile(ms, 95)), 3),
+        'p99_ms': round(float(np.percentile(ms, 99)), 3),
+        'throughput_per_s': round(len(samples) / wall, 3) if wall > 0 else None,
+    }
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    value = fn(*args)
+    return value, time.perf_counter() - start
+
+
+def bench_stages(detector, documents, iterations):
+    """Time each pipeline stage in isolation on the calling thread."""
+    stages = {name: [] for name in ('decode', 'preprocess', 'predict', 'ocr', 'metadata', 'forensics', 'encode')}
+    ocr_error = None
+
+    for i in range(iterations):
+        data = documents[i % len(documents)]
+        image, elapsed = timed(detector._load_image, data)
+        stages['decode'].append(elapsed)
+
+        processed, elapsed = timed(detector._preprocess, image)
+        stages['preprocess'].append(elapsed)
+
+        if detector.model is not None:
+            _, elapsed = timed(detector._predict_batch, np.expand_dims(processed, axis=0))
+            stages['predict'].append(elapsed)
+
+        text = ""
+        if ocr_error is None:
+            try:
+                text, elapsed = timed(detector._run_ocr, image)
+                stages['ocr'].append(elapsed)
+            except Exception as e:
+                ocr_error = str(e)
+
+        _, elapsed = timed(detector._extract_metadata, text)
+        stages['metadata'].append(elapsed)
+
+        _, elapsed = timed(detector._analyze_forensics, image)
+        stages['forensics'].append(elapsed)
+
+        response = {'result': {'text_extraction': {'extracted_text': text}}}
+        _, elapsed = timed(lambda: json.dumps({**response, 'image': base64.b64encode(
+            detector._make_preview(image)).decode('utf-8')}))
+        stages['encode'].append(elapsed)
+
+    results = {name: summarize(samples) for name, samples in stages.items()}
+    if ocr_error is not None:
+        results['ocr'] = {'error': ocr_error}
+    if detector.model is None:
+        results['predict'] = {'error': 'no model loaded'}
+    return results
+
+
+def bench_concurrent(fn, documents, iterations, concurrency):
+    """Run fn over the documents from a thread pool and summarize per-call latency."""
+    def run(i):
+        _, elapsed = timed(fn, documents[i % len(documents)])
+        return elapsed
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        samples = list(pool.map(run, range(iterations)))
+    return summarize(samples, wall_seconds=time.perf_counter() - start)
+
+
+def bench_http(client, documents, iterations, concurrency):
+    def post(data):
+        response = client.post('/verify', data={'document': (BytesIO(data), 'benchmark.png')},
+                               content_type='multipart/form-data')
+        if response.status_code != 200:
+            raise RuntimeError(f"/verify returned {response.status_code}: {response.get_data(as_text=True)}")
+        return response
+
+    return bench_concurrent(post, documents, iterations, concurrency)
+
+
+def bench_metadata_scaling(iterations, field_counts=(1, 2, 4, 8, 16, 32, 64), text_lines=400):
+    """
+    Time single-pass metadata extraction against one regex search per field.
+
+    Every field's label sits at the end of the text, the worst case for both.
+
+    Returns:
+        dict: {field_count: {'single_pass': stats, 'per_field': stats}}
+    """
+    from metadata_extractor import FieldExtractor, MetadataExtractor
+
+    rng = random.Random(0)
+    body = "\n".join(" ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 8))) for _ in range(text_lines))
+    results = {}
+    for count in field_counts:
+        extractors = [FieldExtractor(f'field_{i}', rf'(?i:label{i})[\s:]*(?P<value>\d+)') for i in range(count)]
+        engine = MetadataExtractor(extractors)
+        text = body + "\n" + "\n".join(f"LABEL{i}: {i}" for i in range(count))
+        if len(engine.extract(text)) != count:
+            raise RuntimeError(f"Metadata extraction missed fields with {count} extractors")
+
+        single, per_field = [], []
+        for _ in range(iterations):
+            _, elapsed = timed(engine.extract, text)
+            single.append(elapsed)
+            _, elapsed = timed(lambda: [e.regex.search(text) for e in extractors])
+            per_field.append(elapsed)
+        results[count] = {'single_pass': summarize(single), 'per_field': summarize(per_field)}
+    return results
+
+
+def print_metadata_scaling(results):
+    print(f"{'fields':>7}{'single p50 ms':>16}{'per-field p50 ms':>19}{'single us/field':>18}")
+    for count, stats in results.items():
+        single = stats['single_pass']['p50_ms']
+        print(f"{count:>7}{single:>16.3f}{stats['per_field']['p50_ms']:>19.3f}{single * 1000 / count:>18.1f}")
+
+
+def bench_preprocessing(iterations, width, height, batch_size=16):
+    """
+    Compare fused preprocessing with the old resize-and-divide path.
+
+    Both paths turn one decoded document into a float32 batch of batch_size as the
+    model receives it: the old one divides by 255.0 into float64, stacks and casts;
+    the fused one writes each image into a thread buffer and copies it into a
+    reused batch buffer, as the detector and micro-batcher do.
+
+    Returns:
+        dict: {path: {'ms_per_image': stats, 'allocated_bytes_per_image': int}}
+    """
+    from preprocessing import Preprocessor
+
+    image = cv2.imdecode(np.frombuffer(make_document(width, height, 20), np.uint8), cv2.IMREAD_COLOR)
+    preprocessor = Preprocessor()
+    batch = np.empty((batch_size,) + preprocessor.shape, dtype=np.float32)
+
+    def old_path():
+        samples = [cv2.resize(image, preprocessor.size) / 255.0 for _ in range(batch_size)]
+        return np.stack(samples).astype(np.float32)
+
+    def fused_path():
+        sample = preprocessor.thread_buffer()
+        for row in range(batch_size):
+            preprocessor(image, out=sample)
+            batch[row] = sample
+        return batch
+
+    if not np.allclose(old_path(), fused_path(), atol=1e-6):
+        raise RuntimeError("Fused preprocessing doesn't match the old path")
+
+    results = {}
+    for name, fn in (('old', old_path), ('fused', fused_path)):
+        samples = []
+        for _ in range(iterations):
+            _, elapsed = timed(fn)
+            samples.append(elapsed / batch_size)
+        # Peak traced memory above the baseline while building one batch
+        tracemalloc.start()
+        fn()
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        fn()
+        allocated = tracemalloc.get_traced_memory()[1] - baseline
+        tracemalloc.stop()
+        results[name] = {'ms_per_image': summarize(samples), 'allocated_bytes_per_image': allocated // batch_size}
+    return results
+
+
+def print_preprocessing(results):
+    print(f"{'path':<8}{'p50 ms/image':>15}{'p99 ms/image':>15}{'allocated KiB/image':>22}")
+    for name, stats in results.items():
+        print(f"{name:<8}{stats['ms_per_image']['p50_ms']:>15.3f}{stats['ms_per_image']['p99_ms']:>15.3f}"
+              f"{stats['allocated_bytes_per_image'] / 1024:>22.1f}")
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current, baseline):
+    """Print per-stage latency changes relative to a saved baseline."""
+    print(f"\nComparison against baseline {baseline['meta'].get('revision')}:")
+    print(f"{'stage':<14}{'p50 base':>12}{'p50 now':>12}{'change':>10}{'p99 base':>12}{'p99 now':>12}{'change':>10}")
+    for name, stats in current['stages'].items():
+        base = baseline['stages'].get(name)
+        if not stats or not base or 'p50_ms' not in stats or 'p50_ms' not in base:
+            continue
+        row = f"{name:<14}"
+        for key in ('p50_ms', 'p99_ms'):
+            change = (stats[key] - base[key]) / base[key] * 100 if base[key] else 0.0
+            row += f"{base[key]:>12.2f}{stats[key]:>12.2f}{change:>+9.1f}%"
+        print(row)
+
+
+def print_report(report):
+    print(f"{'stage':<14}{'count':>7}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'per s':>10}")
+    for name, stats in report['stages'].items():
+        if not stats or 'error' in stats:
+            print(f"{name:<14}  skipped: {stats['error'] if stats else 'no samples'}")
+            continue
+        print(f"{name:<14}{stats['count']:>7}{stats['mean_ms']:>10.2f}{stats['p50_ms']:>10.2f}"
+              f"{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}{stats['throughput_per_s']:>10.1f}")
+
+
+def run_pipeline_benchmark(args, app, detector, model_path):
+    """Time the stages, verify_document and the /verify route; returns the report."""
+    documents = [make_document(args.width, args.height, args.text_lines, seed=i, image_format=args.format)
+                 for i in range(args.variants)]
+
+    for i in range(args.warmup):
+        detector.verify_document(documents[i % len(documents)])
+
+    stages = bench_stages(detector, documents, args.iterations)
+    stages['verify_document'] = bench_concurrent(detector.verify_document, documents,
+                                                 args.iterations, args.concurrency)
+    if not args.skip_http:
+        stages['http_verify'] = bench_http(app.test_client(), documents,
+                                           args.iterations, args.concurrency)
+
+    report = {
+        'meta': {
+            'revision': git_revision(),
+            'timestamp': time.time(),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'cpu_count': os.cpu_count(),
+            'model_path': model_path,
+            'model_loaded': detector.model is not None,
+            'params': {key: value for key, value in vars(args).items() if key not in ('save', 'compare')},
+            'document_bytes': int(np.mean([len(d) for d in documents])),
+        },
+        'stages': stages,
+    }
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the document verification pipeline")
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--warmup', type=int, default=2, help="untimed end-to-end runs before measuring")
+    parser.add_argument('--width', type=int, default=1654, help="synthetic document width (1654 = A4 at 200 DPI)")
+    parser.add_argument('--height', type=int, default=2339)
+    parser.add_argument('--text-lines', type=int, default=20, help="lines of text per document")
+    parser.add_argument('--variants', type=int, default=8, help="distinct synthetic documents to cycle through")
+    parser.add_argument('--format', default='.png', choices=['.png', '.jpg'])
+    parser.add_argument('--concurrency', type=int, default=1, help="client threads for end-to-end runs")
+    parser.add_argument('--ocr-profile', default=None, help="OCR profile (default: the app's OCR_PROFILE)")
+    parser.add_argument('--model', default=None, help="model path (default: the app's MODEL_PATH)")
+    parser.add_argument('--skip-http', action='store_true', help="don't benchmark through the Flask test client")
+    parser.add_argument('--with-cache', action='store_true', help="leave the result cache enabled")
+    parser.add_argument('--metadata-scaling', action='store_true',
+                        help="only benchmark metadata extraction against the number of fields")
+    parser.add_argument('--preprocessing', action='store_true',
+                        help="only compare fused preprocessing with the old resize-and-divide path")
+    parser.add_argument('--save', help="write the report as JSON to this path")
+    parser.add_argument('--compare', help="compare against a JSON report saved earlier")
+    args = parser.parse_args(argv)
+
+    if args.metadata_scaling:
+        results = bench_metadata_scaling(args.iterations)
+        print_metadata_scaling(results)
+        if args.save:
+            with open(args.save, 'w', encoding='utf-8') as f:
+                json.dump({'meta': {'revision': git_revision()}, 'metadata_scaling': results}, f, indent=2)
+        return
+    if args.preprocessing:
+        results = bench_preprocessing(args.iterations, args.width, args.height)
+        print_preprocessing(results)
+        if args.save:
+            with open(args.save, 'w', encoding='utf-8') as f:
+                json.dump({'meta': {'revision': git_revision()}, 'preprocessing': results}, f, indent=2)
+        return
+
+    logging.getLogger().setLevel(logging.WARNING)
+    import document_verification_app as app_module
+    logging.getLogger().setLevel(logging.WARNING)
+
+    # The app's configured pipeline, except that the stores it writes to live in a
+    # scratch directory and no batch job workers are started
+    config = app_module.app.config
+    model_path = args.model or config['MODEL_PATH']
+    scratch_dir = tempfile.mkdtemp(prefix='benchmark-')
+    config.update(MODEL_PATH=model_path,
+                  MODEL_BACKGROUND_LOAD=False,
+                  MODEL_WATCH_SECONDS=None,
+                  OCR_PROFILE=args.ocr_profile or config['OCR_PROFILE'],
+                  CACHE_MAX_ENTRIES=config['CACHE_MAX_ENTRIES'] if args.with_cache else 0,
+                  JOB_DB_PATH=None)
+    for key, name in (('CACHE_DIR', 'cache'), ('AUDIT_DB_PATH', 'audit.sqlite3'),
+                      ('DUPLICATE_INDEX_PATH', 'duplicates.sqlite3'), ('PROFILE_DIR', 'profiles')):
+        if config[key]:
+            config[key] = os.path.join(scratch_dir, name)
+    try:
+        report = run_pipeline_benchmark(args, app_module.create_app(), app_module.detector, model_path)
+    finally:
+        if app_module.detector is not None and app_module.detector.audit is not None:
+            app_module.detector.audit.flush(10)
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+    print_report(report)
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            compare(report, json.load(f))
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nSaved report to {args.save}")
+
+
+if __name__ == '__main__':
+    main()
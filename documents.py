@@ -0,0 +1,117 @@
+"""
+Page iteration for multi-page documents.
+
+PDFs are rasterized one page at a time with pypdfium2 and multi-frame TIFFs are
+read frame by frame with Pillow, so only the page being processed is held in
+memory whatever the page count.
+"""
+import logging
+import os
+from io import BytesIO
+
+import cv2
+import numpy as np
+
+from upload_stream import SNIFF_LIMIT, UploadRejected, sniff_image_header
+
+logger = logging.getLogger(__name__)
+
+# Formats that may hold more than one page
+MULTIPAGE_FORMATS = ('pdf', 'tiff')
+
+# PDF user space is measured in points
+POINTS_PER_INCH = 72.0
+
+
+def document_format(source):
+    """
+    Identify the format of an encoded document from its leading bytes.
+
+    Args:
+        source (str | bytes-like): Path to the document or its encoded bytes.
+
+    Returns:
+        str: The format name, e.g. 'png', 'jpeg', 'tiff' or 'pdf'.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            head = f.read(SNIFF_LIMIT)
+    else:
+        head = source[:SNIFF_LIMIT]
+    return sniff_image_header(head, final=True).format
+
+
+def iter_pages(source, fmt, dpi=300, max_pixels=None, max_pages=None):
+    """
+    Yield the pages of a multi-page document as decoded images, one at a time.
+
+    Args:
+        source (str | bytes-like): Path to the document or its encoded bytes.
+        fmt (str): 'pdf' or 'tiff', as returned by document_format().
+        dpi (int): Resolution PDF pages are rendered at.
+        max_pixels (int): Largest accepted width * height of a page.
+        max_pages (int): Largest accepted number of pages.
+
+    Yields:
+        np.ndarray: Each page as a BGR image.
+
+    Raises:
+        UploadRejected: If the document has too many pages or a page has too many pixels.
+    """
+    if fmt == 'pdf':
+        pages = _iter_pdf_pages(source, dpi, max_pixels, max_pages)
+    elif fmt == 'tiff':
+        pages = _iter_tiff_frames(source, max_pixels, max_pages)
+    else:
+        raise ValueError(f"'{fmt}' documents have a single page")
+    yield from pages
+
+
+def _check_page(index, width, height, page_count, max_pixels, max_pages):
+    if max_pages and page_count > max_pages:
+        raise UploadRejected(f"Document has {page_count} pages, which exceeds the limit of {max_pages}",
+                             status_code=413)
+    if max_pixels and width * height > max_pixels:
+        raise UploadRejected(f"Page {index + 1} is {width}x{height}, which exceeds the limit of "
+                             f"{max_pixels} pixels", status_code=413)
+
+
+def _iter_pdf_pages(source, dpi, max_pixels, max_pages):
+    # Deferred so the app doesn't need pypdfium2 unless PDFs are submitted
+    import pypdfium2 as pdfium
+
+    data = source if isinstance(source, (str, os.PathLike)) else bytes(source)
+    pdf = pdfium.PdfDocument(data)
+    try:
+        scale = dpi / POINTS_PER_INCH
+        for index in range(len(pdf)):
+            page = pdf[index]
+            try:
+                width, height = page.get_size()
+                _check_page(index, int(width * scale), int(height * scale), len(pdf), max_pixels, max_pages)
+                bitmap = page.render(scale=scale)
+                image = bitmap.to_numpy()
+                # pdfium renders BGR(A), OpenCV's channel order
+                if image.ndim == 3 and image.shape[2] == 4:
+                    image = cv2.cvtColor(image, cv2.COLOR_BGRA2BGR)
+                elif image.ndim == 2:
+                    image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+                else:
+                    image = np.ascontiguousarray(image)
+                bitmap.close()
+            finally:
+                page.close()
+            yield image
+    finally:
+        pdf.close()
+
+
+def _iter_tiff_frames(source, max_pixels, max_pages):
+    from PIL import Image, ImageSequence
+
+    with Image.open(source if isinstance(source, (str, os.PathLike)) else BytesIO(source)) as tiff:
+        page_count = getattr(tiff, 'n_frames', 1)
+        # Frames are decoded on seek, so only the current one is in memory
+        for index, frame in enumerate(ImageSequence.Iterator(tiff)):
+            _check_page(index, frame.width, frame.height, page_count, max_pixels, max_pages)
+            yield cv2.cvtColor(np.asarray(frame.convert('RGB')), cv2.COLOR_RGB2BGR)
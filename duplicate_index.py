@@ -0,0 +1,266 @@
+"""
+Persistent near-duplicate index of verified documents.
+
+Every verified page is reduced to a 256-bit perceptual hash (the signs of the
+16x16 lowest-frequency DCT coefficients of a 64x64 thumbnail) and, when the
+model provides one, its penultimate-layer embedding. Both are kept in a SQLite
+database so the index survives restarts and is shared by every worker process.
+Re-encoded or rescaled copies land within a few bits of the original, while
+documents that only share a layout are usually dozens of bits apart.
+
+Lookups use multi-index hashing rather than a scan. The hash is split into
+sixteen 16-bit bands, each stored as a key in an indexed table. Two hashes
+within Hamming distance d differ in at most d // 16 bits in at least one band,
+so a query only reads the rows whose band matches one of the few keys within
+that radius of its own, then measures the exact distance on those candidates.
+The cost grows with the number of near neighbours, not with the size of the
+index, so a lookup takes milliseconds against millions of documents.
+
+An embedding is only compared with embeddings from the same model version;
+across versions, and for backends that don't expose one, the hash decides alone.
+"""
+import logging
+import os
+import sqlite3
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from itertools import combinations
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_SIDE = 64
+HASH_SIDE = 16
+HASH_BITS = HASH_SIDE * HASH_SIDE
+BAND_BITS = 16
+BANDS = HASH_BITS // BAND_BITS
+BAND_MASK = (1 << BAND_BITS) - 1
+
+# Below this spread of grey levels a thumbnail is blank or nearly so, and its hash is noise
+MIN_THUMBNAIL_STD = 2.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    digest TEXT NOT NULL,
+    page INTEGER NOT NULL,
+    phash BLOB NOT NULL,
+    model TEXT,
+    embedding BLOB,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS documents_digest ON documents (digest, page);
+-- One row per band of each hash: (band << 16 | band value, document)
+CREATE TABLE IF NOT EXISTS band_keys (
+    key INTEGER NOT NULL,
+    document_id INTEGER NOT NULL,
+    PRIMARY KEY (key, document_id)
+) WITHOUT ROWID;
+"""
+
+NearDuplicate = namedtuple('NearDuplicate', ['document_id', 'digest', 'page', 'distance', 'similarity',
+                                             'created_at'])
+
+
+def perceptual_hash(image):
+    """
+    Compute the 256-bit DCT perceptual hash of an image.
+
+    Args:
+        image (np.ndarray): Decoded BGR or greyscale image.
+
+    Returns:
+        int: The hash as an unsigned integer, or None if the image is too uniform
+            (e.g. a blank page) for its hash to mean anything.
+    """
+    # Averaging by a whole factor first is several times faster than one fractional INTER_AREA on a large scan
+    factor = min(image.shape[:2]) // THUMBNAIL_SIDE
+    if factor > 1:
+        height, width = image.shape[:2]
+        image = cv2.resize(image[:height - height % factor, :width - width % factor], None,
+                           fx=1 / factor, fy=1 / factor, interpolation=cv2.INTER_AREA)
+    thumbnail = cv2.resize(image, (THUMBNAIL_SIDE, THUMBNAIL_SIDE), interpolation=cv2.INTER_AREA)
+    if thumbnail.ndim == 3:
+        thumbnail = cv2.cvtColor(thumbnail, cv2.COLOR_BGR2GRAY)
+    thumbnail = thumbnail.astype(np.float32)
+    if thumbnail.std() < MIN_THUMBNAIL_STD:
+        return None
+    low = cv2.dct(thumbnail)[:HASH_SIDE, :HASH_SIDE].ravel()
+    # The DC term is the mean brightness; leaving it out of the median keeps the split balanced
+    bits = low > np.median(low[1:])
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def _band_keys(value):
+    """The (band, band value) keys of a hash, packed into one integer each."""
+    return [(band << BAND_BITS) | ((value >> (BAND_BITS * band)) & BAND_MASK) for band in range(BANDS)]
+
+
+def _unit_vector(embedding):
+    """Flatten and L2-normalize an embedding so a dot product is its cosine similarity."""
+    if embedding is None:
+        return None
+    embedding = np.asarray(embedding, dtype=np.float32).ravel()
+    norm = np.linalg.norm(embedding)
+    return embedding / norm if norm > 0 else None
+
+
+def _band_masks(radius):
+    """Every BAND_BITS-bit mask with at most radius bits set."""
+    masks = [0]
+    for bits in range(1, radius + 1):
+        for positions in combinations(range(BAND_BITS), bits):
+            masks.append(sum(1 << position for position in positions))
+    return masks
+
+
+class DuplicateIndex:
+    """Finds and records near-duplicate documents across all earlier verifications."""
+
+    def __init__(self, db_path, max_distance=15, min_similarity=0.95, max_results=5):
+        """
+        Open (or create) the index.
+
+        Args:
+            db_path (str): SQLite database file.
+            max_distance (int): Largest Hamming distance, out of 256, between the
+                hashes of near-duplicates. Up to 15, a lookup reads one key per band;
+                each further 16 multiplies the keys read (17x at 16-31).
+            min_similarity (float): Smallest cosine similarity between the
+                embeddings of near-duplicates, when both were made by the same model.
+            max_results (int): Closest matches reported per lookup.
+        """
+        if not 0 <= max_distance < HASH_BITS:
+            raise ValueError(f"max_distance must be between 0 and {HASH_BITS - 1}")
+        self.db_path = db_path
+        self.max_distance = max_distance
+        self.min_similarity = min_similarity
+        self.max_results = max_results
+        # Pigeonhole: some band of a match is within this many bits of the query's
+        self._masks = _band_masks(max_distance // BANDS)
+
+        db_dir = os.path.dirname(os.path.abspath(db_path))
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        """Open a connection that commits on success and is always closed."""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        # With WAL, a crash can lose the last few entries but never corrupt the index
+        conn.execute("PRAGMA synchronous=NORMAL")
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _candidates(self, conn, phash):
+        """Yield (id, phash) for every document with a band within the band radius of phash's."""
+        seen = set()
+        for key in _band_keys(phash):
+            keys = [key ^ mask for mask in self._masks]
+            placeholders = ','.join('?' * len(keys))
+            for row_id, other in conn.execute(
+                    "SELECT d.id, d.phash FROM band_keys k JOIN documents d ON d.id = k.document_id "
+                    f"WHERE k.key IN ({placeholders})", keys):
+                if row_id not in seen:
+                    seen.add(row_id)
+                    yield row_id, int.from_bytes(other, 'big')
+
+    def search(self, phash, embedding=None, model=None, exclude_digest=None, conn=None):
+        """
+        Find earlier documents that look like this one.
+
+        Args:
+            phash (int): perceptual_hash() of the document.
+            embedding (np.ndarray): Optional penultimate-layer embedding.
+            model (str): Fingerprint of the model that made the embedding.
+            exclude_digest (str): Content hash of the document itself; its own
+                earlier entries (re-verifications) aren't duplicates.
+            conn (sqlite3.Connection): Connection to reuse.
+
+        Returns:
+            list: NearDuplicate tuples, closest first.
+        """
+        if conn is None:
+            with self._connect() as conn:
+                return self.search(phash, embedding, model, exclude_digest, conn)
+
+        close = []
+        for row_id, other in self._candidates(conn, phash):
+            distance = (other ^ phash).bit_count()
+            if distance <= self.max_distance:
+                close.append((distance, row_id))
+        if not close:
+            return []
+
+        # Only the nearest few can be reported, even after some fail the embedding check
+        close = sorted(close)[:self.max_results * 20]
+        embedding = _unit_vector(embedding)
+        placeholders = ','.join('?' * len(close))
+        rows = {row[0]: row for row in conn.execute(
+            f"SELECT id, digest, page, model, embedding, created_at FROM documents WHERE id IN ({placeholders})",
+            [row_id for _, row_id in close])}
+
+        matches = []
+        for distance, row_id in close:
+            _, digest, page, other_model, other_embedding, created_at = rows[row_id]
+            if digest == exclude_digest:
+                continue
+            similarity = None
+            if embedding is not None and other_embedding is not None and other_model == model:
+                other_embedding = np.frombuffer(other_embedding, dtype=np.float16).astype(np.float32)
+                if other_embedding.shape == embedding.shape:
+                    similarity = float(np.dot(embedding, other_embedding))
+                    if similarity < self.min_similarity:
+                        continue
+            matches.append(NearDuplicate(row_id, digest, page, distance, similarity, created_at))
+            if len(matches) >= self.max_results:
+                break
+        return matches
+
+    def check(self, phash, digest, page=1, embedding=None, model=None):
+        """
+        Look a document up and add it to the index.
+
+        A document already indexed under the same content hash and page isn't
+        added again, so re-verifying it neither grows the index nor matches itself.
+
+        Args:
+            phash (int): perceptual_hash() of the document.
+            digest (str): Content hash of the uploaded file.
+            page (int): Page number within the file.
+            embedding (np.ndarray): Optional penultimate-layer embedding.
+            model (str): Fingerprint of the model that made the embedding.
+
+        Returns:
+            list: NearDuplicate tuples for earlier documents, closest first.
+        """
+        embedding = _unit_vector(embedding)
+        with self._connect() as conn:
+            matches = self.search(phash, embedding, model, exclude_digest=digest, conn=conn)
+            known = conn.execute("SELECT 1 FROM documents WHERE digest = ? AND page = ?",
+                                 (digest, page)).fetchone()
+            if known is None:
+                row_id = conn.execute(
+                    "INSERT INTO documents (digest, page, phash, model, embedding, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (digest, page, sqlite3.Binary(phash.to_bytes(HASH_BITS // 8, 'big')),
+                     model if embedding is not None else None,
+                     sqlite3.Binary(embedding.astype(np.float16).tobytes()) if embedding is not None else None,
+                     time.time())).lastrowid
+                conn.executemany("INSERT INTO band_keys (key, document_id) VALUES (?, ?)",
+                                 [(key, row_id) for key in _band_keys(phash)])
+        return matches
+
+    def count(self):
+        """Return the number of indexed pages."""
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
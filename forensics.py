@@ -0,0 +1,324 @@
+"""
+Classical image-forensics checks on decoded document images.
+
+Three checks complement the CNN score:
+    ela        - error-level analysis: regions that recompress differently from
+                 the rest of the page, as pasted-in content often does
+    noise      - local noise variance: regions whose sensor/scan noise doesn't
+                 match the rest of the page
+    copy_move  - block hashing: areas duplicated elsewhere on the same page
+
+Every check works on a copy downscaled to a fixed working size, using whole-array
+NumPy/OpenCV operations, so its cost is bounded whatever the upload resolution.
+
+Each check also has a time budget, which is met by sizing the work up front
+rather than by abandoning it halfway. The analyzer keeps a moving average of
+what each check costs per megapixel and, when the working copy would take
+longer than the budget, runs the check on a smaller copy that fits. A check
+that wouldn't fit even at min_side is skipped before it starts, and the caller
+reports it as skipped. Each skip halves the check's cost estimate, so a burst
+of contention can't switch a check off for good.
+"""
+import math
+import threading
+import time
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+# category is 'security' (signs of editing) or 'consistency' (parts of the page disagree)
+Finding = namedtuple('Finding', ['check', 'category', 'message'])
+
+CHECKS = ('ela', 'noise', 'copy_move')
+
+# Per-check time budgets in milliseconds
+DEFAULT_BUDGETS_MS = {'ela': 150, 'noise': 100, 'copy_move': 250}
+
+
+class BudgetExceeded(Exception):
+    """Raised, before any work is done, when a check can't fit its time budget."""
+
+
+def _block_view(array, block):
+    """Crop to whole blocks and reshape to (rows, cols, block, block)."""
+    rows, cols = array.shape[0] // block, array.shape[1] // block
+    cropped = array[:rows * block, :cols * block]
+    return cropped.reshape(rows, block, cols, block).swapaxes(1, 2)
+
+
+def _robust_z(values, min_scale=0.5):
+    """Z-scores using the median and MAD, so outliers don't hide themselves."""
+    median = np.median(values)
+    mad = np.median(np.abs(values - median)) * 1.4826
+    # The floor stops noiseless (e.g. digitally generated) pages from turning rounding into outliers
+    return (values - median) / max(mad, min_scale)
+
+
+def _largest_region(mask, min_side=1):
+    """
+    Return (block count, bounding box) of the largest 8-connected region in a block mask
+    whose bounding box is at least min_side blocks wide and tall.
+    """
+    count, _, stats, _ = cv2.connectedComponentsWithStats(mask.astype(np.uint8), connectivity=8)
+    stats = stats[1:]
+    stats = stats[(stats[:, cv2.CC_STAT_WIDTH] >= min_side) & (stats[:, cv2.CC_STAT_HEIGHT] >= min_side)]
+    if not len(stats):
+        return 0, None
+    x, y, w, h, area = stats[int(np.argmax(stats[:, cv2.CC_STAT_AREA]))]
+    return int(area), (int(x), int(y), int(w), int(h))
+
+
+def _describe(box, grid_shape):
+    """Describe a block-grid bounding box as a position on the page."""
+    x, y, w, h = box
+    rows, cols = grid_shape
+    return (f"around x={100 * (x + w / 2) / cols:.0f}%, y={100 * (y + h / 2) / rows:.0f}% "
+            f"({100 * w / cols:.0f}% x {100 * h / rows:.0f}% of the page)")
+
+
+class ForensicsAnalyzer:
+    """Runs the forensic checks on a decoded document image."""
+
+    def __init__(self, checks=CHECKS, budgets_ms=None, max_side=1024, min_side=256, block=16,
+                 ela_quality=90, ela_z=6.0, noise_ratio=2.5, copy_move_min_pairs=400,
+                 min_region_blocks=6, energy_bins=8):
+        """
+        Args:
+            checks (tuple): Checks to run, from CHECKS.
+            budgets_ms (dict): Time budget per check; missing checks use DEFAULT_BUDGETS_MS.
+            max_side (int): Long side of the working copy the checks run on.
+            min_side (int): Smallest long side a check is shrunk to in order to fit its
+                budget; a check that wouldn't fit at this size is skipped.
+            block (int): Block size, in working-copy pixels, that statistics are computed over.
+            ela_quality (int): JPEG quality used to recompress for error-level analysis.
+            ela_z (float): Robust z-score above which a block's error level is anomalous.
+            noise_ratio (float): How many times above or below the page's median a block's
+                noise variance must be to count as inconsistent.
+            copy_move_min_pairs (int): Matching block pairs sharing one offset needed to
+                report a duplicated region.
+            min_region_blocks (int): Smallest connected group of anomalous blocks reported.
+            energy_bins (int): Edge-energy classes that error levels are compared within.
+        """
+        unknown = set(checks) - set(CHECKS)
+        if unknown:
+            raise ValueError(f"Unknown forensic checks {sorted(unknown)}, expected some of {CHECKS}")
+        self.checks = tuple(checks)
+        self.budgets_ms = dict(DEFAULT_BUDGETS_MS, **(budgets_ms or {}))
+        self.max_side = max_side
+        self.min_side = min_side
+        self.block = block
+        self.ela_quality = ela_quality
+        self.ela_z = ela_z
+        self.noise_ratio = noise_ratio
+        self.copy_move_min_pairs = copy_move_min_pairs
+        self.min_region_blocks = min_region_blocks
+        self.energy_bins = energy_bins
+        # Moving average of each check's cost in ms per megapixel; missing until measured
+        self.megapixel_ms = {}
+        self._lock = threading.Lock()
+
+    def working_copy(self, image):
+        """Downscale an image to the working size the checks run on."""
+        scale = self.max_side / max(image.shape[:2])
+        if scale < 1:
+            image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        if image.ndim == 2:
+            image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+        return image
+
+    def plan(self, name, image):
+        """
+        Choose the scale a check runs at to fit its time budget.
+
+        Args:
+            name (str): Check name, from CHECKS.
+            image (np.ndarray): Working copy from working_copy().
+
+        Returns:
+            float: Factor, at most 1, to shrink the working copy by; or None if the
+                check wouldn't fit its budget even at min_side.
+        """
+        with self._lock:
+            cost = self.megapixel_ms.get(name)
+        budget = self.budgets_ms.get(name)
+        if cost is None or not budget:
+            return 1.0
+        megapixels = image.shape[0] * image.shape[1] / 1e6
+        if cost * megapixels <= budget:
+            return 1.0
+        scale = math.sqrt(budget / (cost * megapixels))
+        if scale * max(image.shape[:2]) < min(self.min_side, max(image.shape[:2])):
+            return None
+        return scale
+
+    def record(self, name, seconds, pixels):
+        """
+        Update a check's cost estimate from one run.
+
+        Args:
+            name (str): Check name, from CHECKS.
+            seconds (float): Time the check took.
+            pixels (int): Pixels of the image it ran on.
+        """
+        cost = 1000 * seconds / max(pixels / 1e6, 1e-6)
+        with self._lock:
+            average = self.megapixel_ms.get(name)
+            self.megapixel_ms[name] = cost if average is None else 0.8 * average + 0.2 * cost
+
+    def run(self, name, image):
+        """
+        Run one check on a working copy, shrunk first if needed to fit its time budget.
+
+        Args:
+            name (str): Check name, from CHECKS.
+            image (np.ndarray): Working copy from working_copy().
+
+        Returns:
+            list: Findings.
+
+        Raises:
+            BudgetExceeded: If the check can't fit its budget; nothing was run.
+        """
+        scale = self.plan(name, image)
+        if scale is None:
+            with self._lock:
+                # Estimates taken under contention overstate the cost; let the check back in soon
+                self.megapixel_ms[name] /= 2
+            raise BudgetExceeded(f"'{name}' would take longer than its {self.budgets_ms[name]} ms budget")
+        if scale < 1:
+            image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        start = time.perf_counter()
+        findings = getattr(self, f'_check_{name}')(image)
+        self.record(name, time.perf_counter() - start, image.shape[0] * image.shape[1])
+        return findings
+
+    def _gradient_energy(self, gray):
+        gx = cv2.Sobel(gray, cv2.CV_32F, 1, 0, ksize=3)
+        gy = cv2.Sobel(gray, cv2.CV_32F, 0, 1, ksize=3)
+        return _block_view(cv2.magnitude(gx, gy), self.block).mean(axis=(2, 3))
+
+    def _check_ela(self, image):
+        ok, encoded = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, self.ela_quality])
+        if not ok:
+            return []
+        # Luminance only: chroma subsampling makes every coloured area look anomalous
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        recompressed = cv2.imdecode(encoded, cv2.IMREAD_GRAYSCALE)
+        error = cv2.absdiff(gray, recompressed).astype(np.float32)
+
+        # Text and edges always recompress worse than paper, so each block is only
+        # compared with blocks of similar edge energy, measured on a smoothed page so
+        # that noise, which is what a never-compressed region keeps, doesn't count
+        error_level = _block_view(error, self.block).mean(axis=(2, 3))
+        energy = self._gradient_energy(cv2.medianBlur(gray, 5))
+        edges = np.unique(np.percentile(energy, np.linspace(0, 100, self.energy_bins + 1)[1:-1]))
+        bins = np.digitize(energy, edges)
+        z = np.zeros_like(error_level)
+        for index in np.unique(bins):
+            members = bins == index
+            z[members] = _robust_z(error_level[members])
+
+        # Pasted content can recompress worse (never compressed) or better (compressed before).
+        # A single line of text can stand out on its own, a pasted region spans several.
+        blocks, box = _largest_region(np.abs(z) > self.ela_z, min_side=3)
+        if blocks < self.min_region_blocks:
+            return []
+        return [Finding('ela', 'security',
+                        f"Error level analysis: a region {_describe(box, z.shape)} recompresses "
+                        f"differently from the rest of the document, suggesting it was pasted in")]
+
+    def _check_noise(self, image):
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        # What the median filter removes is mostly noise
+        residual = gray.astype(np.float32) - cv2.medianBlur(gray, 3).astype(np.float32)
+
+        # Noise is only measurable away from text and edges, and JPEG ringing spreads
+        # edges over their 8x8 block. Find edges on a smoothed page so a noisier region
+        # doesn't disqualify itself.
+        smoothed = cv2.medianBlur(gray, 5)
+        gradient = cv2.magnitude(cv2.Sobel(smoothed, cv2.CV_32F, 1, 0, ksize=3),
+                                 cv2.Sobel(smoothed, cv2.CV_32F, 0, 1, ksize=3))
+        edges = (gradient > 8 * max(float(np.median(gradient)), 1.0)).astype(np.uint8)
+        usable = 1 - cv2.dilate(edges, np.ones((17, 17), np.uint8))
+
+        counts = _block_view(usable, self.block).sum(axis=(2, 3))
+        variance = (_block_view(residual * residual * usable, self.block).sum(axis=(2, 3))
+                    / np.maximum(counts, 1))
+        flat = counts >= self.block * self.block // 2
+        if flat.sum() < 4 * self.min_region_blocks:
+            return []
+        median = float(np.median(variance[flat]))
+        floor = max(median, 0.05)
+        ratio = (variance + 0.05) / (floor + 0.05)
+        anomalous = flat & ((ratio > self.noise_ratio) | (ratio < 1.0 / self.noise_ratio))
+
+        blocks, box = _largest_region(anomalous)
+        if blocks < self.min_region_blocks:
+            return []
+        x, y, w, h = box
+        region_ratio = float(np.median(ratio[y:y + h, x:x + w][anomalous[y:y + h, x:x + w]]))
+        return [Finding('noise', 'consistency',
+                        f"Noise level in a region {_describe(box, variance.shape)} is "
+                        f"{region_ratio:.1f}x that of the rest of the document")]
+
+    def _check_copy_move(self, image):
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        # Describe the 32x32 block at every pixel by the means of its 8x8 cells, so
+        # duplicates are found at any offset, not just multiples of a grid step.
+        # Quantizing the means absorbs resampling and recompression noise.
+        cell, size = 8, 32
+        means = cv2.blur(gray, (cell, cell), anchor=(0, 0), borderType=cv2.BORDER_REPLICATE)
+        rows, cols = gray.shape[0] - size + 1, gray.shape[1] - size + 1
+        if rows <= 0 or cols <= 0:
+            return []
+        cells = [means[dy:dy + rows, dx:dx + cols] for dy in range(0, size, cell) for dx in range(0, size, cell)]
+        quantized = np.stack([c // 16 for c in cells], axis=-1).reshape(rows * cols, 16)
+        # Flat paper matches itself everywhere; only textured blocks can testify to a copy
+        contrast = np.maximum.reduce(cells).astype(np.int16) - np.minimum.reduce(cells)
+        textured = np.flatnonzero(contrast.ravel() > 40)
+        if len(textured) < 2:
+            return []
+
+        # Hash each block's 16 quantized bytes to one integer and sort, so equal blocks are adjacent
+        halves = np.ascontiguousarray(quantized[textured]).view(np.uint64)
+        keys = halves[:, 0] * np.uint64(0x9E3779B97F4A7C15) ^ halves[:, 1]
+        order = np.argsort(keys)
+        keys = keys[order]
+        positions = np.stack(np.divmod(textured[order], cols), axis=1)
+        same = keys[1:] == keys[:-1]
+        offsets = positions[1:][same] - positions[:-1][same]
+
+        # Ignore overlapping blocks and normalize the offset's direction
+        sources = positions[:-1][same]
+        far = np.abs(offsets).max(axis=1) >= size
+        offsets, sources = offsets[far], sources[far]
+        flip = (offsets[:, 0] < 0) | ((offsets[:, 0] == 0) & (offsets[:, 1] < 0))
+        offsets[flip] *= -1
+        sources[flip] -= offsets[flip]
+        if len(offsets) < self.copy_move_min_pairs:
+            return []
+        unique, inverse, counts = np.unique(offsets, axis=0, return_inverse=True, return_counts=True)
+        best = int(np.argmax(counts))
+        if counts[best] < self.copy_move_min_pairs:
+            return []
+
+        # A copied area is one connected patch of matches; repeated words in a form are
+        # many thin ones, one per line
+        matched = sources[inverse.ravel() == best] // cell
+        mask = np.zeros((rows // cell + 1, cols // cell + 1), np.uint8)
+        mask[matched[:, 0], matched[:, 1]] = 1
+        count, labels, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+        pairs_per_patch = np.bincount(labels[matched[:, 0], matched[:, 1]], minlength=count)
+        # Patches must be at least two blocks tall and wide: a block sliding over the
+        # blank space around a repeated word or line makes patches up to about one block high
+        large = (stats[:, cv2.CC_STAT_WIDTH] >= 2 * size // cell) & (stats[:, cv2.CC_STAT_HEIGHT] >= 2 * size // cell)
+        large[0] = False
+        pairs = int(pairs_per_patch[large].max()) if large.any() else 0
+        if pairs < self.copy_move_min_pairs:
+            return []
+        dy, dx = unique[best]
+        return [Finding('copy_move', 'security',
+                        f"Copy-move: {pairs} image blocks are duplicated "
+                        f"{100 * dx / gray.shape[1]:.0f}% of the page width across and "
+                        f"{100 * dy / gray.shape[0]:.0f}% of its height down")]
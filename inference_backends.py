@@ -0,0 +1,380 @@
+"""
+Inference backends for the document authenticity model.
+
+KerasBackend runs the original .h5/SavedModel and can also return the
+penultimate-layer embedding used by the near-duplicate index. TFLiteBackend
+runs a converted .tflite model through the TFLite interpreter with the XNNPACK
+CPU delegate.
+The command-line interface converts a Keras model to TFLite, optionally with
+dynamic-range, float16 or int8 quantization calibrated on a local sample
+directory, and checks score parity between the two backends.
+
+Usage:
+    python inference_backends.py convert --model document_model.h5 --output document_model.tflite \\
+        --quantize int8 --calibration-dir samples/
+    python inference_backends.py parity --model document_model.h5 --tflite document_model.tflite \\
+        --samples samples/
+"""
+import argparse
+import json
+import logging
+import os
+import threading
+
+import cv2
+import numpy as np
+
+from preprocessing import INPUT_SIZE, Preprocessor
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff', '.webp')
+
+# Thread-pool sizes applied the first time TensorFlow is imported
+_tf_threading = {'intra_op': None, 'inter_op': None}
+_tf_lock = threading.Lock()
+
+
+def configure_tensorflow_threads(intra_op=None, inter_op=None):
+    """
+    Set TensorFlow's thread-pool sizes without importing it yet.
+
+    Args:
+        intra_op (int): Threads used inside a single op.
+        inter_op (int): Ops run in parallel.
+    """
+    _tf_threading.update(intra_op=intra_op, inter_op=inter_op)
+
+
+def import_tensorflow():
+    """
+    Import TensorFlow on first use and apply the configured threading.
+
+    TensorFlow takes seconds to import, so nothing imports it at module load;
+    this keeps the web app's cold start fast.
+
+    Returns:
+        module: The tensorflow module.
+    """
+    with _tf_lock:
+        import tensorflow as tf
+        if not getattr(import_tensorflow, 'configured', False):
+            try:
+                if _tf_threading['intra_op']:
+                    tf.config.threading.set_intra_op_parallelism_threads(_tf_threading['intra_op'])
+                if _tf_threading['inter_op']:
+                    tf.config.threading.set_inter_op_parallelism_threads(_tf_threading['inter_op'])
+            except RuntimeError as e:
+                # Raised when the runtime was already initialized elsewhere
+                logger.warning(f"Could not configure TensorFlow threading: {str(e)}")
+            import_tensorflow.configured = True
+        return tf
+
+
+class KerasBackend:
+    """Runs the Keras model directly, bypassing the per-call overhead of predict()."""
+
+    name = 'keras'
+
+    def __init__(self, model_path):
+        self.model_path = model_path
+        tf = import_tensorflow()
+        self.model = tf.keras.models.load_model(model_path)
+        # The same graph with a second output: the input of the final layer, i.e. the
+        # penultimate representation, used as a compact embedding of the document
+        try:
+            self.embedding_model = tf.keras.Model(self.model.inputs,
+                                                  [self.model.outputs[0], self.model.layers[-1].input])
+        except (AttributeError, TypeError, ValueError) as e:
+            logger.warning(f"Model {model_path} has no usable penultimate layer for embeddings: {str(e)}")
+            self.embedding_model = None
+
+    def predict(self, batch):
+        """
+        Score a batch of preprocessed images.
+
+        Args:
+            batch (np.ndarray): Array of shape (N, 224, 224, 3).
+
+        Returns:
+            np.ndarray: Model outputs, one row per image.
+        """
+        return self.model(batch, training=False).numpy()
+
+    def predict_with_embeddings(self, batch):
+        """
+        Score a batch and return each image's penultimate-layer activations, in one forward pass.
+
+        Args:
+            batch (np.ndarray): Array of shape (N, 224, 224, 3).
+
+        Returns:
+            tuple: (outputs, embeddings); embeddings has shape (N, D), or is None
+                if the model doesn't have a single penultimate layer.
+        """
+        if self.embedding_model is None:
+            return self.predict(batch), None
+        outputs, embeddings = self.embedding_model([batch], training=False)
+        return outputs.numpy(), embeddings.numpy().reshape(len(batch), -1)
+
+
+class TFLiteBackend:
+    """Runs a .tflite model through the TFLite interpreter with the XNNPACK delegate."""
+
+    name = 'tflite'
+
+    def __init__(self, model_path, num_threads=None):
+        """
+        Load a TFLite model.
+
+        Resizing an interpreter's input reallocates all of its tensors, far too slow
+        to do per call when micro-batches and tile batches vary in size. Batches are
+        padded to the next power of two instead, and each of those sizes gets an
+        interpreter of its own, allocated once on first use.
+
+        Args:
+            model_path (str): Path to the .tflite file.
+            num_threads (int): Interpreter threads; None lets TFLite decide.
+        """
+        self.model_path = model_path
+        self.num_threads = num_threads
+        self._tf = import_tensorflow()
+        # {padded batch size: (interpreter, input details, output details)}
+        self._interpreters = {}
+        self._interpreter(1)
+
+    def _interpreter(self, batch_size):
+        """Return the interpreter allocated for batch_size inputs, creating it on first use."""
+        entry = self._interpreters.get(batch_size)
+        if entry is not None:
+            return entry
+        tf = self._tf
+        # The AUTO resolver applies XNNPACK to every op it supports
+        interpreter = tf.lite.Interpreter(
+            model_path=self.model_path,
+            num_threads=self.num_threads,
+            experimental_op_resolver_type=tf.lite.experimental.OpResolverType.AUTO)
+        details = interpreter.get_input_details()[0]
+        shape = list(details['shape'])
+        shape[0] = batch_size
+        interpreter.resize_tensor_input(details['index'], shape)
+        interpreter.allocate_tensors()
+        # Tensor details (including quantization) are only valid after allocation
+        entry = (interpreter, interpreter.get_input_details()[0], interpreter.get_output_details()[0])
+        self._interpreters[batch_size] = entry
+        logger.info(f"Allocated a TFLite interpreter for batches of {batch_size}")
+        return entry
+
+    def predict(self, batch):
+        """
+        Score a batch of preprocessed images.
+
+        The interpreters are not thread-safe; callers must serialize calls, as the
+        detector's micro-batcher does.
+
+        Args:
+            batch (np.ndarray): Array of shape (N, 224, 224, 3) scaled to [0, 1].
+
+        Returns:
+            np.ndarray: Model outputs, one row per image.
+        """
+        count = len(batch)
+        interpreter, input_details, output_details = self._interpreter(1 << (count - 1).bit_length())
+
+        dtype = input_details['dtype']
+        scale, zero_point = input_details['quantization']
+        if scale:
+            # Fully integer models take quantized input
+            batch = np.clip(np.round(batch / scale + zero_point),
+                            np.iinfo(dtype).min, np.iinfo(dtype).max)
+        # Rows past count keep whatever the last batch left there; their outputs are dropped
+        interpreter.tensor(input_details['index'])()[:count] = batch
+        interpreter.invoke()
+
+        output = interpreter.get_tensor(output_details['index'])[:count]
+        scale, zero_point = output_details['quantization']
+        if scale:
+            output = (output.astype(np.float32) - zero_point) * scale
+        return output
+
+
+def load_backend(model_path, backend=None, num_threads=None):
+    """
+    Create the inference backend for a model file.
+
+    Args:
+        model_path (str): Path to a .h5, SavedModel directory or .tflite file.
+        backend (str): 'keras' or 'tflite'; inferred from the file extension when None.
+        num_threads (int): Interpreter threads for the TFLite backend.
+
+    Returns:
+        KerasBackend | TFLiteBackend: The loaded backend.
+    """
+    if backend is None:
+        backend = 'tflite' if model_path.endswith('.tflite') else 'keras'
+    if backend == 'tflite':
+        return TFLiteBackend(model_path, num_threads=num_threads)
+    if backend == 'keras':
+        return KerasBackend(model_path)
+    raise ValueError(f"Unknown inference backend '{backend}'")
+
+
+def load_samples(sample_dir, limit=None, preprocessor=None):
+    """
+    Load and preprocess images for calibration or parity checks.
+
+    Args:
+        sample_dir (str): Directory searched recursively for images.
+        limit (int): Maximum number of images to load.
+        preprocessor (Preprocessor): Must match the detector's; defaults to a stretch
+            to INPUT_SIZE in BGR order.
+
+    Returns:
+        list: Float32 arrays of shape (224, 224, 3), preprocessed like the detector's input.
+    """
+    preprocessor = preprocessor if preprocessor is not None else Preprocessor(INPUT_SIZE)
+    samples = []
+    for root, _, names in sorted(os.walk(sample_dir)):
+        for name in sorted(names):
+            if not name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            image = cv2.imread(os.path.join(root, name))
+            if image is None:
+                logger.warning(f"Skipping unreadable sample {name}")
+                continue
+            samples.append(preprocessor(image))
+            if limit and len(samples) >= limit:
+                return samples
+    return samples
+
+
+def convert_to_tflite(model_path, output_path, quantize=None, calibration_dir=None, calibration_samples=200,
+                      preprocessor=None):
+    """
+    Convert a Keras model to TFLite.
+
+    Args:
+        model_path (str): Path to the .h5 file or SavedModel directory.
+        output_path (str): Where to write the .tflite file.
+        quantize (str): None (float32), 'dynamic' (int8 weights), 'float16' or
+            'int8' (int8 weights and activations, calibrated on calibration_dir).
+        calibration_dir (str): Directory of sample documents for int8 calibration.
+        calibration_samples (int): Maximum number of calibration images.
+        preprocessor (Preprocessor): Preprocessing of the calibration images.
+
+    Returns:
+        int: Size of the written model in bytes.
+    """
+    tf = import_tensorflow()
+    model = tf.keras.models.load_model(model_path)
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+
+    if quantize == 'dynamic':
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    elif quantize == 'float16':
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantize == 'int8':
+        if not calibration_dir:
+            raise ValueError("int8 quantization needs a calibration directory")
+        samples = load_samples(calibration_dir, limit=calibration_samples, preprocessor=preprocessor)
+        if not samples:
+            raise ValueError(f"No calibration images found in {calibration_dir}")
+        logger.info(f"Calibrating int8 quantization on {len(samples)} images")
+
+        def representative_dataset():
+            for sample in samples:
+                yield [np.expand_dims(sample, axis=0)]
+
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    elif quantize is not None:
+        raise ValueError(f"Unknown quantization mode '{quantize}'")
+
+    tflite_model = converter.convert()
+    with open(output_path, 'wb') as f:
+        f.write(tflite_model)
+    logger.info(f"Wrote {output_path} ({len(tflite_model)} bytes, quantize={quantize})")
+    return len(tflite_model)
+
+
+def parity_check(reference, candidate, samples, batch_size=16):
+    """
+    Compare the scores of two backends on the same inputs.
+
+    Args:
+        reference: Backend treated as ground truth, usually KerasBackend.
+        candidate: Backend under test, usually TFLiteBackend.
+        samples (list): Preprocessed images.
+        batch_size (int): Images scored per call.
+
+    Returns:
+        dict: Mean/max absolute score difference and verdict agreement at the 0.7 threshold.
+    """
+    reference_scores = []
+    candidate_scores = []
+    for start in range(0, len(samples), batch_size):
+        batch = np.stack(samples[start:start + batch_size]).astype(np.float32)
+        reference_scores.append(np.asarray(reference.predict(batch)).reshape(len(batch), -1)[:, 0])
+        candidate_scores.append(np.asarray(candidate.predict(batch)).reshape(len(batch), -1)[:, 0])
+
+    reference_scores = np.concatenate(reference_scores)
+    candidate_scores = np.concatenate(candidate_scores)
+    diff = np.abs(reference_scores - candidate_scores)
+    return {
+        'samples': int(len(diff)),
+        'mean_abs_diff': float(diff.mean()),
+        'max_abs_diff': float(diff.max()),
+        'verdict_agreement': float(np.mean((reference_scores > 0.7) == (candidate_scores > 0.7))),
+    }
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Convert the authenticity model to TFLite and check parity")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    convert = commands.add_parser('convert', help="convert a Keras model to TFLite")
+    convert.add_argument('--model', default='document_model.h5')
+    convert.add_argument('--output', default='document_model.tflite')
+    convert.add_argument('--quantize', choices=['dynamic', 'float16', 'int8'], default=None)
+    convert.add_argument('--calibration-dir', help="sample documents for int8 calibration")
+    convert.add_argument('--calibration-samples', type=int, default=200)
+    convert.add_argument('--parity-samples', help="run a parity check on these documents after converting")
+    convert.add_argument('--color-order', choices=['bgr', 'rgb'], default='bgr', help="the app's MODEL_COLOR_ORDER")
+    convert.add_argument('--letterbox', action='store_true', help="the app's MODEL_LETTERBOX")
+
+    parity = commands.add_parser('parity', help="compare Keras and TFLite scores")
+    parity.add_argument('--model', default='document_model.h5')
+    parity.add_argument('--tflite', default='document_model.tflite')
+    parity.add_argument('--samples', required=True, help="directory of sample documents")
+    parity.add_argument('--limit', type=int, default=500)
+    parity.add_argument('--color-order', choices=['bgr', 'rgb'], default='bgr', help="the app's MODEL_COLOR_ORDER")
+    parity.add_argument('--letterbox', action='store_true', help="the app's MODEL_LETTERBOX")
+
+    args = parser.parse_args(argv)
+    preprocessor = Preprocessor(INPUT_SIZE, color_order=args.color_order, letterbox=args.letterbox)
+
+    if args.command == 'convert':
+        convert_to_tflite(args.model, args.output, quantize=args.quantize,
+                          calibration_dir=args.calibration_dir,
+                          calibration_samples=args.calibration_samples,
+                          preprocessor=preprocessor)
+        if not args.parity_samples:
+            return
+        tflite_path, sample_dir, limit = args.output, args.parity_samples, args.calibration_samples
+    else:
+        tflite_path, sample_dir, limit = args.tflite, args.samples, args.limit
+
+    samples = load_samples(sample_dir, limit=limit, preprocessor=preprocessor)
+    if not samples:
+        parser.error(f"No sample images found in {sample_dir}")
+    report = parity_check(KerasBackend(args.model), TFLiteBackend(tflite_path), samples)
+    report['keras_bytes'] = os.path.getsize(args.model) if os.path.isfile(args.model) else None
+    report['tflite_bytes'] = os.path.getsize(tflite_path)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
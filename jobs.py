@@ -0,0 +1,273 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    total INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS job_items (
+    job_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    filename TEXT NOT NULL,
+    status TEXT NOT NULL,
+    data BLOB,
+    result TEXT,
+    error TEXT,
+    claimed_at REAL,
+    finished_at REAL,
+    PRIMARY KEY (job_id, idx)
+);
+CREATE INDEX IF NOT EXISTS job_items_status ON job_items (status, job_id, idx);
+"""
+
+
+class JobQueue:
+    """A SQLite-backed queue that verifies batches of documents on background workers."""
+
+    def __init__(self, db_path, process_fn, workers=2, poll_interval=1.0, lease_seconds=600):
+        """
+        Initialize the job queue and start its worker threads.
+
+        Args:
+            db_path (str): Path to the SQLite database holding jobs and their items.
+            process_fn (callable): Called with the encoded bytes of one document;
+                returns a JSON-serializable result.
+            workers (int): Number of background worker threads.
+            poll_interval (float): Seconds an idle worker sleeps before re-checking the queue.
+            lease_seconds (float): How long a claimed item may go without its worker renewing
+                the claim before it is assumed abandoned (e.g. its process died) and handed
+                to another worker. Claims are renewed every third of this while items run.
+        """
+        self.db_path = db_path
+        self.process_fn = process_fn
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self._claim_lock = threading.Lock()
+        # {(job_id, idx): claimed_at} of the items this queue's workers are running
+        self._held = {}
+        self._lease_lock = threading.Lock()
+        self._work_available = threading.Condition()
+        self._progress = threading.Condition()
+        self._closed = threading.Event()
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+        self._workers = [threading.Thread(target=self._run, name=f"job-worker-{i}", daemon=True)
+                         for i in range(workers)]
+        for worker in self._workers:
+            worker.start()
+        self._heartbeat = None
+        if workers:
+            self._heartbeat = threading.Thread(target=self._renew_leases, name="job-lease-heartbeat", daemon=True)
+            self._heartbeat.start()
+
+    @contextmanager
+    def _connect(self):
+        """Open a connection that commits on success and is always closed."""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def submit(self, files):
+        """
+        Queue a batch of documents for verification.
+
+        Args:
+            files (list): (filename, bytes) pairs.
+
+        Returns:
+            str: Identifier of the new job.
+        """
+        job_id = uuid.uuid4().hex
+        with self._connect() as conn:
+            conn.execute("INSERT INTO jobs (id, created_at, total) VALUES (?, ?, ?)",
+                         (job_id, time.time(), len(files)))
+            conn.executemany(
+                "INSERT INTO job_items (job_id, idx, filename, status, data) VALUES (?, ?, ?, 'queued', ?)",
+                [(job_id, idx, filename, sqlite3.Binary(data)) for idx, (filename, data) in enumerate(files)])
+        logger.info(f"Queued job {job_id} with {len(files)} documents")
+
+        with self._work_available:
+            self._work_available.notify_all()
+        return job_id
+
+    def status(self, job_id, since=0):
+        """
+        Report the progress of a job.
+
+        Args:
+            job_id (str): Job identifier returned by submit().
+            since (int): Only include results for items with an index at or above this.
+
+        Returns:
+            dict: Progress counters and finished item results, or None if the job is unknown.
+        """
+        with self._connect() as conn:
+            job = conn.execute("SELECT created_at, total FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if job is None:
+                return None
+            counts = dict(conn.execute(
+                "SELECT status, COUNT(*) FROM job_items WHERE job_id = ? GROUP BY status", (job_id,)).fetchall())
+            rows = conn.execute(
+                "SELECT idx, filename, status, result, error FROM job_items "
+                "WHERE job_id = ? AND idx >= ? AND status IN ('done', 'error') ORDER BY idx",
+                (job_id, since)).fetchall()
+
+        created_at, total = job
+        finished = counts.get('done', 0) + counts.get('error', 0)
+        items = []
+        for idx, filename, item_status, result, error in rows:
+            item = {'index': idx, 'filename': filename, 'status': item_status}
+            if result is not None:
+                item['result'] = json.loads(result)
+            if error is not None:
+                item['error'] = error
+            items.append(item)
+
+        return {
+            'job_id': job_id,
+            'status': 'complete' if finished == total else ('running' if finished or counts.get('running') else 'queued'),
+            'created_at': created_at,
+            'total': total,
+            'completed': counts.get('done', 0),
+            'failed': counts.get('error', 0),
+            'pending': total - finished,
+            'items': items,
+        }
+
+    def depth(self):
+        """Return the number of items waiting for a worker."""
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM job_items WHERE status = 'queued'").fetchone()[0]
+
+    def wait_for_progress(self, timeout):
+        """Block until any item finishes or the timeout elapses."""
+        with self._progress:
+            self._progress.wait(timeout)
+
+    def close(self, timeout=None):
+        """Stop the workers after their current item."""
+        self._closed.set()
+        with self._work_available:
+            self._work_available.notify_all()
+        for worker in self._workers:
+            worker.join(timeout)
+
+    def _claim(self):
+        """
+        Mark the oldest queued item as running and hold it.
+
+        Returns:
+            tuple: (job_id, idx, filename, data) of the item, or None if the queue is empty.
+        """
+        with self._claim_lock:
+            item = self._claim_next()
+            if item is not None:
+                # Held only once the claim is committed, so the lease lock is never taken inside a write
+                with self._lease_lock:
+                    self._held[item[0], item[1]] = item[4]
+                item = item[:4]
+            return item
+
+    def _claim_next(self):
+        """Claim the oldest queued or abandoned item; returns its row and the claim's claimed_at, or None."""
+        with self._connect() as conn:
+            while True:
+                now = time.time()
+                # Items whose lease ran out were claimed by a worker that died
+                row = conn.execute(
+                    "SELECT job_id, idx, filename, data, claimed_at FROM job_items "
+                    "WHERE status = 'queued' OR (status = 'running' AND claimed_at < ?) "
+                    "ORDER BY rowid LIMIT 1", (now - self.lease_seconds,)).fetchone()
+                if row is None:
+                    return None
+                # Compare-and-set on claimed_at, so workers in other processes
+                # sharing the database can't both claim the same item
+                claimed = conn.execute(
+                    "UPDATE job_items SET status = 'running', claimed_at = ? "
+                    "WHERE job_id = ? AND idx = ? AND claimed_at IS ?",
+                    (now, row[0], row[1], row[4])).rowcount
+                if claimed:
+                    return row[:4] + (now,)
+
+    def _renew_leases(self):
+        """Push back the lease of every held item, so a long-running item isn't reclaimed."""
+        while not self._closed.wait(self.lease_seconds / 3):
+            with self._lease_lock:
+                for (job_id, idx), claimed_at in list(self._held.items()):
+                    now = time.time()
+                    try:
+                        with self._connect() as conn:
+                            renewed = conn.execute(
+                                "UPDATE job_items SET claimed_at = ? "
+                                "WHERE job_id = ? AND idx = ? AND status = 'running' AND claimed_at = ?",
+                                (now, job_id, idx, claimed_at)).rowcount
+                    except sqlite3.Error as e:
+                        logger.error(f"Could not renew the lease of job {job_id} item {idx}: {str(e)}")
+                        continue
+                    if renewed:
+                        self._held[job_id, idx] = now
+                    else:
+                        logger.warning(f"Job {job_id} item {idx} was reclaimed by another worker")
+                        del self._held[job_id, idx]
+
+    def _finish(self, job_id, idx, result=None, error=None):
+        # Compare-and-set on the claim held, so a worker that lost its claim can't overwrite the new owner's
+        with self._lease_lock:
+            claimed_at = self._held.pop((job_id, idx), None)
+            if claimed_at is None:
+                logger.warning(f"Discarding the result of job {job_id} item {idx}: its claim was lost")
+                return
+            # The upload is dropped once processed; only its result is kept
+            with self._connect() as conn:
+                finished = conn.execute(
+                    "UPDATE job_items SET status = ?, result = ?, error = ?, data = NULL, finished_at = ? "
+                    "WHERE job_id = ? AND idx = ? AND status = 'running' AND claimed_at = ?",
+                    ('error' if error is not None else 'done',
+                     json.dumps(result) if result is not None else None,
+                     error, time.time(), job_id, idx, claimed_at)).rowcount
+        if not finished:
+            logger.warning(f"Discarding the result of job {job_id} item {idx}: it was reclaimed by another worker")
+            return
+        with self._progress:
+            self._progress.notify_all()
+
+    def _run(self):
+        while not self._closed.is_set():
+            try:
+                item = self._claim()
+            except sqlite3.Error as e:
+                logger.error(f"Could not claim job item: {str(e)}")
+                item = None
+
+            if item is None:
+                with self._work_available:
+                    self._work_available.wait(self.poll_interval)
+                continue
+
+            job_id, idx, filename, data = item
+            try:
+                result = self.process_fn(bytes(data))
+            except Exception as e:
+                logger.error(f"Job {job_id} item {idx} ({filename}) failed: {str(e)}")
+                self._finish(job_id, idx, error=str(e))
+            else:
+                self._finish(job_id, idx, result=result)
@@ -0,0 +1,171 @@
+"""
+Single-pass metadata extraction from OCR text.
+
+Every field extractor is a precompiled regular expression. The extractors for
+the fields still missing are combined into one alternation and the text is
+scanned once, left to right. When a field matches, the alternation is rebuilt
+without that extractor and any less reliable ones for the same field, and the
+scan resumes where the match ended. A more reliable pattern found later still
+overrules a fallback. The scan stops as soon as no extractor is left, so no
+part of the text is read twice whatever the number of fields.
+"""
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+FieldMatch = namedtuple('FieldMatch', ['value', 'confidence', 'start', 'end'])
+
+# Dates as OCR usually reads them: 12/05/2023, 12-05-23, 12.05.2023, 12 MAY 2023
+_DATE = (r'(?:\d{1,2}[/.-]\d{1,2}[/.-]\d{2,4}'
+         r'|\d{1,2} ?(?i:JAN|FEB|MAR|APR|MAY|JUN|JUL|AUG|SEP|OCT|NOV|DEC)[A-Za-z]* ?\d{2,4})')
+_SEP = r'[\s:.]*'
+_NAME = r"[A-Z][A-Za-z'-]*(?: [A-Z][A-Za-z'-]*){0,4}"
+
+
+class FieldExtractor:
+    """One way of finding a metadata field: a pattern, its confidence and an optional validator."""
+
+    def __init__(self, field, pattern, confidence=0.8, validate=None):
+        """
+        Args:
+            field (str): Metadata key the match is reported under.
+            pattern (str): Regular expression. If it has a group named 'value', that group
+                is the field value; otherwise the whole match is.
+            confidence (float): Confidence in [0, 1] reported for matches.
+            validate (callable): Optional check on the value, e.g. a checksum; a failing
+                value is still reported, with half the confidence.
+        """
+        self.field = field
+        self.pattern = pattern
+        self.confidence = confidence
+        self.validate = validate
+        self.regex = re.compile(pattern)
+        # The same pattern without capture groups, for the combined alternation
+        self.bare_pattern = pattern.replace('(?P<value>', '(?:')
+
+    def match(self, text, pos):
+        """
+        Match the pattern at a position.
+
+        Args:
+            text (str): Text being scanned.
+            pos (int): Offset the match must start at.
+
+        Returns:
+            FieldMatch: The match, or None if the pattern doesn't match at pos.
+        """
+        m = self.regex.match(text, pos)
+        if m is None:
+            return None
+        start, end = m.span('value') if 'value' in self.regex.groupindex else m.span()
+        value = text[start:end].strip()
+        confidence = self.confidence
+        if self.validate is not None and not self.validate(value):
+            confidence /= 2
+        return FieldMatch(value, confidence, start, end)
+
+
+def _mrz_check_digit(data):
+    """ICAO 9303 check digit: digits, A-Z as 10-35 and '<' as 0, weighted 7, 3, 1."""
+    total = 0
+    for i, char in enumerate(data):
+        if char.isdigit():
+            value = int(char)
+        elif char.isalpha():
+            value = ord(char) - ord('A') + 10
+        else:
+            value = 0
+        total += value * (7, 3, 1)[i % 3]
+    return str(total % 10)
+
+
+def _valid_td3_mrz(value):
+    lines = value.split()
+    if len(lines) != 2 or len(lines[1]) != 44:
+        return False
+    second = lines[1]
+    # Document number, birth date and expiry date each carry a check digit
+    return (_mrz_check_digit(second[0:9]) == second[9]
+            and _mrz_check_digit(second[13:19]) == second[19]
+            and _mrz_check_digit(second[21:27]) == second[27])
+
+
+# Built-in extractors, most reliable first within each field
+DEFAULT_EXTRACTORS = [
+    FieldExtractor('mrz', r'(?m:^P[A-Z<][A-Z<]{3}[A-Z0-9<]{39}\n[A-Z0-9<]{44}$)',
+                   confidence=0.95, validate=_valid_td3_mrz),
+    FieldExtractor('issue_date', rf'(?i:date of issue|issue date|issued(?: on)?){_SEP}(?P<value>{_DATE})',
+                   confidence=0.9),
+    FieldExtractor('expiry_date', rf'(?i:date of expiry|expiry date|expires|expiry|valid until){_SEP}(?P<value>{_DATE})',
+                   confidence=0.9),
+    FieldExtractor('birth_date', rf'(?i:date of birth|birth date|dob){_SEP}(?P<value>{_DATE})',
+                   confidence=0.9),
+    FieldExtractor('document_id', r'(?i:document|passport|card|id)\s*(?i:no|number|#)\.?[\s:]*(?P<value>[A-Z0-9]{6,})\b',
+                   confidence=0.9),
+    FieldExtractor('surname', rf'(?i:surname|last name){_SEP}(?P<value>{_NAME})', confidence=0.8),
+    FieldExtractor('given_names', rf'(?i:given names?|first names?|forenames?){_SEP}(?P<value>{_NAME})',
+                   confidence=0.8),
+    FieldExtractor('issuing_authority', r'(?i:issuing authority|authority)[\s:.]*(?P<value>[^\n]{2,60})',
+                   confidence=0.7),
+    # Fallbacks: the first date, and the first code containing a digit
+    FieldExtractor('issue_date', rf'\b{_DATE}\b', confidence=0.4),
+    FieldExtractor('document_id', r'\b(?=[A-Z]*\d)[A-Z0-9]{6,}\b', confidence=0.4),
+]
+
+
+class MetadataExtractor:
+    """Extracts metadata fields from OCR text in a single pass."""
+
+    def __init__(self, extractors=None, fields=None):
+        """
+        Args:
+            extractors (list): FieldExtractors in priority order; defaults to DEFAULT_EXTRACTORS.
+            fields (list): Fields extracted by default; None means every field an extractor provides.
+        """
+        self.extractors = list(extractors if extractors is not None else DEFAULT_EXTRACTORS)
+        self.fields = tuple(fields) if fields else tuple(dict.fromkeys(e.field for e in self.extractors))
+        unknown = set(self.fields) - {e.field for e in self.extractors}
+        if unknown:
+            raise ValueError(f"No extractor for metadata fields {sorted(unknown)}")
+        self._combined = lru_cache(maxsize=256)(self._compile)
+
+    def _compile(self, indices):
+        """Combine the given extractors into one alternation."""
+        # No capture groups: re saves and restores every group on each branch it tries,
+        # which would make the cost per character grow with the square of the field count
+        return re.compile('|'.join(f'(?:{self.extractors[index].bare_pattern})' for index in indices))
+
+    def extract(self, text, fields=None):
+        """
+        Find the requested fields in the text.
+
+        Args:
+            text (str): OCR output.
+            fields (list): Fields to look for; defaults to the extractor's configured fields.
+
+        Returns:
+            dict: {field: FieldMatch(value, confidence, start, end)} for each field found,
+                with character offsets into text.
+        """
+        wanted = set(fields or self.fields)
+        found = {}
+        active = tuple(i for i, e in enumerate(self.extractors) if e.field in wanted)
+        pos = 0
+        while active:
+            m = self._combined(active).search(text, pos)
+            if m is None:
+                break
+            # Which extractor matched: the first, in priority order, that matches at this position
+            for index in active:
+                match = self.extractors[index].match(text, m.start())
+                if match is not None:
+                    break
+            else:
+                pos = m.start() + 1
+                continue
+            field = self.extractors[index].field
+            found[field] = match
+            # Only the field's more reliable extractors can still overrule this match
+            active = tuple(i for i in active if self.extractors[i].field != field or i < index)
+            pos = max(m.end(), m.start() + 1)
+        return found
@@ -0,0 +1,567 @@
+"""
+Versioned model management: hot reload, A/B traffic splits and shadow scoring.
+
+A ModelRegistry holds the live model version and optionally a candidate. A new
+version is loaded and warmed up while the current one keeps serving, then
+installed with a single reference swap under a lock. Each request acquires the
+versions it uses for its whole lifetime, so a request in flight during a swap
+finishes on the model it started with. A replaced version is retired: it takes
+no new requests, and its batcher and weights are released on a background
+thread as soon as its last request finishes, so no request waits for it.
+
+A candidate can serve a percentage of requests, or score every request on the
+side without its score being used (shadow mode). Latency and score statistics
+are kept per version, and shadow scores are compared with the live model's.
+"""
+import gc
+import logging
+import os
+import random
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+import numpy as np
+
+import metrics
+from batching import MicroBatcher
+from result_cache import file_fingerprint
+
+logger = logging.getLogger(__name__)
+
+MODEL_LATENCY = metrics.Histogram('verify_model_latency_seconds',
+                                  'Scoring latency per model version, batching included', ['model', 'mode'])
+MODEL_SCORES = metrics.Histogram('verify_model_scores', 'Authenticity scores per model version', ['model', 'mode'],
+                                 buckets=(0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0))
+
+ROLES = ('live', 'candidate')
+
+# The versions one request uses: serving produces its score, shadow (or None) scores it on the side
+Assignment = namedtuple('Assignment', ['serving', 'shadow'])
+
+
+def path_signature(path):
+    """
+    Cheaply detect changes to a model file or SavedModel directory.
+
+    Args:
+        path (str): Path to the model.
+
+    Returns:
+        tuple: Sizes and modification times of the model's files, or None if it doesn't exist.
+    """
+    try:
+        if not os.path.isdir(path):
+            stat = os.stat(path)
+            return (stat.st_size, stat.st_mtime_ns)
+        entries = []
+        for root, _, names in os.walk(path):
+            for name in names:
+                file_path = os.path.join(root, name)
+                stat = os.stat(file_path)
+                entries.append((os.path.relpath(file_path, path), stat.st_size, stat.st_mtime_ns))
+        return tuple(sorted(entries))
+    except FileNotFoundError:
+        return None
+
+
+class ModelStats:
+    """Running latency and score statistics for one model version."""
+
+    def __init__(self, threshold=0.7):
+        """
+        Args:
+            threshold (float): Score above which a document counts as authentic when
+                comparing shadow verdicts with the live model's.
+        """
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.shadow_requests = 0
+        self.errors = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.score_total = 0.0
+        self.score_min = None
+        self.score_max = None
+        self.compared = 0
+        self.agreements = 0
+        self.abs_diff_total = 0.0
+
+    def record(self, seconds, score, shadow=False, reference=None):
+        """
+        Record one scored document.
+
+        Args:
+            seconds (float): Scoring latency.
+            score (float): The version's score.
+            shadow (bool): Whether the score was computed in shadow mode.
+            reference (float): The live model's score for the same document, if known.
+        """
+        with self._lock:
+            if shadow:
+                self.shadow_requests += 1
+            else:
+                self.requests += 1
+            self.latency_total += seconds
+            self.latency_max = max(self.latency_max, seconds)
+            self.score_total += score
+            self.score_min = score if self.score_min is None else min(self.score_min, score)
+            self.score_max = score if self.score_max is None else max(self.score_max, score)
+            if reference is not None:
+                self.compared += 1
+                self.agreements += (score > self.threshold) == (reference > self.threshold)
+                self.abs_diff_total += abs(score - reference)
+
+    def record_error(self):
+        with self._lock:
+            self.errors += 1
+
+    def snapshot(self):
+        """Return the statistics as a JSON-serializable dict."""
+        with self._lock:
+            scored = self.requests + self.shadow_requests
+            return {
+                'requests': self.requests,
+                'shadow_requests': self.shadow_requests,
+                'errors': self.errors,
+                'mean_latency_ms': round(1000 * self.latency_total / scored, 3) if scored else None,
+                'max_latency_ms': round(1000 * self.latency_max, 3) if scored else None,
+                'mean_score': self.score_total / scored if scored else None,
+                'min_score': self.score_min,
+                'max_score': self.score_max,
+                'compared_with_live': self.compared,
+                'verdict_agreement': self.agreements / self.compared if self.compared else None,
+                'mean_abs_score_diff': self.abs_diff_total / self.compared if self.compared else None,
+            }
+
+
+def _split_prediction(prediction):
+    """Split a batcher result into the model output row and the embedding, if there is one."""
+    if isinstance(prediction, tuple):
+        return prediction
+    return prediction, None
+
+
+class ModelVersion:
+    """One loaded model with its own micro-batcher and statistics."""
+
+    def __init__(self, path, backend, predict_fn, batch_max_size=16, batch_max_wait_ms=5.0):
+        """
+        Args:
+            path (str): Path the model was loaded from.
+            backend: Loaded inference backend, e.g. KerasBackend or TFLiteBackend.
+            predict_fn (callable): Called as predict_fn(batch, backend) to run a forward pass;
+                returns one output row per image, or one (output row, embedding) pair.
+            batch_max_size (int): Maximum inputs per forward pass.
+            batch_max_wait_ms (float): Maximum time an input waits for its batch to fill.
+        """
+        self.path = path
+        self.backend = backend
+        self.fingerprint = file_fingerprint(path)
+        self.name = f"{os.path.basename(os.path.normpath(path))}@{self.fingerprint[:12]}"
+        self.loaded_at = time.time()
+        self.load_seconds = None
+        self.state = 'active'
+        self.stats = ModelStats()
+        self.batcher = MicroBatcher(lambda batch: predict_fn(batch, backend),
+                                    max_batch_size=batch_max_size,
+                                    max_wait_ms=batch_max_wait_ms,
+                                    name=f"micro-batcher-{self.name}")
+        self._in_flight = 0
+
+    def score(self, sample, embedding=None):
+        """
+        Score one preprocessed image, batched with concurrent requests.
+
+        Args:
+            sample (np.ndarray): Model input without the batch axis.
+            embedding (dict): Optional dict that receives the image's penultimate-layer
+                embedding under 'vector' and this version's fingerprint under 'model',
+                when the forward pass produced one.
+
+        Returns:
+            float: Authenticity score.
+        """
+        start = time.perf_counter()
+        try:
+            output, vector = _split_prediction(self.batcher.predict(sample))
+            score = float(output[0])
+        except Exception:
+            self.stats.record_error()
+            raise
+        elapsed = time.perf_counter() - start
+        self.stats.record(elapsed, score)
+        MODEL_LATENCY.labels(self.name, 'serve').observe(elapsed)
+        MODEL_SCORES.labels(self.name, 'serve').observe(score)
+        if embedding is not None and vector is not None:
+            embedding.update(vector=vector, model=self.fingerprint)
+        return score
+
+    def score_batch(self, batch, embedding=None):
+        """
+        Score a stacked batch of preprocessed images, e.g. the tiles of one document,
+        in a forward pass of its own.
+
+        Statistics are recorded for the first image, which tiled analysis keeps
+        for the whole-page view.
+
+        Args:
+            batch (np.ndarray): Model inputs with the batch axis; not copied, so it
+                must not change until this returns.
+            embedding (dict): Optional dict that receives the first image's embedding,
+                as in score().
+
+        Returns:
+            np.ndarray: float32 authenticity scores, one per image.
+        """
+        start = time.perf_counter()
+        try:
+            predictions = self.batcher.submit_batch(batch).result()
+            rows = [_split_prediction(prediction) for prediction in predictions]
+            scores = np.array([output[0] for output, _ in rows], dtype=np.float32)
+        except Exception:
+            self.stats.record_error()
+            raise
+        elapsed = time.perf_counter() - start
+        self.stats.record(elapsed, float(scores[0]))
+        MODEL_LATENCY.labels(self.name, 'batch').observe(elapsed)
+        MODEL_SCORES.labels(self.name, 'serve').observe(float(scores[0]))
+        if embedding is not None and rows[0][1] is not None:
+            embedding.update(vector=rows[0][1], model=self.fingerprint)
+        return scores
+
+    def shadow_score(self, sample, reference):
+        """
+        Score one preprocessed image in the background and compare it with the live score.
+
+        Args:
+            sample (np.ndarray): Model input without the batch axis.
+            reference (float): The live model's score for the same image.
+        """
+        start = time.perf_counter()
+
+        def record(future):
+            if future.cancelled() or future.exception() is not None:
+                self.stats.record_error()
+                return
+            elapsed = time.perf_counter() - start
+            score = float(_split_prediction(future.result())[0][0])
+            self.stats.record(elapsed, score, shadow=True, reference=reference)
+            MODEL_LATENCY.labels(self.name, 'shadow').observe(elapsed)
+            MODEL_SCORES.labels(self.name, 'shadow').observe(score)
+
+        try:
+            # The caller doesn't wait for this score, so it may reuse its input buffer meanwhile
+            self.batcher.submit(sample.copy()).add_done_callback(record)
+        except RuntimeError:
+            # Released while this request was finishing; its shadow score doesn't matter
+            pass
+
+    def describe(self):
+        """Return the version's identity, state and statistics as a dict."""
+        return {
+            'name': self.name,
+            'path': self.path,
+            'fingerprint': self.fingerprint,
+            'backend': getattr(self.backend, 'name', None),
+            'state': self.state,
+            'loaded_at': self.loaded_at,
+            'load_seconds': self.load_seconds,
+            'in_flight': self._in_flight,
+            'stats': self.stats.snapshot(),
+        }
+
+
+class ModelRegistry:
+    """Holds the live and candidate model versions and swaps them without dropping requests."""
+
+    def __init__(self, load_fn, predict_fn, batch_max_size=16, batch_max_wait_ms=5.0):
+        """
+        Args:
+            load_fn (callable): Called with a model path; returns the loaded and warmed-up backend.
+            predict_fn (callable): Called as predict_fn(batch, backend) to run a forward pass.
+            batch_max_size (int): Maximum inputs per forward pass of each version.
+            batch_max_wait_ms (float): Maximum time an input waits for its batch to fill.
+        """
+        self.load_fn = load_fn
+        self.predict_fn = predict_fn
+        self.batch_max_size = batch_max_size
+        self.batch_max_wait_ms = batch_max_wait_ms
+        self.live = None
+        self.candidate = None
+        self.candidate_percent = 0.0
+        self.candidate_shadow = False
+        self.last_error = None
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._draining = []
+        # Where each role is loaded from, and the file signatures of its installed version,
+        # of the load in progress and of the last load that failed
+        self._paths = {}
+        self._signatures = {}
+        self._loading = {}
+        self._failed = {}
+        self._watcher = None
+        self._closed = threading.Event()
+
+    def track(self, path, role='live'):
+        """
+        Record the path a role is loaded from without loading it, so watch() loads
+        it once it appears.
+
+        Args:
+            path (str): Model path.
+            role (str): 'live' or 'candidate'.
+        """
+        if role not in ROLES:
+            raise ValueError(f"Unknown model role '{role}', expected one of {ROLES}")
+        with self._lock:
+            if self._paths.get(role) != path:
+                self._signatures.pop(role, None)
+                self._failed.pop(role, None)
+            self._paths[role] = path
+
+    def load(self, path, role='live'):
+        """
+        Load and warm up a model version, then install it for a role.
+
+        The version being replaced keeps serving until the new one is ready, and
+        is released once its in-flight requests finish.
+
+        Args:
+            path (str): Path to a .h5, SavedModel directory or .tflite file.
+            role (str): 'live' or 'candidate'.
+
+        Returns:
+            ModelVersion: The installed version.
+
+        Raises:
+            Exception: Whatever loading raised; the current version stays installed.
+        """
+        self.track(path, role)
+        # Taken before loading, so a file replaced during the load is picked up by the watcher
+        signature = path_signature(path)
+        with self._lock:
+            self._loading[role] = signature
+        # One load at a time keeps peak memory to at most one extra model
+        with self._load_lock:
+            start = time.perf_counter()
+            try:
+                version = ModelVersion(path, self.load_fn(path), self.predict_fn,
+                                       batch_max_size=self.batch_max_size,
+                                       batch_max_wait_ms=self.batch_max_wait_ms)
+            except Exception as e:
+                self.last_error = f"{role} {path}: {str(e)}"
+                with self._lock:
+                    if self._loading.get(role) == signature:
+                        self._loading.pop(role)
+                    if self._paths.get(role) == path:
+                        self._failed[role] = signature
+                raise
+            version.load_seconds = time.perf_counter() - start
+
+        with self._lock:
+            if self._loading.get(role) == signature:
+                self._loading.pop(role)
+            if self._paths.get(role) != path:
+                # Superseded by a newer request for this role while loading
+                replaced = version
+            else:
+                self._signatures[role] = signature
+                self._failed.pop(role, None)
+                if role == 'live':
+                    replaced, self.live = self.live, version
+                else:
+                    replaced, self.candidate = self.candidate, version
+        if replaced is version:
+            logger.info(f"Discarding {version.name}: {role} model changed while it loaded")
+        else:
+            logger.info(f"Installed {version.name} as the {role} model after {version.load_seconds:.2f}s")
+        if replaced is not None:
+            self._retire(replaced)
+        return version
+
+    def load_async(self, path, role='live'):
+        """
+        Load a model version on a background thread; see load().
+
+        Returns:
+            threading.Thread: The loading thread.
+        """
+        def run():
+            try:
+                self.load(path, role)
+            except Exception as e:
+                logger.error(f"Failed to load {role} model from {path}: {str(e)}")
+
+        thread = threading.Thread(target=run, name=f"model-loader-{role}", daemon=True)
+        thread.start()
+        return thread
+
+    def route(self, percent=None, shadow=None):
+        """
+        Configure how the candidate is used.
+
+        Args:
+            percent (float): Share of requests, 0-100, that the candidate serves instead
+                of the live model.
+            shadow (bool): Score every request with the candidate as well, without
+                using its score.
+        """
+        with self._lock:
+            if percent is not None:
+                if not 0 <= percent <= 100:
+                    raise ValueError("Candidate traffic percentage must be between 0 and 100")
+                self.candidate_percent = float(percent)
+            if shadow is not None:
+                self.candidate_shadow = bool(shadow)
+
+    def promote(self):
+        """Make the candidate the live model; the old live model drains and is released."""
+        with self._lock:
+            if self.candidate is None:
+                raise ValueError("There is no candidate model to promote")
+            replaced, self.live, self.candidate = self.live, self.candidate, None
+            self._paths['live'] = self._paths.pop('candidate')
+            self._signatures['live'] = self._signatures.pop('candidate', None)
+            self._failed.pop('live', None)
+            self._failed.pop('candidate', None)
+        logger.info(f"Promoted {self.live.name} to the live model")
+        if replaced is not None:
+            self._retire(replaced)
+
+    def drop_candidate(self):
+        """Stop using the candidate; it drains and is released."""
+        with self._lock:
+            replaced, self.candidate = self.candidate, None
+            self._paths.pop('candidate', None)
+            self._signatures.pop('candidate', None)
+            self._failed.pop('candidate', None)
+        if replaced is not None:
+            self._retire(replaced)
+
+    @contextmanager
+    def acquire(self):
+        """
+        Pick the versions for one request and keep them loaded until it finishes.
+
+        Yields:
+            Assignment: (serving, shadow) versions; serving is None when no model is loaded.
+        """
+        with self._lock:
+            serving, shadow = self.live, None
+            if self.candidate is not None:
+                if self.candidate_shadow and serving is not None:
+                    shadow = self.candidate
+                elif serving is None or random.random() * 100 < self.candidate_percent:
+                    serving = self.candidate
+            for version in (serving, shadow):
+                if version is not None:
+                    version._in_flight += 1
+        try:
+            yield Assignment(serving, shadow)
+        finally:
+            drained = []
+            with self._lock:
+                for version in (serving, shadow):
+                    if version is not None:
+                        version._in_flight -= 1
+                        if version.state == 'draining' and version._in_flight == 0:
+                            drained.append(version)
+            for version in drained:
+                self._release_async(version)
+
+    def _retire(self, version):
+        with self._lock:
+            version.state = 'draining'
+            idle = version._in_flight == 0
+            if not idle:
+                self._draining.append(version)
+        if idle:
+            self._release_async(version)
+        else:
+            logger.info(f"Draining {version.name} ({version._in_flight} requests in flight)")
+
+    def _release_async(self, version):
+        """Release a version on a thread of its own; closing its batcher and collecting its weights take a while."""
+        threading.Thread(target=self._release, args=(version,), name=f"model-release-{version.name}",
+                         daemon=True).start()
+
+    def _release(self, version):
+        with self._lock:
+            if version.state == 'released':
+                return
+            version.state = 'released'
+            if version in self._draining:
+                self._draining.remove(version)
+        # Queued shadow inputs are served before the batcher thread exits
+        version.batcher.close()
+        version.backend = None
+        version.batcher = None
+        # Keras models hold reference cycles; collect now so the weights go with the version
+        gc.collect()
+        logger.info(f"Released model {version.name}")
+
+    def watch(self, interval):
+        """
+        Reload a role whenever its model file changes on disk, e.g. after a deploy.
+
+        A change is acted on once the file has stopped changing for one interval,
+        so a model that is still being copied into place isn't loaded half-written.
+        A file that fails to load isn't tried again until it changes.
+
+        Args:
+            interval (float): Seconds between checks.
+        """
+        if self._watcher is not None:
+            return
+
+        def run():
+            pending = {}
+            while not self._closed.wait(interval):
+                with self._lock:
+                    watched = [(role, path, (self._signatures.get(role), self._loading.get(role),
+                                             self._failed.get(role)))
+                               for role, path in self._paths.items()]
+                for role, path, known_signatures in watched:
+                    signature = path_signature(path)
+                    if signature is None or signature in known_signatures:
+                        pending.pop(role, None)
+                        continue
+                    if pending.get(role) != signature:
+                        pending[role] = signature
+                        continue
+                    pending.pop(role, None)
+                    logger.info(f"{role.capitalize()} model at {path} changed; reloading")
+                    try:
+                        self.load(path, role)
+                    except Exception as e:
+                        logger.error(f"Failed to reload {role} model from {path}: {str(e)}; "
+                                     "retrying once the file changes")
+
+        self._watcher = threading.Thread(target=run, name="model-watcher", daemon=True)
+        self._watcher.start()
+
+    def snapshot(self):
+        """Return the installed versions, routing and per-version statistics as a dict."""
+        with self._lock:
+            live, candidate, draining = self.live, self.candidate, list(self._draining)
+            routing = {'candidate_percent': self.candidate_percent, 'candidate_shadow': self.candidate_shadow}
+        return {
+            'live': live.describe() if live is not None else None,
+            'candidate': candidate.describe() if candidate is not None else None,
+            'routing': routing,
+            'draining': [version.describe() for version in draining],
+            'last_error': self.last_error,
+        }
+
+    def close(self):
+        """Stop watching and release every version."""
+        self._closed.set()
+        with self._lock:
+            versions = [v for v in (self.live, self.candidate, *self._draining) if v is not None]
+            self.live = self.candidate = None
+        for version in versions:
+            self._release(version)
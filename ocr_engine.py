@@ -0,0 +1,203 @@
+import logging
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Settings for each OCR profile:
+#   preprocess - grayscale and binarize before OCR
+#   regions    - OCR only detected text regions, packed into one compact image
+#   target_dpi - rescale images scanned above this resolution down to it
+#   zones_only - restrict OCR to the configured metadata zones when there are any
+PROFILES = {
+    'full': {'preprocess': False, 'regions': False, 'target_dpi': None, 'zones_only': False},
+    'accurate': {'preprocess': True, 'regions': True, 'target_dpi': 300, 'zones_only': False},
+    'fast': {'preprocess': True, 'regions': True, 'target_dpi': 200, 'zones_only': True},
+}
+
+# Long side of an A4 page in inches, used to estimate the scan resolution
+DEFAULT_PAGE_INCHES = 11.69
+
+
+class OCREngine:
+    """Prepares document images for Tesseract and runs it with configurable settings."""
+
+    def __init__(self, profile='accurate', lang='eng', psm=None, oem=None, target_dpi=None,
+                 page_inches=DEFAULT_PAGE_INCHES, zones=None):
+        """
+        Initialize the OCR engine.
+
+        Args:
+            profile (str): One of 'full' (untouched image, legacy behaviour),
+                'accurate' (preprocessed, text regions only) or 'fast' (lower DPI and,
+                when zones are configured, only the metadata zones).
+            lang (str): Tesseract language(s), e.g. 'eng' or 'eng+fra'.
+            psm (int): Tesseract page segmentation mode (--psm); None keeps the profile default.
+            oem (int): Tesseract OCR engine mode (--oem); None keeps Tesseract's default.
+            target_dpi (int): Overrides the profile's target resolution.
+            page_inches (float): Physical length of the document's long side, used to
+                estimate the resolution of the scan.
+            zones (dict): Optional {field: (x0, y0, x1, y1)} rectangles, as fractions of the
+                page size, locating the fields metadata extraction needs.
+        """
+        if profile not in PROFILES:
+            raise ValueError(f"Unknown OCR profile '{profile}', expected one of {sorted(PROFILES)}")
+        self.profile = profile
+        self.settings = dict(PROFILES[profile])
+        if target_dpi is not None:
+            self.settings['target_dpi'] = target_dpi
+        self.lang = lang
+        self.psm = psm
+        self.oem = oem
+        self.page_inches = page_inches
+        self.zones = zones or {}
+
+    def full_resolution_side(self):
+        """Long side, in pixels, of a page at the target resolution; None if the profile keeps full size."""
+        target_dpi = self.settings['target_dpi']
+        return int(target_dpi * self.page_inches) if target_dpi else None
+
+    def tesseract_config(self, dpi=None, psm=None):
+        """Build the Tesseract command-line options for a pass."""
+        options = []
+        psm = self.psm if self.psm is not None else psm
+        if psm is not None:
+            options.append(f"--psm {psm}")
+        if self.oem is not None:
+            options.append(f"--oem {self.oem}")
+        if dpi:
+            # Stops Tesseract from guessing the resolution of a bare array
+            options.append(f"--dpi {int(dpi)}")
+        return ' '.join(options)
+
+    def image_to_string(self, image):
+        """
+        Extract the text from a decoded document image.
+
+        Args:
+            image (np.ndarray): Decoded BGR (or grayscale) image.
+
+        Returns:
+            str: Extracted text.
+        """
+        # Deferred so importing the app doesn't pay for pytesseract's imports
+        import pytesseract
+
+        if not self.settings['preprocess']:
+            rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB) if image.ndim == 3 else image
+            return pytesseract.image_to_string(rgb, lang=self.lang, config=self.tesseract_config())
+
+        gray, dpi = self.prepare(image)
+
+        if self.settings['zones_only'] and self.zones:
+            crops = self.zone_crops(gray)
+        elif self.settings['regions']:
+            crops = self.text_region_crops(gray)
+        else:
+            crops = []
+
+        if crops:
+            page = self.pack_regions([self.binarize(crop) for crop in crops])
+            # Each packed crop is a line or block of text stacked top to bottom
+            return pytesseract.image_to_string(page, lang=self.lang, config=self.tesseract_config(dpi, psm=6))
+        return pytesseract.image_to_string(self.binarize(gray), lang=self.lang,
+                                           config=self.tesseract_config(dpi))
+
+    def prepare(self, image):
+        """
+        Convert to grayscale and rescale to the target resolution.
+
+        Args:
+            image (np.ndarray): Decoded BGR (or grayscale) image.
+
+        Returns:
+            tuple: (grayscale image, its estimated DPI)
+        """
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+        dpi = max(gray.shape[:2]) / self.page_inches
+        target_dpi = self.settings['target_dpi']
+        if target_dpi and dpi > target_dpi * 1.1:
+            scale = target_dpi / dpi
+            # INTER_AREA averages the dropped pixels, keeping strokes legible
+            gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+            dpi = target_dpi
+        return gray, dpi
+
+    def binarize(self, gray):
+        """Threshold a grayscale image to black text on white using Otsu's method."""
+        _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+        # Keep dark text on a light background, which is what Tesseract expects
+        if np.count_nonzero(binary) < binary.size // 2:
+            binary = cv2.bitwise_not(binary)
+        return binary
+
+    def text_region_crops(self, gray, max_regions=200):
+        """
+        Find text lines with morphological filtering and return them as crops.
+
+        Args:
+            gray (np.ndarray): Grayscale page.
+            max_regions (int): Upper bound on the number of regions returned.
+
+        Returns:
+            list: Grayscale crops in reading order; empty if no text was found.
+        """
+        height, width = gray.shape[:2]
+        # Character strokes have strong local gradients; flat backgrounds and photos mostly don't
+        gradient = cv2.morphologyEx(gray, cv2.MORPH_GRADIENT, cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3)))
+        _, mask = cv2.threshold(gradient, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+        # Join characters of a line into one blob
+        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (max(width // 60, 9), 1))
+        lines = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
+        contours, _ = cv2.findContours(lines, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+        boxes = []
+        min_height = max(height // 400, 6)
+        max_height = height // 8
+        for contour in contours:
+            x, y, w, h = cv2.boundingRect(contour)
+            if not (min_height <= h <= max_height) or w < h:
+                continue
+            fill = cv2.countNonZero(mask[y:y + h, x:x + w]) / float(w * h)
+            if fill < 0.15:
+                continue
+            boxes.append((x, y, w, h))
+
+        boxes.sort(key=lambda box: (box[1], box[0]))
+        pad = 4
+        return [gray[max(y - pad, 0):y + h + pad, max(x - pad, 0):x + w + pad]
+                for x, y, w, h in boxes[:max_regions]]
+
+    def zone_crops(self, gray):
+        """Return crops for the configured metadata zones."""
+        height, width = gray.shape[:2]
+        crops = []
+        for field, (x0, y0, x1, y1) in self.zones.items():
+            crop = gray[int(y0 * height):int(y1 * height), int(x0 * width):int(x1 * width)]
+            if crop.size:
+                crops.append(crop)
+            else:
+                logger.warning(f"OCR zone for {field} is empty at {width}x{height}")
+        return crops
+
+    def pack_regions(self, crops, gap=12):
+        """
+        Stack crops vertically on a white canvas so one Tesseract call reads all of them.
+
+        Args:
+            crops (list): Binarized crops.
+            gap (int): White space between crops, in pixels.
+
+        Returns:
+            np.ndarray: The packed grayscale image.
+        """
+        width = max(crop.shape[1] for crop in crops) + 2 * gap
+        height = sum(crop.shape[0] for crop in crops) + gap * (len(crops) + 1)
+        canvas = np.full((height, width), 255, dtype=np.uint8)
+        y = gap
+        for crop in crops:
+            h, w = crop.shape[:2]
+            canvas[y:y + h, gap:gap + w] = crop
+            y += h + gap
+        return canvas
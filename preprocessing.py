@@ -0,0 +1,146 @@
+"""
+Model input preprocessing.
+
+Turns a decoded BGR image into the model's float32 input in one pass over the
+resized pixels. An optional region of interest is cropped as a view, the crop
+is resized as uint8 into a per-thread scratch buffer, and a single numpy
+multiply does the channel reordering and the scaling to [0, 1] while writing
+straight into the destination. With a preallocated destination, steady-state
+preprocessing allocates nothing. Aspect-preserving letterboxing pads the
+resized image instead of stretching it.
+
+Dividing the resized uint8 array by 255.0 instead, as the detector used to,
+allocates a float64 copy at 8 bytes per channel, which the model then casts
+to float32 in a second copy.
+"""
+import threading
+
+import cv2
+import numpy as np
+
+INPUT_SIZE = (224, 224)
+COLOR_ORDERS = ('bgr', 'rgb')
+
+
+class Preprocessor:
+    """Resizes, reorders and normalizes decoded images into model input buffers."""
+
+    def __init__(self, size=INPUT_SIZE, color_order='bgr', letterbox=False, pad_value=0, roi=None):
+        """
+        Args:
+            size (tuple): Model input (width, height).
+            color_order (str): Channel order the model expects: 'bgr', as OpenCV decodes
+                (and as the bundled model was trained), or 'rgb'.
+            letterbox (bool): Keep the aspect ratio, centring the resized image and
+                padding the rest, instead of stretching it to size.
+            pad_value (int): Grey level, 0-255, of the letterbox padding.
+            roi (tuple): Default region of interest, (x0, y0, x1, y1) as fractions of
+                the image width and height; None uses the whole image.
+        """
+        if color_order not in COLOR_ORDERS:
+            raise ValueError(f"Unknown color order '{color_order}'; expected one of {COLOR_ORDERS}")
+        self.size = tuple(size)
+        self.shape = (self.size[1], self.size[0], 3)
+        self.color_order = color_order
+        self.letterbox = letterbox
+        self.pad = np.float32(pad_value / 255.0)
+        self.roi = _check_roi(roi) if roi is not None else None
+        self._scale = np.float32(1.0 / 255.0)
+        self._local = threading.local()
+
+    def __call__(self, image, out=None, roi=None):
+        """
+        Preprocess one decoded image.
+
+        Args:
+            image (np.ndarray): Decoded uint8 BGR image (greyscale and BGRA are converted).
+            out (np.ndarray): float32 array of self.shape to write into, e.g. a row of a
+                preallocated batch; a new array is allocated when None.
+            roi (tuple): Region of interest overriding the default, as page fractions.
+
+        Returns:
+            np.ndarray: out, holding the model input in [0, 1].
+        """
+        if out is None:
+            out = np.empty(self.shape, dtype=np.float32)
+        if image.ndim == 2:
+            image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+        elif image.shape[2] == 4:
+            image = cv2.cvtColor(image, cv2.COLOR_BGRA2BGR)
+
+        roi = _check_roi(roi) if roi is not None else self.roi
+        if roi is not None:
+            height, width = image.shape[:2]
+            x0, y0, x1, y1 = roi
+            top, left = int(y0 * height), int(x0 * width)
+            # A view: nothing is copied before the resize
+            image = image[top:max(int(round(y1 * height)), top + 1), left:max(int(round(x1 * width)), left + 1)]
+
+        target = out
+        width, height = self.size
+        if self.letterbox:
+            scale = min(width / image.shape[1], height / image.shape[0])
+            resized_width = max(1, min(width, int(round(image.shape[1] * scale))))
+            resized_height = max(1, min(height, int(round(image.shape[0] * scale))))
+            left = (width - resized_width) // 2
+            top = (height - resized_height) // 2
+            # Only the borders are padded; the image region is written below
+            out[:top] = self.pad
+            out[top + resized_height:] = self.pad
+            out[top:top + resized_height, :left] = self.pad
+            out[top:top + resized_height, left + resized_width:] = self.pad
+            target = out[top:top + resized_height, left:left + resized_width]
+            width, height = resized_width, resized_height
+
+        resized = cv2.resize(image, (width, height), dst=self._scratch(width, height))
+        if self.color_order == 'rgb':
+            resized = resized[..., ::-1]
+        np.multiply(resized, self._scale, out=target)
+        return out
+
+    def thread_buffer(self):
+        """
+        Return this thread's reusable input buffer.
+
+        Its contents are only valid until the thread preprocesses its next image,
+        so it suits callers that block until the model has read it.
+
+        Returns:
+            np.ndarray: float32 array of self.shape.
+        """
+        buffer = getattr(self._local, 'input', None)
+        if buffer is None:
+            buffer = self._local.input = np.empty(self.shape, dtype=np.float32)
+        return buffer
+
+    def thread_batch_buffer(self, count):
+        """
+        Return this thread's reusable buffer for a batch of inputs, e.g. the tiles of one image.
+
+        The buffer only grows, to the largest batch the thread has needed, and, like
+        thread_buffer(), is overwritten by the thread's next batch.
+
+        Args:
+            count (int): Inputs in the batch.
+
+        Returns:
+            np.ndarray: float32 array of (count,) + self.shape.
+        """
+        buffer = getattr(self._local, 'batch', None)
+        if buffer is None or len(buffer) < count:
+            buffer = self._local.batch = np.empty((count,) + self.shape, dtype=np.float32)
+        return buffer[:count]
+
+    def _scratch(self, width, height):
+        """A contiguous uint8 (height, width, 3) view of this thread's resize buffer."""
+        scratch = getattr(self._local, 'scratch', None)
+        if scratch is None:
+            scratch = self._local.scratch = np.empty(self.shape, dtype=np.uint8)
+        return scratch.ravel()[:height * width * 3].reshape(height, width, 3)
+
+
+def _check_roi(roi):
+    x0, y0, x1, y1 = (float(value) for value in roi)
+    if not (0 <= x0 < x1 <= 1 and 0 <= y0 < y1 <= 1):
+        raise ValueError(f"Region of interest {roi} must be (x0, y0, x1, y1) fractions with x0 < x1 and y0 < y1")
+    return x0, y0, x1, y1
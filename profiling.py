@@ -0,0 +1,281 @@
+"""
+Per-request sampling profiler for slow verifications.
+
+Aggregate stage metrics show that a request was slow, not why: TensorFlow,
+OpenCV and Tesseract each react differently to the image in front of them. A
+profiled request records where its threads spend wall-clock time, the request
+thread and whichever stage-pool threads are working for it, by sampling their
+Python stacks every interval_ms from one background thread. Time inside
+native code is charged to the Python call that entered it (cv2.resize, the
+Keras call, the wait on the tesseract subprocess), which is enough to tell
+the stages apart.
+
+A request is profiled when the caller asks for it, when it is the Nth since
+the last sampled one, or, with slow_ms set, always, keeping only the profiles
+of requests that ran over the threshold. Each saved profile is a pair of
+files in output_dir:
+
+    <name>.folded  Stacks in the folded format ("frame;frame;frame count"),
+                   readable by flamegraph.pl, inferno and speedscope.
+    <name>.json    Why it was captured, per-stage timings, image size and
+                   format, and the sampling interval.
+
+Only the newest max_files profiles are kept.
+
+Stage-pool tasks inherit the profile of the thread that submits them when
+wrapped with bind().
+"""
+import functools
+import itertools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+PROFILES_SAVED = metrics.Counter('verify_profiles_saved', 'Request profiles written to disk', ['reason'])
+
+_local = threading.local()
+
+
+def current():
+    """Return the profile session the calling thread is working for, or None."""
+    return getattr(_local, 'session', None)
+
+
+def annotate(**info):
+    """Attach facts about the request, e.g. image size, to the calling thread's profile, if any."""
+    session = current()
+    if session is not None:
+        session.info.update(info)
+
+
+def bind(fn):
+    """Wrap fn so that, run on another thread, it is sampled as part of the calling thread's profile."""
+    session = current()
+    if session is None:
+        return fn
+    return functools.partial(session.run, fn)
+
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(';', ':')
+
+
+class Session:
+    """The samples and annotations of one profiled request."""
+
+    def __init__(self, reason):
+        self.id = uuid.uuid4().hex[:12]
+        self.reason = reason
+        self.started_at = time.time()
+        self.info = {}
+        self.stacks = {}
+        self.samples = 0
+        self.closed = False
+        # {thread ident: role}; the role becomes the root frame of its stacks
+        self.threads = {}
+        self._lock = threading.Lock()
+
+    def attach(self, role):
+        """Start sampling the calling thread for this request."""
+        with self._lock:
+            self.threads[threading.get_ident()] = role
+        _local.session = self
+
+    def detach(self):
+        with self._lock:
+            self.threads.pop(threading.get_ident(), None)
+        _local.session = None
+
+    def run(self, fn, *args, **kwargs):
+        """Run fn on the calling (stage-pool) thread, sampled as part of this request."""
+        self.attach('stage')
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.detach()
+
+    def sample(self, frames):
+        """Record the current stack of every attached thread."""
+        with self._lock:
+            if self.closed:
+                return
+            for ident, role in self.threads.items():
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                labels.append(role)
+                stack = ';'.join(reversed(labels))
+                self.stacks[stack] = self.stacks.get(stack, 0) + 1
+            self.samples += 1
+
+    def close(self):
+        """Stop taking samples; the stacks don't change after this."""
+        with self._lock:
+            self.closed = True
+
+
+class Profiler:
+    """Decides which requests to profile, samples them, and saves their profiles with rotation."""
+
+    def __init__(self, output_dir='profiles', interval_ms=5, sample_every=0, slow_ms=None, max_files=200):
+        """
+        Args:
+            output_dir (str): Directory the profiles are written to.
+            interval_ms (float): Time between stack samples.
+            sample_every (int): Profile one request in this many; 0 disables sampling.
+            slow_ms (float): If set, profile every request and keep the profiles of
+                those that took at least this long. Sampling then runs whenever a
+                request is in flight, which costs a little CPU.
+            max_files (int): Profiles kept; the oldest are deleted.
+        """
+        self.output_dir = output_dir
+        self.interval = interval_ms / 1000.0
+        self.sample_every = sample_every
+        self.slow_ms = slow_ms
+        self.max_files = max_files
+        self._counter = itertools.count(1)
+        self._active = set()
+        self._cond = threading.Condition()
+        self._sampler = None
+
+    def begin(self, forced=False):
+        """
+        Start profiling the calling thread's request, if it should be profiled.
+
+        Args:
+            forced (bool): Profile it regardless of sampling, e.g. on the caller's request.
+
+        Returns:
+            Session: The request's profile, or None if it isn't profiled.
+        """
+        if forced:
+            reason = 'requested'
+        elif self.sample_every and next(self._counter) % self.sample_every == 0:
+            reason = 'sampled'
+        elif self.slow_ms is not None:
+            reason = 'slow'
+        else:
+            return None
+
+        session = Session(reason)
+        session.attach('request')
+        with self._cond:
+            self._active.add(session)
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+                self._sampler.start()
+            self._cond.notify()
+        return session
+
+    def end(self, session, timings, error=None):
+        """
+        Stop profiling a request and save its profile if it is worth keeping.
+
+        Args:
+            session (Session): begin() result.
+            timings (dict): The request's per-stage durations in ms.
+            error (str): The error the request failed with, if any.
+
+        Returns:
+            str: Path of the saved .folded file, or None if the profile was discarded.
+        """
+        session.detach()
+        session.close()
+        with self._cond:
+            self._active.discard(session)
+        total_ms = (time.time() - session.started_at) * 1000
+        if session.reason == 'slow' and total_ms < self.slow_ms:
+            return None
+        try:
+            return self._save(session, timings, total_ms, error)
+        except OSError as e:
+            logger.error(f"Failed to save profile {session.id}: {str(e)}")
+            return None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._active:
+                    self._cond.wait()
+                sessions = list(self._active)
+            frames = sys._current_frames()
+            for session in sessions:
+                session.sample(frames)
+            del frames
+            time.sleep(self.interval)
+
+    def _save(self, session, timings, total_ms, error):
+        os.makedirs(self.output_dir, exist_ok=True)
+        stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(session.started_at))
+        name = f"{stamp}-{session.id}-{session.reason}-{int(total_ms)}ms"
+        base = os.path.join(self.output_dir, name)
+        with open(base + '.folded', 'w', encoding='utf-8') as f:
+            for stack, count in sorted(session.stacks.items()):
+                f.write(f"{stack} {count}\n")
+        with open(base + '.json', 'w', encoding='utf-8') as f:
+            json.dump({
+                'id': session.id,
+                'name': name,
+                'reason': session.reason,
+                'started_at': session.started_at,
+                'total_ms': round(total_ms, 3),
+                'interval_ms': self.interval * 1000,
+                'samples': session.samples,
+                'timings': timings,
+                'image': session.info,
+                'error': error,
+            }, f, indent=2)
+        PROFILES_SAVED.labels(session.reason).inc()
+        logger.info(f"Saved {session.reason} profile of a {total_ms:.0f} ms request to {base}.folded")
+        self._rotate()
+        return base + '.folded'
+
+    def _rotate(self):
+        """Delete the oldest profiles beyond max_files."""
+        names = sorted(name[:-len('.json')] for name in os.listdir(self.output_dir) if name.endswith('.json'))
+        for name in names[:max(0, len(names) - self.max_files)]:
+            for extension in ('.folded', '.json'):
+                try:
+                    os.remove(os.path.join(self.output_dir, name + extension))
+                except FileNotFoundError:
+                    pass
+
+    def list(self, limit=50):
+        """
+        Describe the newest saved profiles.
+
+        Returns:
+            list: The .json sidecars of up to limit profiles, newest first.
+        """
+        if not os.path.isdir(self.output_dir):
+            return []
+        names = sorted((name for name in os.listdir(self.output_dir) if name.endswith('.json')), reverse=True)
+        profiles = []
+        for name in names[:limit]:
+            try:
+                with open(os.path.join(self.output_dir, name), encoding='utf-8') as f:
+                    profiles.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return profiles
+
+    def find(self, profile_id):
+        """Return the path of the .folded file of a saved profile, or None."""
+        if not os.path.isdir(self.output_dir):
+            return None
+        for name in os.listdir(self.output_dir):
+            if name.endswith('.folded') and name.split('-')[2] == profile_id:
+                return os.path.join(self.output_dir, name)
+        return None
@@ -0,0 +1,270 @@
+import copy
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def file_fingerprint(path, chunk_size=1 << 20):
+    """
+    Compute a content fingerprint for a model file or SavedModel directory.
+
+    Args:
+        path (str): Path to the model file or directory.
+        chunk_size (int): Read size used while hashing.
+
+    Returns:
+        str: Hex digest identifying the model contents, or "no-model" if the path is missing.
+    """
+    if not os.path.exists(path):
+        return "no-model"
+
+    digest = hashlib.sha256()
+    if os.path.isdir(path):
+        files = sorted(os.path.join(root, name)
+                       for root, _, names in os.walk(path) for name in names)
+    else:
+        files = [path]
+
+    for file_path in files:
+        digest.update(os.path.relpath(file_path, path).encode('utf-8'))
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+class VerificationCache:
+    """A content-addressed LRU/TTL cache for verification results with an optional disk tier."""
+
+    def __init__(self, max_entries=1024, ttl_seconds=3600, disk_dir=None, namespace="", disk_max_entries=100000):
+        """
+        Initialize the verification cache.
+
+        Args:
+            max_entries (int): Maximum number of results held in memory.
+            ttl_seconds (float): Seconds before a cached result expires; 0 disables expiry.
+            disk_dir (str): Optional directory for a persistent second tier.
+            namespace (str): Mixed into every key, e.g. the model fingerprint, so that
+                results computed by a different model are never returned.
+            disk_max_entries (int): Results kept in the disk tier. Every tenth of this many
+                writes, a background sweep deletes expired files and then the oldest
+                beyond the limit, so the directory stays within about 10% of it (per
+                process sharing it).
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_dir = disk_dir
+        self.disk_max_entries = disk_max_entries
+        self.namespace = namespace
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_writes = 0
+        self._sweeper = None
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'disk_hits': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'disk_evictions': 0,
+        }
+
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            # Whatever earlier runs left behind is swept once at startup
+            self._start_sweep()
+
+    def key_for(self, content_digest, namespace=None):
+        """
+        Build the cache key for an uploaded document.
+
+        Args:
+            content_digest (str): SHA-256 hex digest of the encoded document bytes,
+                which the caller has already computed, so the upload is hashed once.
+            namespace (str): Overrides the cache's namespace, e.g. with the fingerprint
+                of the model version that scores this request.
+
+        Returns:
+            str: Hex digest of the namespace and the document's content digest.
+        """
+        namespace = self.namespace if namespace is None else namespace
+        digest = hashlib.sha256(namespace.encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(content_digest.encode('ascii'))
+        return digest.hexdigest()
+
+    def get(self, key):
+        """
+        Look up a cached result.
+
+        Args:
+            key (str): Key returned by key_for().
+
+        Returns:
+            dict: A copy of the cached result, or None on a miss.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, result = entry
+                if self._is_fresh(stored_at, now):
+                    self._entries.move_to_end(key)
+                    self.stats['hits'] += 1
+                    return copy.deepcopy(result)
+                del self._entries[key]
+                self.stats['expirations'] += 1
+
+        entry = self._read_disk(key, now)
+        with self._lock:
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+            stored_at, result = entry
+            self.stats['hits'] += 1
+            self.stats['disk_hits'] += 1
+            self._store(key, stored_at, result)
+        return copy.deepcopy(result)
+
+    def put(self, key, result):
+        """
+        Store a verification result.
+
+        Args:
+            key (str): Key returned by key_for().
+            result (dict): JSON-serializable verification result.
+        """
+        stored_at = time.time()
+        result = copy.deepcopy(result)
+        with self._lock:
+            self._store(key, stored_at, result)
+        self._write_disk(key, stored_at, result)
+        if self.disk_dir:
+            with self._lock:
+                self._disk_writes += 1
+                due = self._disk_writes >= max(1, self.disk_max_entries // 10)
+                if due:
+                    self._disk_writes = 0
+            if due:
+                self._start_sweep()
+
+    def clear(self):
+        """Drop every in-memory entry; the disk tier is left intact."""
+        with self._lock:
+            self._entries.clear()
+
+    def snapshot(self):
+        """Return the current counters together with the in-memory size."""
+        with self._lock:
+            stats = dict(self.stats)
+            stats['entries'] = len(self._entries)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+    def _is_fresh(self, stored_at, now):
+        return not self.ttl_seconds or now - stored_at < self.ttl_seconds
+
+    def _store(self, key, stored_at, result):
+        """Insert an entry and evict least recently used ones; caller holds the lock."""
+        self._entries[key] = (stored_at, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats['evictions'] += 1
+
+    def _disk_path(self, key):
+        # Fan out by prefix so a large cache doesn't put everything in one directory
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+
+    def _read_disk(self, key, now):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Discarding unreadable cache entry {path}: {str(e)}")
+            self._remove_disk(path)
+            return None
+
+        if not self._is_fresh(entry['stored_at'], now):
+            with self._lock:
+                self.stats['expirations'] += 1
+            self._remove_disk(path)
+            return None
+        return entry['stored_at'], entry['result']
+
+    def _write_disk(self, key, stored_at, result):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'stored_at': stored_at, 'result': result}, f)
+            # Atomic rename so concurrent readers never see a partial file
+            os.replace(tmp_path, path)
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"Could not persist cache entry {key}: {str(e)}")
+            self._remove_disk(tmp_path)
+
+    def _start_sweep(self):
+        """Sweep the disk tier on a background thread, unless a sweep is already running."""
+        with self._lock:
+            if self._sweeper is not None and self._sweeper.is_alive():
+                return
+            self._sweeper = threading.Thread(target=self.sweep_disk, name="cache-disk-sweeper", daemon=True)
+            self._sweeper.start()
+
+    def sweep_disk(self):
+        """
+        Delete expired disk entries, then the least recently written beyond disk_max_entries.
+
+        Returns:
+            int: Files deleted.
+        """
+        now = time.time()
+        entries = []
+        try:
+            for shard in os.scandir(self.disk_dir):
+                if not shard.is_dir():
+                    continue
+                for entry in os.scandir(shard.path):
+                    if entry.name.endswith('.json'):
+                        try:
+                            entries.append((entry.stat().st_mtime, entry.path))
+                        except FileNotFoundError:
+                            pass
+        except OSError as e:
+            logger.warning(f"Could not sweep cache directory {self.disk_dir}: {str(e)}")
+            return 0
+
+        # A file is written when its result is stored, so its mtime is the result's age
+        expired = [path for mtime, path in entries if not self._is_fresh(mtime, now)]
+        fresh = sorted((mtime, path) for mtime, path in entries if self._is_fresh(mtime, now))
+        evicted = [path for _, path in fresh[:max(0, len(fresh) - self.disk_max_entries)]]
+        for path in expired + evicted:
+            self._remove_disk(path)
+        with self._lock:
+            self.stats['expirations'] += len(expired)
+            self.stats['disk_evictions'] += len(evicted)
+        if expired or evicted:
+            logger.info(f"Cache sweep deleted {len(expired)} expired and {len(evicted)} evicted disk entries")
+        return len(expired) + len(evicted)
+
+    def _remove_disk(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
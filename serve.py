@@ -0,0 +1,228 @@
+"""
+Production entry point for the document verification service.
+
+Runs N worker processes that share one listening socket. Each worker loads its
+own DocumentAuthenticityDetector, and TensorFlow, OpenCV and Tesseract threading
+is capped per process so the workers together don't oversubscribe the cores.
+Workers serve HTTP with waitress, which buffers request bodies before the app
+sees them, closes idle and stalled connections after --channel-timeout, and
+stops accepting beyond --connection-limit connections.
+
+Sending the master SIGHUP makes every worker hot-reload its model: the new
+version loads in the background and takes over once warm, while in-flight
+requests finish on the old one.
+
+Metrics are kept per worker, so /metrics on the shared port only shows the
+worker that happened to accept the scrape. With --metrics-bind host:port,
+worker N (from 0) also serves its own metrics on port + N; scrape each of
+those ports as a separate Prometheus target. A restarted worker reuses its
+predecessor's port, and its counters restart from zero like any restarted
+process.
+
+Usage:
+    python serve.py --bind 0.0.0.0:5000 --workers 8 --intra-op-threads 4 --metrics-bind 127.0.0.1:9100
+    kill -HUP <master pid>
+"""
+import argparse
+import logging
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def parse_args(argv=None):
+    cpu_count = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="Serve the document verification app with multiple worker processes")
+    parser.add_argument('--bind', default='127.0.0.1:5000', help="host:port to listen on")
+    parser.add_argument('--workers', type=int, default=cpu_count,
+                        help="number of worker processes (default: one per core)")
+    parser.add_argument('--intra-op-threads', type=int, default=None,
+                        help="TensorFlow intra-op threads per worker (default: cores / workers)")
+    parser.add_argument('--inter-op-threads', type=int, default=1,
+                        help="TensorFlow inter-op threads per worker")
+    parser.add_argument('--omp-thread-limit', type=int, default=1,
+                        help="OMP_THREAD_LIMIT for Tesseract processes started by a worker")
+    parser.add_argument('--backlog', type=int, default=2048, help="listen backlog of the shared socket")
+    parser.add_argument('--threads', type=int, default=None,
+                        help="request threads per worker (default: the app's ADMISSION_MAX_CONCURRENT "
+                             "+ ADMISSION_MAX_QUEUE)")
+    parser.add_argument('--connection-limit', type=int, default=1000,
+                        help="open connections per worker; more wait in the listen backlog")
+    parser.add_argument('--channel-timeout', type=int, default=60,
+                        help="seconds an idle or stalled connection is kept open")
+    parser.add_argument('--metrics-bind', default=None,
+                        help="host:port of worker 0's metrics; worker N serves its own on port + N")
+    parser.add_argument('--worker-fd', type=int, default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--worker-index', type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.intra_op_threads is None:
+        args.intra_op_threads = max(1, cpu_count // args.workers)
+    return args
+
+
+def thread_environment(args):
+    """
+    Build the environment that caps native thread pools in a worker.
+
+    Args:
+        args (argparse.Namespace): Parsed command-line arguments.
+
+    Returns:
+        dict: Environment variables for the worker process.
+    """
+    env = dict(os.environ)
+    env.update({
+        'TF_NUM_INTRAOP_THREADS': str(args.intra_op_threads),
+        'TF_NUM_INTEROP_THREADS': str(args.inter_op_threads),
+        'OMP_NUM_THREADS': str(args.intra_op_threads),
+        # Inherited by every tesseract subprocess pytesseract spawns
+        'OMP_THREAD_LIMIT': str(args.omp_thread_limit),
+    })
+    return env
+
+
+def run_worker(args):
+    """Load the app in this process and serve requests on the inherited socket."""
+    # Installed before the app is imported, which takes seconds: a reload sent meanwhile
+    # must not kill the worker with SIGHUP's default action
+    state = {'detector': None, 'reload_pending': False}
+
+    def reload(signum, frame):
+        if state['detector'] is None:
+            state['reload_pending'] = True
+        else:
+            state['detector'].reload_model()
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    signal.signal(signal.SIGHUP, reload)
+
+    # Applied when the detector first imports TensorFlow, before its runtime starts
+    from inference_backends import configure_tensorflow_threads
+    configure_tensorflow_threads(intra_op=args.intra_op_threads, inter_op=args.inter_op_threads)
+    import cv2
+    cv2.setNumThreads(args.intra_op_threads)
+
+    from waitress.server import create_server
+    import document_verification_app as app_module
+    import metrics
+    if args.metrics_bind:
+        metrics_host, metrics_port = args.metrics_bind.rsplit(':', 1)
+        metrics_port = int(metrics_port) + args.worker_index
+        metrics.start_http_server(metrics_port, metrics_host)
+        logger.info(f"Worker {os.getpid()} serving its metrics on {metrics_host}:{metrics_port}")
+    app = app_module.create_app()
+    state['detector'] = app_module.detector
+    if state['reload_pending']:
+        app_module.detector.reload_model()
+
+    # Enough threads for every request admission control runs or queues, so the
+    # queueing and shedding happen there and not in front of the app
+    threads = args.threads or app.config['ADMISSION_MAX_CONCURRENT'] + app.config['ADMISSION_MAX_QUEUE']
+    server = create_server(app,
+                           sockets=[socket.socket(fileno=args.worker_fd)],
+                           threads=threads,
+                           connection_limit=args.connection_limit,
+                           channel_timeout=args.channel_timeout,
+                           max_request_body_size=app.config['MAX_CONTENT_LENGTH'],
+                           ident='document-verification')
+    logger.info(f"Worker {os.getpid()} serving on {args.bind} with {threads} threads "
+                f"(intra-op={args.intra_op_threads}, inter-op={args.inter_op_threads}, "
+                f"omp-limit={args.omp_thread_limit})")
+    try:
+        server.run()
+    finally:
+        server.close()
+
+
+def open_listener(bind, backlog):
+    host, port = bind.rsplit(':', 1)
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, int(port)))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def spawn_worker(args, fd, env, index):
+    command = [sys.executable, os.path.abspath(__file__),
+               '--bind', args.bind,
+               '--intra-op-threads', str(args.intra_op_threads),
+               '--inter-op-threads', str(args.inter_op_threads),
+               '--omp-thread-limit', str(args.omp_thread_limit),
+               '--connection-limit', str(args.connection_limit),
+               '--channel-timeout', str(args.channel_timeout),
+               '--worker-fd', str(fd),
+               '--worker-index', str(index)]
+    if args.threads:
+        command += ['--threads', str(args.threads)]
+    if args.metrics_bind:
+        command += ['--metrics-bind', args.metrics_bind]
+    return subprocess.Popen(command, pass_fds=(fd,), env=env)
+
+
+def run_master(args):
+    """Open the shared socket, start the workers and restart any that exit."""
+    listener = open_listener(args.bind, args.backlog)
+    env = thread_environment(args)
+    workers = [spawn_worker(args, listener.fileno(), env, index) for index in range(args.workers)]
+    logger.info(f"Started {args.workers} workers on {args.bind}")
+    if args.workers > 1 and not args.metrics_bind:
+        logger.warning("Without --metrics-bind, /metrics reports whichever worker answers the scrape")
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    def reload(signum, frame):
+        logger.info("Reloading the model in every worker")
+        for worker in workers:
+            if worker.poll() is None:
+                worker.send_signal(signal.SIGHUP)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGHUP, reload)
+
+    try:
+        while not stopping:
+            for i, worker in enumerate(workers):
+                if worker.poll() is not None:
+                    logger.warning(f"Worker {worker.pid} exited with {worker.returncode}; restarting")
+                    workers[i] = spawn_worker(args, listener.fileno(), env, i)
+            time.sleep(1.0)
+    finally:
+        logger.info("Shutting down workers")
+        for worker in workers:
+            if worker.poll() is None:
+                worker.terminate()
+        for worker in workers:
+            try:
+                worker.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                worker.kill()
+        listener.close()
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.worker_fd is not None:
+        run_worker(args)
+    else:
+        run_master(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+import threading
+import time
+
+import pytest
+
+from admission import AdmissionController, AdmissionRejected
+
+
+def test_lane_header_is_ignored_without_priority_networks():
+    controller = AdmissionController()
+    assert controller.lane_for('interactive', 'batch', '10.0.0.5') == 'batch'
+
+
+def test_priority_networks_may_choose_their_lane():
+    controller = AdmissionController(priority_networks=['10.0.0.0/8', '::1'])
+    assert controller.lane_for('interactive', 'batch', '10.1.2.3') == 'interactive'
+    assert controller.lane_for('interactive', 'batch', '::1') == 'interactive'
+    assert controller.lane_for('interactive', 'batch', '192.168.1.1') == 'batch'
+    assert controller.lane_for('interactive', 'batch', None) == 'batch'
+    assert controller.lane_for('interactive', 'batch', 'not an address') == 'batch'
+    assert controller.lane_for('express', 'batch', '10.1.2.3') == 'batch'
+    assert controller.lane_for(None, 'batch', '10.1.2.3') == 'batch'
+
+
+def test_invalid_priority_network_is_refused():
+    with pytest.raises(ValueError):
+        AdmissionController(priority_networks=['not a network'])
+
+
+def test_full_queue_is_refused_with_retry_after():
+    decisions = []
+    controller = AdmissionController(max_concurrent=1, max_queue=0,
+                                     on_decision=lambda lane, outcome: decisions.append((lane, outcome)))
+    with controller.admit('batch'):
+        with pytest.raises(AdmissionRejected) as excinfo:
+            with controller.admit('batch'):
+                pass
+    assert excinfo.value.status_code == 429
+    assert excinfo.value.retry_after >= 1
+    assert decisions == [('batch', 'admitted'), ('batch', 'rejected')]
+
+
+def test_per_client_queue_limit():
+    controller = AdmissionController(max_concurrent=1, max_queue=10, max_queued_per_client=1)
+    release = threading.Event()
+    started = threading.Event()
+
+    def hold():
+        with controller.admit('batch', client='a'):
+            started.set()
+            release.wait(5)
+
+    def wait_in_queue():
+        with controller.admit('batch', client='b'):
+            pass
+
+    holder = threading.Thread(target=hold)
+    holder.start()
+    started.wait(5)
+    waiter = threading.Thread(target=wait_in_queue)
+    waiter.start()
+    while controller.queued() < 1:
+        time.sleep(0.01)
+    with pytest.raises(AdmissionRejected):
+        controller.check('batch', client='b')
+    controller.check('batch', client='c')
+    release.set()
+    holder.join(5)
+    waiter.join(5)
+
+
+def test_interactive_lane_is_served_before_batch():
+    controller = AdmissionController(max_concurrent=1, max_queue=10)
+    order = []
+    release = threading.Event()
+    started = threading.Event()
+
+    def hold():
+        with controller.admit('batch'):
+            started.set()
+            release.wait(5)
+
+    def run(lane):
+        with controller.admit(lane):
+            order.append(lane)
+
+    holder = threading.Thread(target=hold)
+    holder.start()
+    started.wait(5)
+    threads = [threading.Thread(target=run, args=(lane,)) for lane in ('batch', 'interactive')]
+    for thread in threads:
+        thread.start()
+        while controller.queued() < threads.index(thread) + 1:
+            time.sleep(0.01)
+    release.set()
+    for thread in [holder] + threads:
+        thread.join(5)
+    assert order == ['interactive', 'batch']
+
+
+def test_request_expires_while_queued():
+    controller = AdmissionController(max_concurrent=1, max_queue=10)
+    with controller.admit('batch'):
+        with pytest.raises(AdmissionRejected) as excinfo:
+            with controller.admit('batch', deadline=time.monotonic() + 0.05):
+                pass
+    assert excinfo.value.status_code == 503
+    assert controller.queued() == 0
+
+
+def test_unknown_lane_is_an_error():
+    controller = AdmissionController()
+    with pytest.raises(ValueError):
+        with controller.admit('express'):
+            pass
@@ -0,0 +1,93 @@
+import sqlite3
+import threading
+
+import pytest
+
+from audit_store import AuditStore
+
+
+def make_result(document_id, score=0.9, authentic=True):
+    return {
+        'is_authentic': authentic,
+        'partial': False,
+        'visual_analysis': {'authenticity_score': score},
+        'text_extraction': {'metadata': {'document_id': document_id, 'issue_date': '2024-01-02'}},
+    }
+
+
+@pytest.fixture
+def store(tmp_path):
+    return AuditStore(str(tmp_path / 'audit.sqlite3'))
+
+
+def test_record_and_get(store):
+    store.record(make_result('A1'), digest='d1', model_version='m@1', filename='a.png', source='verify')
+    assert store.flush(5)
+    assert store.written == 1
+    item = store.query()['items'][0]
+    assert item['document_id'] == 'A1'
+    assert item['digest'] == 'd1'
+    assert item['is_authentic'] is True
+    assert item['metadata']['issue_date'] == '2024-01-02'
+    record = store.get(item['id'])
+    assert record['result']['visual_analysis']['authenticity_score'] == 0.9
+    assert store.get(item['id'] + 1) is None
+
+
+def test_query_filters_and_pages(store):
+    for i in range(5):
+        store.record(make_result(f'A{i % 2}', authentic=i % 2 == 0), digest=f'd{i}')
+    assert store.flush(5)
+    assert store.count() == 5
+    assert len(store.query(document_id='A0')['items']) == 3
+    assert [item['digest'] for item in store.query(is_authentic=False)['items']] == ['d3', 'd1']
+
+    first = store.query(limit=2)
+    second = store.query(limit=2, cursor=first['next_cursor'])
+    third = store.query(limit=2, cursor=second['next_cursor'])
+    digests = [item['digest'] for page in (first, second, third) for item in page['items']]
+    assert digests == ['d4', 'd3', 'd2', 'd1', 'd0']
+    assert third['next_cursor'] is None
+
+
+def test_unserializable_record_does_not_drop_its_batch(store):
+    bad = make_result('B')
+    bad['extra'] = object()
+    store.record(make_result('A'), digest='good-1')
+    store.record(bad, digest='bad')
+    store.record(make_result('C'), digest='good-2')
+    assert store.flush(5)
+    assert store.written == 2
+    assert store.failed == 1
+    assert sorted(item['digest'] for item in store.query()['items']) == ['good-1', 'good-2']
+
+
+def test_records_are_append_only(store):
+    store.record(make_result('A'), digest='d')
+    assert store.flush(5)
+    with sqlite3.connect(store.db_path) as conn:
+        with pytest.raises(sqlite3.DatabaseError):
+            conn.execute("UPDATE verifications SET digest = 'x'")
+        with pytest.raises(sqlite3.DatabaseError):
+            conn.execute("DELETE FROM verifications")
+
+
+def test_full_queue_drops_records(tmp_path):
+    store = AuditStore(str(tmp_path / 'audit.sqlite3'), max_pending=1)
+    for _ in range(1000):
+        store.record(make_result('A'))
+    assert store.flush(5)
+    assert store.dropped > 0
+    assert store.written + store.dropped == 1000
+
+
+def test_drops_from_many_threads_are_all_counted(tmp_path):
+    store = AuditStore(str(tmp_path / 'audit.sqlite3'), max_pending=1)
+    threads = [threading.Thread(target=lambda: [store.record(make_result('A')) for _ in range(500)])
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert store.flush(5)
+    assert store.written + store.dropped == 4000
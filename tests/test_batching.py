@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from batching import MicroBatcher
+
+
+class RecordingModel:
+    """Predicts the sum of each input and remembers the batches it was given."""
+
+    def __init__(self):
+        self.batches = []
+
+    def __call__(self, batch):
+        self.batches.append(batch)
+        return batch.reshape(len(batch), -1).sum(axis=1)
+
+
+def test_concurrent_singles_share_a_forward_pass():
+    model = RecordingModel()
+    batcher = MicroBatcher(model, max_batch_size=8, max_wait_ms=200)
+    futures = [batcher.submit(np.full((2, 2), n, dtype=np.float32)) for n in range(5)]
+    assert [future.result(5) for future in futures] == [0, 4, 8, 12, 16]
+    batcher.close(5)
+    assert [len(batch) for batch in model.batches] == [5]
+
+
+def test_stacked_batch_runs_on_its_own_and_is_not_split():
+    model = RecordingModel()
+    batcher = MicroBatcher(model, max_batch_size=4, max_wait_ms=1000)
+    singles = [batcher.submit(np.full((2, 2), n, dtype=np.float32)) for n in range(2)]
+    stacked = np.ones((6, 2, 2), dtype=np.float32)
+    # Arriving while the singles are gathered ends their wait instead of joining them
+    batched = batcher.submit_batch(stacked)
+    assert list(batched.result(0.5)) == [4] * 6
+    assert [future.result(5) for future in singles] == [0, 4]
+    batcher.close(5)
+    assert [len(batch) for batch in model.batches] == [2, 6]
+    # The stacked batch reaches the model without being copied
+    assert model.batches[1] is stacked
+
+
+def test_batch_buffer_is_reused_between_passes():
+    model = RecordingModel()
+    batcher = MicroBatcher(model, max_batch_size=4, max_wait_ms=0)
+    for n in range(3):
+        assert batcher.predict(np.full((3,), n, dtype=np.float32), timeout=5) == 3 * n
+    batcher.close(5)
+    assert len(model.batches) == 3
+    assert all(batch.base is model.batches[0].base for batch in model.batches)
+    assert model.batches[0].base is not None
+
+
+def test_prediction_errors_reach_every_caller():
+    def fail(batch):
+        raise ValueError("bad input")
+
+    batcher = MicroBatcher(fail, max_batch_size=4, max_wait_ms=50)
+    futures = [batcher.submit(np.zeros(3)) for _ in range(2)] + [batcher.submit_batch(np.zeros((2, 3)))]
+    for future in futures:
+        with pytest.raises(ValueError):
+            future.result(5)
+    batcher.close(5)
+
+
+def test_closed_batcher_refuses_inputs():
+    batcher = MicroBatcher(RecordingModel())
+    batcher.close(5)
+    with pytest.raises(RuntimeError):
+        batcher.submit(np.zeros(3))
+    with pytest.raises(RuntimeError):
+        batcher.submit_batch(np.zeros((1, 3)))
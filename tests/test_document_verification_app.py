@@ -0,0 +1,34 @@
+import cv2
+import numpy as np
+import pytest
+
+from document_verification_app import DocumentAuthenticityDetector
+from forensics import ForensicsAnalyzer
+
+
+def encoded_page(seed):
+    image = np.random.default_rng(seed).integers(0, 255, (600, 800, 3), dtype=np.uint8)
+    return cv2.imencode('.png', image)[1].tobytes()
+
+
+@pytest.fixture
+def detector(tmp_path):
+    # Without a model file the detector scores with its demo fallback, which is enough here
+    return DocumentAuthenticityDetector(str(tmp_path / 'missing.h5'),
+                                        forensics_analyzer=ForensicsAnalyzer(min_side=10000))
+
+
+def test_complete_result_is_cached(detector):
+    result = detector.verify_document(encoded_page(1))
+    assert result['skipped_checks'] == []
+    assert result['partial'] is False
+    assert detector.cache.snapshot()['entries'] == 1
+
+
+def test_result_with_a_check_over_budget_is_flagged_and_not_cached(detector):
+    # ela is estimated to need far longer than its budget, even shrunk
+    detector.forensics.megapixel_ms['ela'] = 1e9
+    result = detector.verify_document(encoded_page(2))
+    assert result['skipped_checks'] == ['ela']
+    assert result['partial'] is True
+    assert detector.cache.snapshot()['entries'] == 0
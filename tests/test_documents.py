@@ -0,0 +1,60 @@
+from io import BytesIO
+
+import numpy as np
+import pytest
+
+from documents import document_format, iter_pages
+from upload_stream import UploadRejected
+
+Image = pytest.importorskip('PIL.Image')
+
+# One RGB colour per page, so order and channel order can both be checked
+PAGE_COLORS = [(255, 0, 0), (0, 255, 0), (0, 0, 255)]
+
+
+def encode_pages(fmt, size=(144, 72)):
+    pages = [Image.new('RGB', size, color) for color in PAGE_COLORS]
+    buffer = BytesIO()
+    pages[0].save(buffer, format=fmt, save_all=True, append_images=pages[1:], resolution=72)
+    return buffer.getvalue()
+
+
+def assert_pages(images, shape):
+    assert len(images) == 3
+    for image, (r, g, b) in zip(images, PAGE_COLORS):
+        assert image.shape == shape
+        # Decoded pages are BGR, like cv2.imread's
+        np.testing.assert_allclose(image[shape[0] // 2, shape[1] // 2], (b, g, r), atol=2)
+
+
+def test_tiff_frames_are_read_one_by_one():
+    data = encode_pages('TIFF')
+    assert document_format(data) == 'tiff'
+    assert_pages(list(iter_pages(data, 'tiff')), (72, 144, 3))
+
+
+def test_pdf_pages_are_rendered_at_the_requested_dpi(tmp_path):
+    pytest.importorskip('pypdfium2')
+    path = tmp_path / 'three.pdf'
+    path.write_bytes(encode_pages('PDF'))
+    assert document_format(str(path)) == 'pdf'
+    # The pages are 2 x 1 inches
+    assert_pages(list(iter_pages(str(path), 'pdf', dpi=100)), (100, 200, 3))
+
+
+@pytest.mark.parametrize('fmt,name', [('TIFF', 'tiff'), ('PDF', 'pdf')])
+def test_page_limits_are_enforced_before_decoding(fmt, name):
+    if name == 'pdf':
+        pytest.importorskip('pypdfium2')
+    data = encode_pages(fmt)
+    with pytest.raises(UploadRejected):
+        next(iter_pages(data, name, dpi=72, max_pages=2))
+    pages = iter_pages(data, name, dpi=72, max_pixels=144 * 72)
+    assert next(pages).shape == (72, 144, 3)
+    with pytest.raises(UploadRejected):
+        next(iter_pages(data, name, dpi=72, max_pixels=144 * 72 - 1))
+
+
+def test_single_page_formats_are_rejected():
+    with pytest.raises(ValueError):
+        next(iter_pages(b'', 'png'))
@@ -0,0 +1,101 @@
+import random
+
+import cv2
+import numpy as np
+import pytest
+
+from duplicate_index import HASH_BITS, DuplicateIndex, _band_masks, perceptual_hash
+
+
+def document(seed, size=(600, 400)):
+    """A synthetic page: blocks of text-like noise on white."""
+    rng = np.random.default_rng(seed)
+    image = np.full((size[1], size[0], 3), 255, dtype=np.uint8)
+    for _ in range(30):
+        x, y = int(rng.integers(0, size[0] - 80)), int(rng.integers(0, size[1] - 20))
+        cv2.rectangle(image, (x, y), (x + int(rng.integers(20, 80)), y + 12), (0, 0, 0), -1)
+    return image
+
+
+def flip_bits(value, count, seed=0):
+    for position in random.Random(seed).sample(range(HASH_BITS), count):
+        value ^= 1 << position
+    return value
+
+
+@pytest.fixture
+def index(tmp_path):
+    return DuplicateIndex(str(tmp_path / 'duplicates.sqlite3'))
+
+
+def test_rescaled_reencoded_copy_hashes_close():
+    original = document(1)
+    resized = cv2.resize(original, (450, 300), interpolation=cv2.INTER_AREA)
+    recoded = cv2.imdecode(cv2.imencode('.jpg', resized, [cv2.IMWRITE_JPEG_QUALITY, 70])[1], cv2.IMREAD_COLOR)
+    assert (perceptual_hash(original) ^ perceptual_hash(recoded)).bit_count() <= 15
+    assert (perceptual_hash(original) ^ perceptual_hash(document(2))).bit_count() > 40
+
+
+def test_blank_page_has_no_hash():
+    assert perceptual_hash(np.full((500, 400), 250, dtype=np.uint8)) is None
+
+
+def test_band_masks():
+    assert _band_masks(0) == [0]
+    assert len(_band_masks(1)) == 17
+    assert len(_band_masks(2)) == 1 + 16 + 120
+
+
+@pytest.mark.parametrize('distance', [0, 1, 8, 15])
+def test_finds_matches_within_max_distance(index, distance):
+    phash = perceptual_hash(document(3))
+    assert index.check(phash, 'original') == []
+    matches = index.check(flip_bits(phash, distance), 'copy')
+    assert [(match.digest, match.distance) for match in matches] == [('original', distance)]
+
+
+def test_ignores_documents_beyond_max_distance(index):
+    phash = perceptual_hash(document(3))
+    index.check(phash, 'original')
+    assert index.search(flip_bits(phash, 16)) == []
+
+
+def test_reverification_neither_matches_itself_nor_grows_the_index(index):
+    phash = perceptual_hash(document(4))
+    index.check(phash, 'same')
+    assert index.check(phash, 'same') == []
+    assert index.count() == 1
+    index.check(phash, 'same', page=2)
+    assert index.count() == 2
+
+
+def test_embeddings_of_the_same_model_must_agree(index):
+    phash = perceptual_hash(document(5))
+    index.check(phash, 'a', embedding=np.array([1.0, 0.0, 0.0]), model='m1')
+    assert index.search(phash, embedding=np.array([0.0, 1.0, 0.0]), model='m1') == []
+    [match] = index.search(phash, embedding=np.array([1.0, 0.05, 0.0]), model='m1')
+    assert match.similarity == pytest.approx(0.9988, abs=1e-3)
+    # Embeddings from another model version don't count; the hash decides alone
+    [match] = index.search(phash, embedding=np.array([0.0, 1.0, 0.0]), model='m2')
+    assert match.similarity is None
+
+
+def test_matches_are_closest_first_and_capped(tmp_path):
+    index = DuplicateIndex(str(tmp_path / 'duplicates.sqlite3'), max_results=3)
+    phash = perceptual_hash(document(6))
+    for distance in (9, 2, 5, 7, 0):
+        index.check(flip_bits(phash, distance, seed=distance), f'd{distance}')
+    assert [match.distance for match in index.search(phash)] == [0, 2, 5]
+
+
+def test_max_distance_is_validated(tmp_path):
+    with pytest.raises(ValueError):
+        DuplicateIndex(str(tmp_path / 'duplicates.sqlite3'), max_distance=HASH_BITS)
+
+
+def test_wider_radius_reads_more_band_keys(tmp_path):
+    index = DuplicateIndex(str(tmp_path / 'duplicates.sqlite3'), max_distance=31)
+    phash = perceptual_hash(document(7))
+    index.check(phash, 'original')
+    [match] = index.search(flip_bits(phash, 31))
+    assert match.distance == 31
@@ -0,0 +1,75 @@
+import cv2
+import numpy as np
+import pytest
+
+from forensics import BudgetExceeded, ForensicsAnalyzer
+
+
+def page(seed=0, size=(600, 800)):
+    """A noisy scan-like page covered in short lines of text."""
+    rng = np.random.default_rng(seed)
+    image = np.full(size + (3,), 235, np.uint8)
+    for _ in range(300):
+        x, y = int(rng.integers(0, size[1] - 20)), int(rng.integers(0, size[0] - 10))
+        cv2.putText(image, f"AB{rng.integers(0, 99)}", (x, y), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (20, 20, 20), 1)
+    image = cv2.GaussianBlur(image, (3, 3), 0)
+    return (image.astype(np.float32) + rng.normal(0, 3, image.shape)).clip(0, 255).astype(np.uint8)
+
+
+def run_all(analyzer, image):
+    working_copy = analyzer.working_copy(image)
+    return [finding.check for name in analyzer.checks for finding in analyzer.run(name, working_copy)]
+
+
+def test_clean_page_has_no_findings():
+    assert run_all(ForensicsAnalyzer(), page()) == []
+
+
+def test_copied_region_is_found():
+    image = page()
+    image[350:550, 450:700] = image[50:250, 50:300]
+    assert run_all(ForensicsAnalyzer(), image) == ['copy_move']
+
+
+def test_working_copy_is_bounded_and_colour():
+    analyzer = ForensicsAnalyzer(max_side=512)
+    copy = analyzer.working_copy(np.zeros((3000, 2000), np.uint8))
+    assert copy.shape == (512, 341, 3)
+
+
+def test_unknown_check_is_refused():
+    with pytest.raises(ValueError):
+        ForensicsAnalyzer(checks=('ela', 'magic'))
+
+
+def test_each_run_updates_the_cost_estimate():
+    analyzer = ForensicsAnalyzer(checks=('noise',))
+    assert analyzer.plan('noise', page()) == 1.0
+    run_all(analyzer, page())
+    assert analyzer.megapixel_ms['noise'] > 0
+
+
+def test_check_is_shrunk_to_fit_its_budget():
+    analyzer = ForensicsAnalyzer(budgets_ms={'ela': 100}, min_side=200)
+    image = np.zeros((800, 1000, 3), np.uint8)
+    # 0.8 megapixels at 500 ms each would take 400 ms: a quarter of the pixels fit
+    analyzer.megapixel_ms['ela'] = 500
+    assert analyzer.plan('ela', image) == pytest.approx(0.5)
+    analyzer.megapixel_ms['ela'] = 50
+    assert analyzer.plan('ela', image) == 1.0
+
+
+def test_check_that_cannot_fit_is_skipped_without_running():
+    analyzer = ForensicsAnalyzer(budgets_ms={'ela': 100}, min_side=600)
+    image = page()
+    analyzer.megapixel_ms['ela'] = 1000
+    called = []
+    analyzer._check_ela = lambda image: called.append(image) or []
+    with pytest.raises(BudgetExceeded):
+        analyzer.run('ela', image)
+    assert called == []
+    # The estimate is halved on every skip, so the check gets another chance
+    assert analyzer.megapixel_ms['ela'] == 500
+    analyzer.megapixel_ms['ela'] = 300
+    analyzer.run('ela', image)
+    assert called[0].shape[1] < image.shape[1]
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from inference_backends import KerasBackend, TFLiteBackend, convert_to_tflite, load_backend, parity_check
+
+
+@pytest.fixture(scope='module')
+def models(tmp_path_factory):
+    tf = pytest.importorskip('tensorflow')
+    tmp_path = tmp_path_factory.mktemp('models')
+    model = tf.keras.Sequential([
+        tf.keras.Input(shape=(224, 224, 3)),
+        tf.keras.layers.Conv2D(4, 3, strides=4, activation='relu'),
+        tf.keras.layers.GlobalAveragePooling2D(),
+        tf.keras.layers.Dense(8, activation='relu'),
+        tf.keras.layers.Dense(1, activation='sigmoid'),
+    ])
+    keras_path = str(tmp_path / 'model.h5')
+    model.save(keras_path)
+    tflite_path = str(tmp_path / 'model.tflite')
+    convert_to_tflite(keras_path, tflite_path)
+    return keras_path, tflite_path
+
+
+def batch_of(count, seed=0):
+    return np.random.default_rng(seed).random((count, 224, 224, 3), dtype=np.float32)
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError):
+        load_backend('model.h5', backend='onnx')
+
+
+def test_tflite_allocates_one_interpreter_per_padded_batch_size(models):
+    backend = TFLiteBackend(models[1])
+    assert sorted(backend._interpreters) == [1]
+    for count in (1, 2, 3, 4, 5, 3):
+        assert backend.predict(batch_of(count)).shape == (count, 1)
+    assert sorted(backend._interpreters) == [1, 2, 4, 8]
+    interpreter = backend._interpreters[4][0]
+    backend.predict(batch_of(3))
+    assert backend._interpreters[4][0] is interpreter
+
+
+@pytest.mark.parametrize('count', [1, 2, 3, 7, 16])
+def test_tflite_scores_match_keras_for_every_batch_size(models, count):
+    keras_path, tflite_path = models
+    keras = load_backend(keras_path)
+    tflite = load_backend(tflite_path)
+    assert isinstance(keras, KerasBackend) and isinstance(tflite, TFLiteBackend)
+    # A larger batch first leaves stale rows in the padded input tensor
+    tflite.predict(batch_of(16, seed=1))
+    batch = batch_of(count)
+    np.testing.assert_allclose(tflite.predict(batch), keras.predict(batch), atol=1e-5)
+
+
+def test_parity_check_reports_agreement(models):
+    keras_path, tflite_path = models
+    samples = list(batch_of(10))
+    report = parity_check(KerasBackend(keras_path), TFLiteBackend(tflite_path), samples, batch_size=4)
+    assert report['samples'] == 10
+    assert report['max_abs_diff'] < 1e-5
+    assert report['verdict_agreement'] == 1.0
+
+
+def test_keras_backend_returns_penultimate_embeddings(models):
+    outputs, embeddings = KerasBackend(models[0]).predict_with_embeddings(batch_of(3))
+    assert outputs.shape == (3, 1)
+    assert embeddings.shape == (3, 8)
+
@@ -0,0 +1,120 @@
+import sqlite3
+import time
+
+import pytest
+
+from jobs import JobQueue
+
+
+def process(data):
+    if data == b'bad':
+        raise ValueError("not a document")
+    return {'length': len(data)}
+
+
+def wait_for_job(queue, job_id, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        status = queue.status(job_id)
+        if status['status'] == 'complete' or time.monotonic() > deadline:
+            return status
+        queue.wait_for_progress(0.1)
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = JobQueue(str(tmp_path / 'jobs.sqlite3'), process, workers=2, poll_interval=0.05)
+    yield queue
+    queue.close(5)
+
+
+def test_job_runs_to_completion(queue):
+    job_id = queue.submit([('a.png', b'abc'), ('b.png', b'bad'), ('c.png', b'abcdef')])
+    status = wait_for_job(queue, job_id)
+    assert status['status'] == 'complete'
+    assert (status['total'], status['completed'], status['failed'], status['pending']) == (3, 2, 1, 0)
+    items = {item['filename']: item for item in status['items']}
+    assert items['a.png']['result'] == {'length': 3}
+    assert items['b.png']['status'] == 'error'
+    assert 'not a document' in items['b.png']['error']
+    assert queue.depth() == 0
+
+
+def test_status_since_skips_earlier_items(queue):
+    job_id = queue.submit([(f'{i}.png', b'x' * i) for i in range(4)])
+    wait_for_job(queue, job_id)
+    assert [item['index'] for item in queue.status(job_id, since=2)['items']] == [2, 3]
+
+
+def test_unknown_job(queue):
+    assert queue.status('missing') is None
+
+
+def test_uploads_are_dropped_once_processed(queue):
+    job_id = queue.submit([('a.png', b'abc')])
+    wait_for_job(queue, job_id)
+    with sqlite3.connect(queue.db_path) as conn:
+        assert conn.execute("SELECT data FROM job_items WHERE job_id = ?", (job_id,)).fetchone() == (None,)
+
+
+def test_abandoned_item_is_reclaimed_after_its_lease(tmp_path):
+    db_path = str(tmp_path / 'jobs.sqlite3')
+    idle = JobQueue(db_path, process, workers=0)
+    job_id = idle.submit([('a.png', b'abc')])
+    # A worker in another process claimed the item and died
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("UPDATE job_items SET status = 'running', claimed_at = ?", (time.time() - 60,))
+
+    queue = JobQueue(db_path, process, workers=1, poll_interval=0.05, lease_seconds=30)
+    try:
+        status = wait_for_job(queue, job_id)
+    finally:
+        queue.close(5)
+    assert status['status'] == 'complete'
+    assert status['items'][0]['result'] == {'length': 3}
+
+
+def test_running_item_is_not_reclaimed_within_its_lease(tmp_path):
+    db_path = str(tmp_path / 'jobs.sqlite3')
+    queue = JobQueue(db_path, process, workers=0, lease_seconds=30)
+    queue.submit([('a.png', b'abc')])
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("UPDATE job_items SET status = 'running', claimed_at = ?", (time.time(),))
+    assert queue._claim() is None
+
+
+def test_long_running_item_keeps_its_claim_while_its_worker_is_alive(tmp_path):
+    db_path = str(tmp_path / 'jobs.sqlite3')
+    calls = []
+
+    def slow(data):
+        calls.append(data)
+        time.sleep(1.0)
+        return {'length': len(data)}
+
+    first = JobQueue(db_path, slow, workers=1, poll_interval=0.05, lease_seconds=0.3)
+    job_id = first.submit([('a.png', b'abc')])
+    while not calls:
+        time.sleep(0.01)
+    # Another process's worker polls the same database throughout the item's run
+    second = JobQueue(db_path, slow, workers=1, poll_interval=0.05, lease_seconds=0.3)
+    try:
+        status = wait_for_job(first, job_id)
+    finally:
+        first.close(5)
+        second.close(5)
+    assert status['status'] == 'complete'
+    assert status['items'][0]['result'] == {'length': 3}
+    assert calls == [b'abc']
+
+
+def test_worker_that_lost_its_claim_does_not_overwrite_the_result(tmp_path):
+    db_path = str(tmp_path / 'jobs.sqlite3')
+    queue = JobQueue(db_path, process, workers=0)
+    job_id = queue.submit([('a.png', b'abc')])
+    job, idx, _, _ = queue._claim()
+    # Another worker reclaimed and finished the item meanwhile
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("UPDATE job_items SET status = 'done', result = '{\"n\": 2}', claimed_at = ?", (time.time(),))
+    queue._finish(job, idx, result={'n': 1})
+    assert queue.status(job_id)['items'][0]['result'] == {'n': 2}
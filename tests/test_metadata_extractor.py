@@ -0,0 +1,78 @@
+import pytest
+
+from metadata_extractor import FieldExtractor, MetadataExtractor
+
+MRZ = ("P<UTOERIKSSON<<ANNA<MARIA<<<<<<<<<<<<<<<<<<<\n"
+       "L898902C36UTO7408122F1204159ZE184226B<<<<<10")
+
+TEXT = f"""REPUBLIC OF UTOPIA PASSPORT
+Surname: ERIKSSON
+Given names: Anna Maria
+Passport No: L898902C3
+Date of birth: 12 AUG 1974
+Date of issue: 16/04/2007
+Date of expiry: 15/04/2012
+Issuing authority: Ministry of Travel
+{MRZ}
+"""
+
+
+def values(found):
+    return {field: match.value for field, match in found.items()}
+
+
+def test_extracts_every_field_of_a_passport():
+    found = MetadataExtractor().extract(TEXT)
+    assert values(found) == {
+        'surname': 'ERIKSSON',
+        'given_names': 'Anna Maria',
+        'document_id': 'L898902C3',
+        'birth_date': '12 AUG 1974',
+        'issue_date': '16/04/2007',
+        'expiry_date': '15/04/2012',
+        'issuing_authority': 'Ministry of Travel',
+        'mrz': MRZ,
+    }
+    assert found['mrz'].confidence == 0.95
+    assert TEXT[found['document_id'].start:found['document_id'].end] == 'L898902C3'
+
+
+def test_mrz_with_a_bad_check_digit_gets_half_the_confidence():
+    broken = MRZ.replace('L898902C36', 'L898902C37')
+    found = MetadataExtractor().extract(broken, fields=['mrz'])
+    assert found['mrz'].confidence == pytest.approx(0.475)
+
+
+def test_fallback_is_overruled_by_a_labelled_value_later_in_the_text():
+    text = "Printed 01/01/2020\nDate of issue: 05.06.2019"
+    found = MetadataExtractor().extract(text, fields=['issue_date'])
+    assert found['issue_date'].value == '05.06.2019'
+    assert found['issue_date'].confidence == 0.9
+
+
+def test_fallback_is_used_without_a_labelled_value():
+    found = MetadataExtractor().extract("Printed 01/01/2020 ref AB12345X", fields=['issue_date', 'document_id'])
+    assert values(found) == {'issue_date': '01/01/2020', 'document_id': 'AB12345X'}
+    assert found['issue_date'].confidence == 0.4
+
+
+def test_only_requested_fields_are_extracted():
+    extractor = MetadataExtractor(fields=['surname'])
+    assert values(extractor.extract(TEXT)) == {'surname': 'ERIKSSON'}
+    assert values(extractor.extract(TEXT, fields=['expiry_date'])) == {'expiry_date': '15/04/2012'}
+
+
+def test_unknown_field_is_refused():
+    with pytest.raises(ValueError):
+        MetadataExtractor(fields=['blood_type'])
+
+
+def test_custom_extractor_with_validator():
+    extractor = MetadataExtractor([FieldExtractor('code', r'CODE-(?P<value>\d+)', confidence=0.6,
+                                                  validate=lambda value: int(value) % 2 == 0)])
+    assert extractor.extract("CODE-42")['code'].confidence == 0.6
+    assert extractor.extract("CODE-41")['code'].confidence == 0.3
+
+
+def test_empty_text():
+    assert MetadataExtractor().extract("") == {}
@@ -0,0 +1,120 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from model_registry import ModelRegistry
+
+
+def predict(batch, backend):
+    return [np.array([backend['score']], dtype=np.float32) for _ in batch]
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+@pytest.fixture
+def model_file(tmp_path):
+    path = tmp_path / 'model.bin'
+    path.write_text('0.9')
+    return path
+
+
+def make_registry(loads):
+    def load(path):
+        loads.append(path)
+        with open(path) as f:
+            return {'score': float(f.read())}
+
+    return ModelRegistry(load, predict, batch_max_wait_ms=0)
+
+
+def test_load_and_score(model_file):
+    registry = make_registry([])
+    registry.load(str(model_file))
+    with registry.acquire() as models:
+        assert models.serving.score(np.zeros(3, dtype=np.float32)) == pytest.approx(0.9)
+    registry.close()
+
+
+def test_replaced_version_is_released_after_its_last_request(model_file, tmp_path):
+    registry = make_registry([])
+    old = registry.load(str(model_file))
+    other = tmp_path / 'other.bin'
+    other.write_text('0.5')
+    with registry.acquire() as models:
+        assert models.serving is old
+        registry.load(str(other))
+        assert old.state == 'draining'
+        assert models.serving.score(np.zeros(3, dtype=np.float32)) == pytest.approx(0.9)
+    # Released off the request thread
+    assert wait_for(lambda: old.state == 'released')
+    assert registry.live.state == 'active'
+    registry.close()
+
+
+def test_release_does_not_run_on_the_request_thread(model_file, tmp_path):
+    registry = make_registry([])
+    old = registry.load(str(model_file))
+    release_threads = []
+    original = registry._release
+
+    def release(version):
+        release_threads.append(threading.current_thread())
+        original(version)
+
+    registry._release = release
+    other = tmp_path / 'other.bin'
+    other.write_text('0.5')
+    with registry.acquire():
+        registry.load(str(other))
+    assert wait_for(lambda: old.state == 'released')
+    assert threading.current_thread() not in release_threads
+    registry.close()
+
+
+def test_watcher_reloads_a_changed_file(model_file):
+    loads = []
+    registry = make_registry(loads)
+    registry.load(str(model_file))
+    registry.watch(0.05)
+    model_file.write_text('0.4')
+    assert wait_for(lambda: registry.live.backend is not None and registry.live.backend['score'] == 0.4)
+    registry.close()
+
+
+def test_watcher_does_not_retry_a_broken_file_until_it_changes(model_file):
+    loads = []
+    registry = make_registry(loads)
+    registry.load(str(model_file))
+    registry.watch(0.05)
+    model_file.write_text('not a model')
+    assert wait_for(lambda: len(loads) == 2)
+    time.sleep(0.5)
+    assert len(loads) == 2
+    assert registry.live.backend['score'] == pytest.approx(0.9)
+
+    model_file.write_text('0.3')
+    assert wait_for(lambda: registry.live.backend is not None and registry.live.backend['score'] == 0.3)
+    registry.close()
+
+
+def test_watcher_loads_a_tracked_model_once_it_appears(tmp_path):
+    loads = []
+    registry = make_registry(loads)
+    path = tmp_path / 'late.bin'
+    registry.track(str(path))
+    registry.watch(0.05)
+    time.sleep(0.2)
+    assert registry.live is None
+    path.write_text('0.8')
+    assert wait_for(lambda: registry.live is not None)
+    assert len(loads) == 1
+    registry.close()
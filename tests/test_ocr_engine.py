@@ -0,0 +1,105 @@
+import cv2
+import numpy as np
+import pytest
+
+import ocr_engine
+from ocr_engine import OCREngine
+
+
+def text_page(height=1400, width=1000, lines=5):
+    """A white page with a few dark, line-shaped blocks of 'text'."""
+    page = np.full((height, width), 255, dtype=np.uint8)
+    for n in range(lines):
+        y = 100 + n * 120
+        cv2.putText(page, "DOCUMENT NUMBER 12345", (80, y), cv2.FONT_HERSHEY_SIMPLEX, 1.5, 0, 3)
+    return page
+
+
+@pytest.fixture
+def tesseract_calls(monkeypatch):
+    pytesseract = pytest.importorskip('pytesseract')
+    calls = []
+
+    def image_to_string(image, lang=None, config=''):
+        calls.append((image, lang, config))
+        return 'text'
+
+    monkeypatch.setattr(pytesseract, 'image_to_string', image_to_string)
+    return calls
+
+
+def test_unknown_profile_is_rejected():
+    with pytest.raises(ValueError):
+        OCREngine(profile='fastest')
+
+
+def test_profiles_set_resolution_and_overrides_apply():
+    assert OCREngine('full').full_resolution_side() is None
+    assert OCREngine('accurate').full_resolution_side() == int(300 * ocr_engine.DEFAULT_PAGE_INCHES)
+    assert OCREngine('fast').settings['target_dpi'] == 200
+    assert OCREngine('fast', target_dpi=150).settings['target_dpi'] == 150
+    # Overrides don't leak into the shared profile table
+    assert ocr_engine.PROFILES['fast']['target_dpi'] == 200
+
+
+def test_tesseract_config_prefers_explicit_options():
+    assert OCREngine().tesseract_config() == ''
+    assert OCREngine(oem=1).tesseract_config(dpi=300.4, psm=6) == '--psm 6 --oem 1 --dpi 300'
+    assert OCREngine(psm=4).tesseract_config(psm=6) == '--psm 4'
+
+
+def test_prepare_scales_high_resolution_scans_down_to_the_target():
+    engine = OCREngine('fast', page_inches=10)
+    gray, dpi = engine.prepare(np.zeros((4000, 3000, 3), dtype=np.uint8))
+    assert dpi == 200
+    assert gray.shape == (2000, 1500)
+    # Within 10% of the target the scan is left alone
+    gray, dpi = engine.prepare(np.zeros((2100, 1500), dtype=np.uint8))
+    assert gray.shape == (2100, 1500)
+    assert dpi == pytest.approx(210)
+
+
+def test_binarize_keeps_dark_text_on_a_light_background():
+    inverted = 255 - text_page()
+    binary = OCREngine().binarize(inverted)
+    assert set(np.unique(binary)) <= {0, 255}
+    assert np.count_nonzero(binary) > binary.size // 2
+
+
+def test_text_regions_are_found_line_by_line():
+    crops = OCREngine().text_region_crops(text_page(lines=5))
+    assert len(crops) == 5
+    assert all(crop.shape[1] > crop.shape[0] for crop in crops)
+
+
+def test_zone_crops_and_packing():
+    engine = OCREngine(zones={'top': (0.0, 0.0, 1.0, 0.5), 'empty': (0.5, 0.5, 0.5, 0.5)})
+    crops = engine.zone_crops(np.zeros((100, 80), dtype=np.uint8))
+    assert [crop.shape for crop in crops] == [(50, 80)]
+    page = engine.pack_regions([np.zeros((10, 30), np.uint8), np.zeros((20, 40), np.uint8)], gap=5)
+    assert page.shape == (10 + 20 + 3 * 5, 40 + 2 * 5)
+
+
+def test_full_profile_passes_the_image_through(tesseract_calls):
+    image = np.zeros((50, 60, 3), dtype=np.uint8)
+    assert OCREngine('full', lang='eng+fra').image_to_string(image) == 'text'
+    passed, lang, config = tesseract_calls[0]
+    assert passed.shape == image.shape
+    assert lang == 'eng+fra'
+    assert config == ''
+
+
+def test_accurate_profile_reads_packed_text_regions(tesseract_calls):
+    OCREngine('accurate').image_to_string(text_page(lines=3))
+    page, _, config = tesseract_calls[0]
+    assert page.ndim == 2
+    assert page.shape[0] < 1400
+    assert '--psm 6' in config and '--dpi' in config
+
+
+def test_fast_profile_reads_only_the_zones(tesseract_calls):
+    engine = OCREngine('fast', zones={'number': (0.0, 0.0, 1.0, 0.1)})
+    engine.image_to_string(text_page())
+    page, _, _ = tesseract_calls[0]
+    # One zone, a tenth of the page, plus the packing gaps
+    assert page.shape[0] < 1400 // 10 + 3 * 12
@@ -0,0 +1,64 @@
+import cv2
+import numpy as np
+import pytest
+
+from preprocessing import Preprocessor
+
+
+def test_default_matches_the_legacy_stretch_and_scale():
+    image = np.random.default_rng(0).integers(0, 256, (300, 500, 3), dtype=np.uint8)
+    expected = cv2.resize(image, (224, 224)) / 255.0
+    result = Preprocessor()(image)
+    assert result.dtype == np.float32 and result.shape == (224, 224, 3)
+    np.testing.assert_allclose(result, expected, atol=1e-6)
+
+
+def test_rgb_order_and_greyscale_input():
+    image = np.zeros((10, 10, 3), dtype=np.uint8)
+    image[..., 0] = 255
+    assert Preprocessor((10, 10), color_order='rgb')(image)[5, 5].tolist() == [0, 0, 1]
+    grey = Preprocessor((10, 10))(np.full((20, 20), 51, dtype=np.uint8))
+    np.testing.assert_allclose(grey, 0.2, atol=1e-6)
+    with pytest.raises(ValueError):
+        Preprocessor(color_order='hsv')
+
+
+def test_letterbox_pads_instead_of_stretching():
+    image = np.full((50, 100, 3), 255, dtype=np.uint8)
+    result = Preprocessor((40, 40), letterbox=True, pad_value=51)(image)
+    # A 2:1 image fills the width and half the height, centred
+    np.testing.assert_allclose(result[10:30], 1.0)
+    np.testing.assert_allclose(result[:10], 0.2, atol=1e-6)
+    np.testing.assert_allclose(result[30:], 0.2, atol=1e-6)
+
+    tall = Preprocessor((40, 40), letterbox=True)(np.full((100, 50, 3), 255, dtype=np.uint8))
+    np.testing.assert_allclose(tall[:, 10:30], 1.0)
+    np.testing.assert_allclose(tall[:, :10], 0.0)
+    np.testing.assert_allclose(tall[:, 30:], 0.0)
+
+
+def test_letterbox_overwrites_every_pixel_of_a_reused_buffer():
+    preprocessor = Preprocessor((40, 40), letterbox=True)
+    out = np.full((40, 40, 3), np.nan, dtype=np.float32)
+    preprocessor(np.zeros((30, 100, 3), dtype=np.uint8), out=out)
+    assert not np.isnan(out).any()
+
+
+def test_roi_crops_before_resizing():
+    image = np.zeros((100, 200, 3), dtype=np.uint8)
+    image[:50, 100:] = 255
+    top_right = (0.5, 0.0, 1.0, 0.5)
+    np.testing.assert_allclose(Preprocessor((20, 20), roi=top_right)(image), 1.0)
+    # A per-call region overrides the default one
+    np.testing.assert_allclose(Preprocessor((20, 20), roi=top_right)(image, roi=(0, 0.5, 0.5, 1)), 0.0)
+    with pytest.raises(ValueError):
+        Preprocessor(roi=(0.5, 0, 0.5, 1))
+
+
+def test_thread_buffers_are_reused():
+    preprocessor = Preprocessor()
+    assert preprocessor.thread_buffer() is preprocessor.thread_buffer()
+    batch = preprocessor.thread_batch_buffer(4)
+    assert batch.shape == (4, 224, 224, 3)
+    assert preprocessor.thread_batch_buffer(2).base is batch.base
+    assert len(preprocessor.thread_batch_buffer(8)) == 8
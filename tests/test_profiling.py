@@ -0,0 +1,80 @@
+import json
+import os
+import threading
+import time
+
+import profiling
+from profiling import Profiler
+
+
+def busy(seconds):
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        pass
+
+
+def test_only_every_nth_request_is_sampled(tmp_path):
+    profiler = Profiler(str(tmp_path), sample_every=3)
+    reasons = []
+    for _ in range(6):
+        session = profiler.begin()
+        reasons.append(session.reason if session else None)
+        if session:
+            profiler.end(session, {})
+    assert reasons == [None, None, 'sampled', None, None, 'sampled']
+    session = profiler.begin(forced=True)
+    assert session.reason == 'requested'
+    profiler.end(session, {})
+
+
+def test_disabled_profiler_profiles_nothing(tmp_path):
+    assert Profiler(str(tmp_path)).begin() is None
+    assert profiling.current() is None
+
+
+def test_slow_threshold_keeps_only_slow_profiles(tmp_path):
+    profiler = Profiler(str(tmp_path), interval_ms=1, slow_ms=50)
+    assert profiler.end(profiler.begin(), {'total': 1}) is None
+    assert not os.listdir(tmp_path)
+
+    session = profiler.begin()
+    busy(0.1)
+    path = profiler.end(session, {'total': 100}, error='boom')
+    with open(path) as f:
+        stacks = f.read()
+    assert 'request;' in stacks and 'busy (test_profiling.py' in stacks
+    with open(path[:-len('.folded')] + '.json') as f:
+        meta = json.load(f)
+    assert meta['reason'] == 'slow'
+    assert meta['error'] == 'boom'
+    assert meta['samples'] > 0
+    assert profiler.find(session.id) == path
+    assert [profile['id'] for profile in profiler.list()] == [session.id]
+
+
+def test_bound_stage_work_is_sampled_with_the_request(tmp_path):
+    profiler = Profiler(str(tmp_path), interval_ms=1)
+    session = profiler.begin(forced=True)
+    profiling.annotate(width=10)
+    worker = threading.Thread(target=profiling.bind(busy), args=(0.1,))
+    worker.start()
+    worker.join()
+    path = profiler.end(session, {})
+    assert profiling.current() is None
+    with open(path) as f:
+        assert any(line.startswith('stage;') for line in f)
+    assert session.info == {'width': 10}
+
+
+def test_unprofiled_work_is_not_wrapped():
+    assert profiling.bind(busy) is busy
+
+
+def test_oldest_profiles_are_rotated_away(tmp_path):
+    profiler = Profiler(str(tmp_path), max_files=3)
+    for _ in range(5):
+        profiler.end(profiler.begin(forced=True), {})
+    names = os.listdir(tmp_path)
+    assert len(names) == 6
+    assert sorted(name.rsplit('.', 1)[1] for name in names) == ['folded'] * 3 + ['json'] * 3
+    assert len(profiler.list()) == 3
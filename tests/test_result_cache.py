@@ -0,0 +1,87 @@
+import hashlib
+import os
+
+from result_cache import VerificationCache
+
+
+def disk_files(path):
+    return sorted(name for _, _, names in os.walk(path) for name in names)
+
+
+def test_hit_returns_a_copy():
+    cache = VerificationCache()
+    assert cache.get('aa') is None
+    cache.put('aa', {'is_authentic': True, 'findings': []})
+    result = cache.get('aa')
+    result['findings'].append('changed')
+    assert cache.get('aa') == {'is_authentic': True, 'findings': []}
+    assert cache.snapshot()['hits'] == 2
+    assert cache.snapshot()['misses'] == 1
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = VerificationCache(max_entries=2)
+    cache.put('a', {'n': 1})
+    cache.put('b', {'n': 2})
+    cache.get('a')
+    cache.put('c', {'n': 3})
+    assert cache.get('b') is None
+    assert cache.get('a') == {'n': 1}
+    assert cache.snapshot()['evictions'] == 1
+
+
+def test_expired_entries_miss():
+    cache = VerificationCache(ttl_seconds=60)
+    cache.put('a', {'n': 1})
+    stored_at, result = cache._entries['a']
+    cache._entries['a'] = (stored_at - 120, result)
+    assert cache.get('a') is None
+    assert cache.snapshot()['expirations'] == 1
+
+
+def test_disk_tier_survives_a_new_cache(tmp_path):
+    VerificationCache(disk_dir=str(tmp_path)).put('aa11', {'n': 1})
+    cache = VerificationCache(disk_dir=str(tmp_path))
+    assert cache.get('aa11') == {'n': 1}
+    assert cache.snapshot()['disk_hits'] == 1
+
+
+def test_sweep_evicts_the_oldest_disk_entries_beyond_the_limit(tmp_path):
+    writer = VerificationCache(disk_dir=str(tmp_path), disk_max_entries=1000)
+    for age, key in enumerate(['dd44', 'cc33', 'bb22', 'aa11']):
+        writer.put(key, {'key': key})
+        path = writer._disk_path(key)
+        os.utime(path, (os.path.getmtime(path) - age, os.path.getmtime(path) - age))
+
+    cache = VerificationCache(disk_dir=str(tmp_path), disk_max_entries=2)
+    cache._sweeper.join()
+    assert disk_files(tmp_path) == ['cc33.json', 'dd44.json']
+    assert cache.snapshot()['disk_evictions'] == 2
+
+
+def test_sweep_deletes_expired_disk_entries(tmp_path):
+    cache = VerificationCache(ttl_seconds=60, disk_dir=str(tmp_path))
+    cache.put('aa11', {'n': 1})
+    cache.put('bb22', {'n': 2})
+    path = cache._disk_path('aa11')
+    os.utime(path, (os.path.getmtime(path) - 120, os.path.getmtime(path) - 120))
+    assert cache.sweep_disk() == 1
+    assert disk_files(tmp_path) == ['bb22.json']
+    assert cache.snapshot()['expirations'] == 1
+
+
+def test_put_sweeps_the_disk_tier_as_it_grows(tmp_path):
+    cache = VerificationCache(max_entries=1, disk_dir=str(tmp_path), disk_max_entries=3)
+    for n in range(10):
+        cache.put(f'{n:02d}aa', {'n': n})
+        cache._sweeper.join()
+    assert len(disk_files(tmp_path)) <= 3
+    assert cache.snapshot()['disk_evictions'] >= 7
+
+
+def test_key_depends_on_content_digest_and_namespace():
+    cache = VerificationCache(namespace='model-a')
+    key = cache.key_for(hashlib.sha256(b'doc').hexdigest())
+    assert key == cache.key_for(hashlib.sha256(b'doc').hexdigest())
+    assert key != cache.key_for(hashlib.sha256(b'other').hexdigest())
+    assert key != cache.key_for(hashlib.sha256(b'doc').hexdigest(), namespace='model-b')
@@ -0,0 +1,114 @@
+import json
+
+import numpy as np
+import pytest
+
+from preprocessing import Preprocessor
+from tiling import Tile, TileAnalyzer, plan_grid
+
+
+def test_plan_grid_covers_the_image_edge_to_edge():
+    tiles = plan_grid(1000, 500, 0.5, 0.25)
+    lefts = sorted({tile.x0 for tile in tiles})
+    tops = sorted({tile.y0 for tile in tiles})
+    assert lefts[0] == 0 and tops[0] == 0
+    assert max(tile.x1 for tile in tiles) == 1.0
+    assert max(tile.y1 for tile in tiles) == 1.0
+    assert len(tiles) == len(lefts) * len(tops)
+    # Tiles are square in pixels: a side of half the short side
+    for tile in tiles:
+        assert (tile.x1 - tile.x0) * 1000 == pytest.approx(250)
+        assert (tile.y1 - tile.y0) * 500 == pytest.approx(250)
+
+
+def test_plan_grid_neighbours_overlap_by_at_least_the_requested_fraction():
+    tiles = plan_grid(1000, 1000, 0.3, 0.25)
+    lefts = sorted({tile.x0 for tile in tiles})
+    side = 0.3
+    for left, right in zip(lefts, lefts[1:]):
+        assert side - (right - left) >= 0.25 * side - 1e-9
+
+
+def test_plan_grid_single_tile_when_it_spans_the_image():
+    assert plan_grid(100, 100, 1.0, 0.0) == [Tile(1.0, 0.0, 0.0, 1.0, 1.0)]
+
+
+def make_analyzer(**kwargs):
+    return TileAnalyzer(Preprocessor(size=(32, 32)), **kwargs)
+
+
+def test_plan_starts_with_the_whole_page_and_skips_tiles_below_the_model_input():
+    analyzer = make_analyzer(scales=(0.5, 0.25))
+    assert analyzer.plan(60, 60) == [Tile(1.0, 0.0, 0.0, 1.0, 1.0)]
+    tiles = analyzer.plan(100, 100)
+    assert tiles[0] == Tile(1.0, 0.0, 0.0, 1.0, 1.0)
+    assert {tile.scale for tile in tiles[1:]} == {0.5}
+
+
+def test_plan_respects_the_latency_budget():
+    analyzer = make_analyzer(scales=(0.5, 0.25), budget_ms=100, max_tiles=64)
+    everything = analyzer.plan(4000, 4000)
+    analyzer.record(seconds=0.01, count=1)
+    assert len(analyzer.plan(4000, 4000)) <= 10
+    assert len(analyzer.plan(4000, 4000)) < len(everything)
+
+
+def test_plan_maps_tiles_into_the_region_of_interest():
+    analyzer = TileAnalyzer(Preprocessor(size=(32, 32), roi=(0.5, 0.0, 1.0, 1.0)), scales=(0.5,))
+    tiles = analyzer.plan(2000, 1000)
+    assert tiles[0] == Tile(1.0, 0.5, 0.0, 1.0, 1.0)
+    for tile in tiles[1:]:
+        assert 0.5 <= tile.x0 < tile.x1 <= 1.0
+
+
+def test_invalid_settings_are_refused():
+    with pytest.raises(ValueError):
+        make_analyzer(overlap=1.0)
+    with pytest.raises(ValueError):
+        make_analyzer(scales=(1.5,))
+
+
+def test_combine_scores_the_document_by_its_weakest_tile():
+    analyzer = make_analyzer(heatmap_side=4, threshold=0.5)
+    tiles = [Tile(1.0, 0, 0, 1, 1), Tile(0.5, 0, 0, 0.5, 0.5), Tile(0.5, 0.5, 0.5, 1, 1)]
+    score, details = analyzer.combine([0.9, 0.95, 0.2], tiles, 400, 400)
+    assert score == pytest.approx(0.2)
+    assert details['whole_page_score'] == pytest.approx(0.9)
+    assert details['count'] == 3
+    assert details['scales'] == [0.5]
+    heatmap = np.array(details['heatmap'])
+    assert heatmap.shape == (4, 4)
+    assert heatmap[3, 3] == pytest.approx(0.8)
+    assert heatmap[0, 0] == pytest.approx(0.05)
+    assert heatmap[0, 3] == 0
+    assert details['suspicious_regions'] == [{'box': [200, 200, 400, 400], 'scale': 0.5, 'score': pytest.approx(0.2)}]
+
+
+def test_combine_heatmap_follows_the_page_aspect_ratio():
+    analyzer = make_analyzer(heatmap_side=8)
+    _, details = analyzer.combine([0.9], [Tile(1.0, 0, 0, 1, 1)], 1000, 500)
+    assert np.array(details['heatmap']).shape == (4, 8)
+    _, details = analyzer.combine([0.9], [Tile(1.0, 0, 0, 1, 1)], 500, 1000)
+    assert np.array(details['heatmap']).shape == (8, 4)
+
+
+def test_preprocess_fills_one_row_per_tile():
+    analyzer = make_analyzer(scales=(0.5,))
+    image = np.zeros((200, 200, 3), dtype=np.uint8)
+    image[:100, :100] = 255
+    tiles = analyzer.plan(200, 200)
+    batch = analyzer.preprocess(image, tiles)
+    assert batch.shape == (len(tiles), 32, 32, 3)
+    # The top-left tile is white
+    top_left = tiles.index(min(tiles[1:], key=lambda tile: (tile.y0, tile.x0)))
+    assert batch[top_left].min() == pytest.approx(1.0)
+
+
+def test_combine_serializes_the_heatmap_with_three_decimals():
+    analyzer = make_analyzer(heatmap_side=4)
+    tiles = [Tile(1.0, 0, 0, 1, 1), Tile(0.5, 0, 0, 0.5, 0.5)]
+    _, details = analyzer.combine([0.9, 0.34], tiles, 400, 400)
+    assert details['heatmap'][0][0] == 0.66
+    for value in json.loads(json.dumps(details['heatmap']))[0]:
+        assert value == round(value, 3)
+    assert '0.66,' in json.dumps(details['heatmap'])
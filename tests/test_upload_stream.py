@@ -0,0 +1,101 @@
+import struct
+
+import pytest
+
+from upload_stream import ImageHeader, SniffingUploadStream, UploadRejected, check_header, sniff_image_header
+
+
+def png_header(width, height):
+    return b'\x89PNG\r\n\x1a\n' + b'\x00\x00\x00\rIHDR' + struct.pack('>II', width, height) + b'\x08\x02\x00\x00\x00'
+
+
+def jpeg_header(width, height, exif=b''):
+    app1 = b'\xff\xe1' + struct.pack('>H', len(exif) + 2) + exif
+    sof = b'\xff\xc0' + struct.pack('>HBHHB', 17, 8, height, width, 3) + b'\x00' * 9
+    return b'\xff\xd8' + app1 + sof
+
+
+def test_png_dimensions():
+    assert sniff_image_header(png_header(640, 480)) == ImageHeader('png', 640, 480)
+
+
+def test_jpeg_dimensions_after_app_segment():
+    assert sniff_image_header(jpeg_header(1200, 800, exif=b'x' * 5000)) == ImageHeader('jpeg', 1200, 800)
+
+
+def test_jpeg_needs_more_bytes_until_final():
+    data = jpeg_header(1200, 800, exif=b'x' * 5000)[:3000]
+    assert sniff_image_header(data) is None
+    assert sniff_image_header(data, final=True) == ImageHeader('jpeg', None, None)
+
+
+def test_gif_dimensions():
+    assert sniff_image_header(b'GIF89a' + struct.pack('<HH', 320, 200) + b'\x00' * 4) == ImageHeader('gif', 320, 200)
+
+
+def test_truncated_gif_is_not_an_error():
+    assert sniff_image_header(b'GIF89a\x01', final=True) == ImageHeader('gif', None, None)
+    assert sniff_image_header(b'GIF89a\x01') is None
+
+
+def test_bmp_negative_height_is_top_down():
+    data = b'BM' + b'\x00' * 16 + struct.pack('<ii', 100, -50)
+    assert sniff_image_header(data) == ImageHeader('bmp', 100, 50)
+
+
+def test_webp_vp8x_dimensions():
+    data = b'RIFF\x00\x00\x00\x00WEBPVP8X' + b'\x00' * 8 + (1999).to_bytes(3, 'little') + (999).to_bytes(3, 'little')
+    assert sniff_image_header(data) == ImageHeader('webp', 2000, 1000)
+
+
+def test_tiff_dimensions():
+    entries = struct.pack('<HHII', 256, 3, 1, 300) + struct.pack('<HHII', 257, 4, 1, 400)
+    data = b'II*\x00' + struct.pack('<I', 8) + struct.pack('<H', 2) + entries + b'\x00' * 4
+    assert sniff_image_header(data) == ImageHeader('tiff', 300, 400)
+
+
+def test_pdf_has_no_dimensions():
+    assert sniff_image_header(b'%PDF-1.7\n%....') == ImageHeader('pdf', None, None)
+
+
+def test_unsupported_type_is_rejected():
+    with pytest.raises(UploadRejected) as excinfo:
+        sniff_image_header(b'<html><body>hello</body></html>')
+    assert excinfo.value.status_code == 415
+
+
+def test_short_data_waits_for_more_bytes():
+    assert sniff_image_header(b'\x89PN') is None
+
+
+def test_check_header_rejects_oversized_images():
+    with pytest.raises(UploadRejected) as excinfo:
+        check_header(ImageHeader('png', 10000, 10000), max_pixels=50_000_000)
+    assert excinfo.value.status_code == 413
+    check_header(ImageHeader('png', 1000, 1000), max_pixels=50_000_000)
+    check_header(ImageHeader('pdf', None, None), max_pixels=50_000_000)
+
+
+def test_stream_rejects_oversized_header_on_first_chunk():
+    stream = SniffingUploadStream(max_pixels=1000)
+    with pytest.raises(UploadRejected):
+        stream.write(png_header(100, 100))
+
+
+def test_stream_sniffs_across_chunks_and_reads_back():
+    data = png_header(64, 32) + b'rest of the file'
+    stream = SniffingUploadStream(max_pixels=10_000)
+    for i in range(0, len(data), 5):
+        stream.write(data[i:i + 5])
+    assert stream.header == ImageHeader('png', 64, 32)
+    stream.seek(0)
+    assert stream.read() == data
+    assert bytes(stream.getbuffer()) == data
+
+
+def test_stream_enforces_max_bytes():
+    stream = SniffingUploadStream(max_bytes=30)
+    stream.write(png_header(1, 1))
+    with pytest.raises(UploadRejected) as excinfo:
+        stream.write(b'x' * 10)
+    assert excinfo.value.status_code == 413
@@ -0,0 +1,33 @@
+import json
+import types
+
+import pytest
+
+import verify_bulk
+
+
+def test_missing_model_is_refused_before_anything_runs(tmp_path):
+    with pytest.raises(SystemExit):
+        verify_bulk.parse_args([str(tmp_path), '--output', str(tmp_path / 'out.jsonl'),
+                                '--model', str(tmp_path / 'missing.h5')])
+
+
+def test_documents_are_not_verified_without_a_loaded_model(tmp_path, monkeypatch):
+    path = tmp_path / 'a.png'
+    path.write_bytes(b'data')
+    detector = types.SimpleNamespace(model_state='missing', verify_document=lambda data: {'is_authentic': True})
+    monkeypatch.setattr(verify_bulk, '_detector', detector)
+    record = verify_bulk._verify_file(verify_bulk.hash_file(str(path)))
+    assert 'result' not in record
+    assert 'missing' in record['error']
+
+
+def test_checkpoint_keeps_verified_files_and_drops_a_partial_record(tmp_path):
+    output = tmp_path / 'out.jsonl'
+    records = [{'path': 'a', 'size': 1, 'mtime_ns': 2, 'sha256': 'x', 'result': {}},
+               {'path': 'b', 'size': 1, 'mtime_ns': 2, 'sha256': 'y', 'error': 'boom'}]
+    output.write_text(''.join(json.dumps(record) + '\n' for record in records) + '{"path": "c", "si')
+    done_paths, done_digests = verify_bulk.load_checkpoint(str(output))
+    assert done_paths == {'a': (1, 2)}
+    assert done_digests == {'x'}
+    assert output.read_text().endswith('"boom"}\n')
@@ -0,0 +1,200 @@
+"""
+Tiled, multi-scale model analysis of high-resolution scans.
+
+Shrinking a whole 4000px scan to the model's 224x224 input throws away nearly
+all the fine detail where edits show. A TileAnalyzer also cuts the page into
+overlapping square tiles at one or more scales and scores them together with
+the whole-page view in a single forward pass. Each tile is resized from a view
+of the page straight into its row of a per-thread batch buffer, so tiling
+needs no crops and no memory beyond that one reused batch.
+
+The document score is the lowest of the scores, as a document is only as
+authentic as its weakest region, and the tile scores are averaged over a coarse
+grid into a heatmap of suspicious regions.
+
+The number of tiles is bounded by a latency budget. The analyzer keeps a
+moving average of the cost of one model input, preprocessing and forward pass
+included, and adds scales, coarsest first, only while the whole scale fits in
+the budget. Scales whose tiles would be smaller than the model input add no
+detail and are skipped, so small images are scored exactly as before.
+"""
+import math
+import threading
+from collections import namedtuple
+
+import numpy as np
+
+# A square region of the page, in page fractions; scale is its side as a fraction of the page's short side
+Tile = namedtuple('Tile', ['scale', 'x0', 'y0', 'x1', 'y1'])
+
+
+def _positions(length, side, stride):
+    """Start offsets of tiles of side covering length, evenly spread so the last one ends at the edge."""
+    if side >= length:
+        return [0.0]
+    count = int(math.ceil((length - side) / stride)) + 1
+    step = (length - side) / (count - 1)
+    return [index * step for index in range(count)]
+
+
+def plan_grid(width, height, scale, overlap):
+    """
+    Lay overlapping square tiles over an image.
+
+    Args:
+        width (int): Image width in pixels.
+        height (int): Image height in pixels.
+        scale (float): Tile side as a fraction of the image's short side.
+        overlap (float): Fraction of a tile shared with its neighbour, in [0, 1).
+
+    Returns:
+        list: Tile tuples in image fractions, row by row.
+    """
+    side = scale * min(width, height)
+    stride = side * (1 - overlap)
+    return [Tile(scale, left / width, top / height, min(1.0, (left + side) / width), min(1.0, (top + side) / height))
+            for top in _positions(height, side, stride)
+            for left in _positions(width, side, stride)]
+
+
+class TileAnalyzer:
+    """Plans, preprocesses and combines multi-scale tiles of a document for one batched forward pass."""
+
+    def __init__(self, preprocessor, scales=(0.5, 0.25), overlap=0.25, budget_ms=250, max_tiles=32,
+                 heatmap_side=32, threshold=0.7, max_regions=5):
+        """
+        Args:
+            preprocessor (Preprocessor): Model input settings; its region of interest,
+                if any, is the area that gets tiled.
+            scales (tuple): Tile sides as fractions of the page's short side.
+            overlap (float): Fraction of a tile shared with its neighbour.
+            budget_ms (float): Time allowed for preprocessing and scoring all the inputs
+                of one page; scales that don't fit are left out.
+            max_tiles (int): Most inputs per page, the whole-page view included,
+                whatever the budget; also bounds the batch buffer.
+            heatmap_side (int): Heatmap cells along the page's long side.
+            threshold (float): Tiles scoring at or below this are reported as suspicious regions.
+            max_regions (int): Most suspicious regions reported, lowest scoring first.
+        """
+        if not 0 <= overlap < 1:
+            raise ValueError("overlap must be in [0, 1)")
+        if any(not 0 < scale < 1 for scale in scales):
+            raise ValueError("tile scales must be fractions between 0 and 1")
+        self.preprocessor = preprocessor
+        self.scales = tuple(sorted(scales, reverse=True))
+        self.overlap = overlap
+        self.budget_ms = budget_ms
+        self.max_tiles = max_tiles
+        self.heatmap_side = heatmap_side
+        self.threshold = threshold
+        self.max_regions = max_regions
+        # Moving average of the cost of one model input, in ms; None until measured
+        self.input_ms = None
+        self._lock = threading.Lock()
+
+    def record(self, seconds, count):
+        """
+        Update the per-input cost from one tiled pass.
+
+        Args:
+            seconds (float): Time spent preprocessing and scoring the batch.
+            count (int): Inputs in the batch.
+        """
+        cost = 1000 * seconds / count
+        with self._lock:
+            self.input_ms = cost if self.input_ms is None else 0.8 * self.input_ms + 0.2 * cost
+
+    def plan(self, width, height):
+        """
+        Choose the inputs to score for an image.
+
+        Args:
+            width (int): Image width in pixels.
+            height (int): Image height in pixels.
+
+        Returns:
+            list: Tile tuples in image fractions; the first is the whole-page view.
+        """
+        x0, y0, x1, y1 = self.preprocessor.roi or (0.0, 0.0, 1.0, 1.0)
+        region_width, region_height = width * (x1 - x0), height * (y1 - y0)
+        limit = self.max_tiles
+        if self.input_ms:
+            limit = min(limit, int(self.budget_ms / self.input_ms))
+
+        tiles = [Tile(1.0, x0, y0, x1, y1)]
+        for scale in self.scales:
+            if scale * min(region_width, region_height) < max(self.preprocessor.size):
+                break
+            level = plan_grid(region_width, region_height, scale, self.overlap)
+            if len(tiles) + len(level) > limit:
+                break
+            # Tile fractions of the region, mapped back to fractions of the page
+            tiles.extend(Tile(scale, x0 + tx0 * (x1 - x0), y0 + ty0 * (y1 - y0),
+                              min(x1, x0 + tx1 * (x1 - x0)), min(y1, y0 + ty1 * (y1 - y0)))
+                         for scale, tx0, ty0, tx1, ty1 in level)
+        return tiles
+
+    def preprocess(self, image, tiles):
+        """
+        Preprocess every planned input into this thread's batch buffer.
+
+        Args:
+            image (np.ndarray): Decoded BGR image.
+            tiles (list): plan() output.
+
+        Returns:
+            np.ndarray: float32 batch of (len(tiles),) + the model input shape, valid
+                until the thread's next call.
+        """
+        batch = self.preprocessor.thread_batch_buffer(len(tiles))
+        for row, tile in zip(batch, tiles):
+            self.preprocessor(image, out=row, roi=tile[1:])
+        return batch
+
+    def combine(self, scores, tiles, width, height):
+        """
+        Turn the scores of the planned inputs into a document score and a heatmap.
+
+        Args:
+            scores (np.ndarray): Authenticity score of each input, in plan() order.
+            tiles (list): plan() output.
+            width (int): Image width in pixels.
+            height (int): Image height in pixels.
+
+        Returns:
+            tuple: (document score, dict with the tile count, scales, whole-page score,
+                heatmap and suspicious regions).
+        """
+        scores = np.asarray(scores, dtype=np.float32)
+        if width >= height:
+            grid_width, grid_height = self.heatmap_side, max(1, round(self.heatmap_side * height / width))
+        else:
+            grid_width, grid_height = max(1, round(self.heatmap_side * width / height)), self.heatmap_side
+
+        # Mean suspicion (1 - score) of the tiles covering each cell
+        suspicion = np.zeros((grid_height, grid_width), dtype=np.float32)
+        coverage = np.zeros((grid_height, grid_width), dtype=np.float32)
+        regions = []
+        for score, tile in zip(scores[1:], tiles[1:]):
+            left, top = int(tile.x0 * grid_width), int(tile.y0 * grid_height)
+            right = max(left + 1, int(math.ceil(tile.x1 * grid_width)))
+            bottom = max(top + 1, int(math.ceil(tile.y1 * grid_height)))
+            suspicion[top:bottom, left:right] += 1 - score
+            coverage[top:bottom, left:right] += 1
+            if score <= self.threshold:
+                regions.append({
+                    'box': [int(tile.x0 * width), int(tile.y0 * height), int(tile.x1 * width), int(tile.y1 * height)],
+                    'scale': tile.scale,
+                    'score': float(score),
+                })
+        heatmap = np.divide(suspicion, coverage, out=np.zeros_like(suspicion), where=coverage > 0)
+
+        regions.sort(key=lambda region: region['score'])
+        return float(scores.min()), {
+            'count': len(tiles),
+            'scales': sorted({tile.scale for tile in tiles[1:]}, reverse=True),
+            'whole_page_score': float(scores[0]),
+            # Rounded as float64: float32 can't hold 3 decimals exactly and would serialize with ~17 digits
+            'heatmap': np.round(heatmap.astype(np.float64), 3).tolist(),
+            'suspicious_regions': regions[:self.max_regions],
+        }
@@ -0,0 +1,234 @@
+"""
+Streaming upload handling for /verify.
+
+Uploads are written chunk by chunk into a SniffingUploadStream while the
+multipart body is still being parsed. The stream checks the magic bytes and
+reads the image dimensions from the header as soon as they arrive. Anything
+that isn't a supported image, or whose pixel count would make decoding blow
+up worker memory, is rejected before the rest of the body is read.
+"""
+import struct
+from collections import namedtuple
+
+import flask
+
+ImageHeader = namedtuple('ImageHeader', ['format', 'width', 'height'])
+
+# JPEG SOF markers carry the frame size; C4 (DHT), C8 (JPG) and CC (DAC) share the range but don't
+_JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+_JPEG_STANDALONE_MARKERS = {0x01, 0xD0, 0xD1, 0xD2, 0xD3, 0xD4, 0xD5, 0xD6, 0xD7, 0xD8, 0xD9}
+
+# Bytes examined before giving up on finding the dimensions (large EXIF blocks precede JPEG frames)
+SNIFF_LIMIT = 256 * 1024
+
+
+class UploadRejected(Exception):
+    """Raised when an upload is refused before it is fully read or decoded."""
+
+    def __init__(self, message, status_code=415):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def sniff_image_header(data, final=False):
+    """
+    Identify an image or PDF from its leading bytes and read its dimensions.
+
+    Args:
+        data (bytes-like): The first bytes of the file.
+        final (bool): True when data holds the whole file or everything that will be sniffed.
+
+    Returns:
+        ImageHeader: The format and size, with width/height None if the header doesn't
+            say (always for PDFs); or None if more bytes are needed to decide.
+
+    Raises:
+        UploadRejected: If the data is not a supported image format or a PDF.
+    """
+    data = bytes(data[:SNIFF_LIMIT])
+    if len(data) < 12 and not final:
+        return None
+
+    if data.startswith(b'\x89PNG\r\n\x1a\n'):
+        if len(data) < 24:
+            return None if not final else ImageHeader('png', None, None)
+        width, height = struct.unpack('>II', data[16:24])
+        return ImageHeader('png', width, height)
+
+    if data.startswith(b'\xff\xd8'):
+        return _sniff_jpeg(data, final or len(data) >= SNIFF_LIMIT)
+
+    if data[:6] in (b'GIF87a', b'GIF89a'):
+        if len(data) < 10:
+            return None if not final else ImageHeader('gif', None, None)
+        width, height = struct.unpack('<HH', data[6:10])
+        return ImageHeader('gif', width, height)
+
+    if data.startswith(b'BM'):
+        if len(data) < 26:
+            return None if not final else ImageHeader('bmp', None, None)
+        width, height = struct.unpack('<ii', data[18:26])
+        return ImageHeader('bmp', abs(width), abs(height))
+
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return _sniff_webp(data, final)
+
+    if data[:4] in (b'II*\x00', b'MM\x00*'):
+        return _sniff_tiff(data, final or len(data) >= SNIFF_LIMIT)
+
+    if data.startswith(b'%PDF-'):
+        # Page sizes are checked as each page is rendered
+        return ImageHeader('pdf', None, None)
+
+    raise UploadRejected("Unsupported file type; expected a PNG, JPEG, GIF, BMP, WebP or TIFF image, or a PDF")
+
+
+def _sniff_jpeg(data, final):
+    i = 2
+    while i + 4 <= len(data):
+        if data[i] != 0xFF:
+            # Corrupt marker stream; let the decoder report it
+            return ImageHeader('jpeg', None, None)
+        marker = data[i + 1]
+        if marker == 0xFF:
+            i += 1
+            continue
+        if marker in _JPEG_STANDALONE_MARKERS:
+            i += 2
+            continue
+        if marker in _JPEG_SOF_MARKERS:
+            if i + 9 > len(data):
+                break
+            height, width = struct.unpack('>HH', data[i + 5:i + 9])
+            return ImageHeader('jpeg', width, height)
+        length = struct.unpack('>H', data[i + 2:i + 4])[0]
+        i += 2 + length
+    return ImageHeader('jpeg', None, None) if final else None
+
+
+def _sniff_webp(data, final):
+    if len(data) < 30:
+        return ImageHeader('webp', None, None) if final else None
+    chunk = data[12:16]
+    if chunk == b'VP8 ':
+        width, height = struct.unpack('<HH', data[26:30])
+        return ImageHeader('webp', width & 0x3FFF, height & 0x3FFF)
+    if chunk == b'VP8L':
+        bits = struct.unpack('<I', data[21:25])[0]
+        return ImageHeader('webp', (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1)
+    if chunk == b'VP8X':
+        width = int.from_bytes(data[24:27], 'little') + 1
+        height = int.from_bytes(data[27:30], 'little') + 1
+        return ImageHeader('webp', width, height)
+    return ImageHeader('webp', None, None)
+
+
+def _sniff_tiff(data, final):
+    order = '<' if data[:2] == b'II' else '>'
+    offset = struct.unpack(order + 'I', data[4:8])[0]
+    if offset + 2 > len(data):
+        # Some writers put the first IFD at the end of the file
+        return ImageHeader('tiff', None, None) if final else None
+    count = struct.unpack(order + 'H', data[offset:offset + 2])[0]
+    end = offset + 2 + 12 * count
+    if end > len(data):
+        return ImageHeader('tiff', None, None) if final else None
+
+    size = {}
+    for entry in range(offset + 2, end, 12):
+        tag, field_type = struct.unpack(order + 'HH', data[entry:entry + 4])
+        if tag in (256, 257):
+            # SHORT (3) or LONG (4) values are stored inline
+            fmt = order + ('H' if field_type == 3 else 'I')
+            size[tag] = struct.unpack(fmt, data[entry + 8:entry + 8 + struct.calcsize(fmt)])[0]
+    return ImageHeader('tiff', size.get(256), size.get(257))
+
+
+def check_header(header, max_pixels):
+    """
+    Reject images whose declared size exceeds the pixel budget.
+
+    Args:
+        header (ImageHeader): Sniffed header.
+        max_pixels (int): Largest accepted width * height; None disables the check.
+    """
+    if max_pixels and header.width and header.height and header.width * header.height > max_pixels:
+        raise UploadRejected(f"Image is {header.width}x{header.height}, which exceeds the limit of "
+                             f"{max_pixels} pixels", status_code=413)
+
+
+class SniffingUploadStream:
+    """A growable in-memory file that validates the image header as chunks are written."""
+
+    def __init__(self, max_pixels=None, max_bytes=None):
+        """
+        Args:
+            max_pixels (int): Largest accepted width * height.
+            max_bytes (int): Largest accepted upload size.
+        """
+        self.max_pixels = max_pixels
+        self.max_bytes = max_bytes
+        self.header = None
+        self._buffer = bytearray()
+        self._position = 0
+        self.closed = False
+
+    def write(self, chunk):
+        self._buffer += chunk
+        if self.max_bytes and len(self._buffer) > self.max_bytes:
+            raise UploadRejected("Upload is too large", status_code=413)
+        if self.header is None:
+            self.header = sniff_image_header(self._buffer, final=len(self._buffer) >= SNIFF_LIMIT)
+            if self.header is not None:
+                check_header(self.header, self.max_pixels)
+        return len(chunk)
+
+    def getbuffer(self):
+        """Return a zero-copy view of everything written so far."""
+        return memoryview(self._buffer)
+
+    def read(self, size=-1):
+        end = len(self._buffer) if size is None or size < 0 else min(self._position + size, len(self._buffer))
+        data = bytes(self._buffer[self._position:end])
+        self._position = end
+        return data
+
+    def seek(self, offset, whence=0):
+        base = {0: 0, 1: self._position, 2: len(self._buffer)}[whence]
+        self._position = max(base + offset, 0)
+        return self._position
+
+    def tell(self):
+        return self._position
+
+    def readable(self):
+        return True
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def __len__(self):
+        return len(self._buffer)
+
+
+class StreamingUploadRequest(flask.Request):
+    """Request class that validates uploads to sniffing endpoints while the body streams in."""
+
+    # Endpoints whose uploads must be single images
+    sniffing_endpoints = {'verify_document'}
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.endpoint not in self.sniffing_endpoints:
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        config = flask.current_app.config
+        return SniffingUploadStream(max_pixels=config.get('MAX_IMAGE_PIXELS'),
+                                    max_bytes=config.get('MAX_CONTENT_LENGTH'))
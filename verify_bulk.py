@@ -0,0 +1,366 @@
+"""
+Offline bulk verification of archived documents.
+
+Runs DocumentAuthenticityDetector over a directory tree or a list of files in a
+pool of worker processes, with no HTTP in between. Each worker loads the app's
+detector once, with TensorFlow, OpenCV and Tesseract threading capped so the
+workers together saturate the cores without oversubscribing them.
+
+Results are appended to a JSON Lines file as they finish, one record per file,
+and flushed immediately, so the output doubles as the checkpoint. Re-running
+with the same output resumes an interrupted run: files already recorded with
+the same size and modification time aren't read again. Every other file is
+hashed before it is handed to a worker, and one whose content was already
+verified, by an earlier run or earlier in this one, is skipped without being
+verified again. Files that failed are retried.
+
+Workers build the detector with the app's settings but without the web
+service's job queue, result cache, audit store, duplicate index or profiler, so
+a bulk run neither takes queued /verify/batch jobs nor writes to the service's
+databases. The run stops before verifying anything unless the workers loaded the
+model: the detector's demo fallback scores are no verdicts, and recording them
+would mark the files as done for every later run.
+
+Usage:
+    python verify_bulk.py /archive/scans --model /models/document_model.h5 --output results.jsonl --workers 16
+    find /archive -name '*.pdf' | python verify_bulk.py --file-list - --output results.jsonl
+"""
+import argparse
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from serve import thread_environment
+
+logger = logging.getLogger(__name__)
+
+DOCUMENT_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tif', '.tiff', '.webp', '.pdf')
+
+# Set in each worker process by _init_worker
+_detector = None
+
+
+def iter_documents(paths, file_list=None):
+    """
+    List the documents to verify.
+
+    Args:
+        paths (list): Files and directories; directories are searched recursively
+            for DOCUMENT_EXTENSIONS.
+        file_list (str): Optional file with one path per line, or '-' for stdin.
+            Listed paths are used whatever their extension.
+
+    Yields:
+        str: Document paths, in a stable order.
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, names in os.walk(path):
+                dirs.sort()
+                for name in sorted(names):
+                    if name.lower().endswith(DOCUMENT_EXTENSIONS) and not name.startswith('.'):
+                        yield os.path.join(root, name)
+        else:
+            yield path
+    if file_list:
+        f = sys.stdin if file_list == '-' else open(file_list, encoding='utf-8')
+        try:
+            for line in f:
+                line = line.rstrip('\n')
+                if line:
+                    yield line
+        finally:
+            if f is not sys.stdin:
+                f.close()
+
+
+def load_checkpoint(output_path):
+    """
+    Read the records of earlier runs from the output file.
+
+    A record cut short by an interrupted run is truncated away so new records
+    can be appended after it.
+
+    Args:
+        output_path (str): JSON Lines output of earlier runs.
+
+    Returns:
+        tuple: ({path: (size, mtime_ns)}, set of sha256 digests) for documents
+            verified successfully.
+    """
+    done_paths = {}
+    done_digests = set()
+    if not os.path.exists(output_path):
+        return done_paths, done_digests
+
+    good_end = 0
+    with open(output_path, 'rb') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            if not line.endswith(b'\n'):
+                break
+            good_end += len(line)
+            if 'result' in record:
+                done_paths[record['path']] = (record['size'], record['mtime_ns'])
+                done_digests.add(record['sha256'])
+
+    if good_end < os.path.getsize(output_path):
+        logger.warning(f"Discarding a partial record at the end of {output_path}")
+        with open(output_path, 'rb+') as f:
+            f.truncate(good_end)
+    return done_paths, done_digests
+
+
+def _init_worker(model_path, intra_op_threads, inter_op_threads):
+    """Load the detector in a pool process, with native threading capped."""
+    global _detector
+    # Applied when the detector first imports TensorFlow, before its runtime starts
+    from inference_backends import configure_tensorflow_threads
+    configure_tensorflow_threads(intra_op=intra_op_threads, inter_op=inter_op_threads)
+    import cv2
+    cv2.setNumThreads(intra_op_threads)
+
+    # Per-document request logging would drown out the progress display
+    logging.getLogger().setLevel(logging.WARNING)
+    import document_verification_app as app_module
+    # Results go straight to the output: caching them would only use memory, and the
+    # service's stores are the service's to write
+    _detector = app_module.create_detector(dict(app_module.app.config,
+                                                MODEL_PATH=model_path,
+                                                MODEL_BACKGROUND_LOAD=False,
+                                                MODEL_WATCH_SECONDS=None,
+                                                CACHE_MAX_ENTRIES=0,
+                                                AUDIT_DB_PATH=None,
+                                                DUPLICATE_INDEX_PATH=None,
+                                                PROFILE_DIR=None))
+
+
+def _model_status():
+    """Report, from a pool process, the detector's model state and load error, if any."""
+    return _detector.model_state, _detector.model_error
+
+
+def hash_file(path):
+    """
+    Identify a document by its content.
+
+    Args:
+        path (str): Path to the document.
+
+    Returns:
+        dict: The start of its output record: path, size, mtime_ns and sha256.
+    """
+    stat = os.stat(path)
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return {'path': path, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': digest.hexdigest()}
+
+
+def _verify_file(record):
+    """
+    Verify one document in a pool process.
+
+    Args:
+        record (dict): hash_file() output for the document.
+
+    Returns:
+        dict: The output record, with the result or the error added.
+    """
+    record = dict(record)
+    start = time.perf_counter()
+    try:
+        if _detector.model_state != 'ready':
+            raise RuntimeError(f"The model is {_detector.model_state}")
+        with open(record['path'], 'rb') as f:
+            data = f.read()
+        record['result'] = _detector.verify_document(data)
+    except Exception as e:
+        record['error'] = f"{type(e).__name__}: {str(e)}"
+    record['seconds'] = round(time.perf_counter() - start, 3)
+    record['verified_at'] = time.time()
+    return record
+
+
+class Progress:
+    """A single status line on stderr: counts, throughput and time remaining."""
+
+    def __init__(self, total, stream=sys.stderr, interval=0.5):
+        self.total = total
+        self.stream = stream
+        self.interval = interval
+        self.counts = {'verified': 0, 'forged': 0, 'skipped': 0, 'failed': 0}
+        self.start = time.monotonic()
+        self._last_draw = 0.0
+
+    def update(self, outcome, forged=False):
+        self.counts[outcome] += 1
+        if forged:
+            self.counts['forged'] += 1
+        now = time.monotonic()
+        if now - self._last_draw >= self.interval:
+            self.draw(now)
+
+    def draw(self, now=None, final=False):
+        now = now if now is not None else time.monotonic()
+        self._last_draw = now
+        finished = self.counts['verified'] + self.counts['skipped'] + self.counts['failed']
+        elapsed = max(now - self.start, 1e-9)
+        rate = self.counts['verified'] / elapsed
+        remaining = self.total - finished
+        eta = f"{remaining / rate:.0f}s" if rate > 0 else "?"
+        line = (f"{finished}/{self.total} files | {self.counts['verified']} verified "
+                f"({self.counts['forged']} forged), {self.counts['skipped']} skipped, "
+                f"{self.counts['failed']} failed | {rate:.1f} docs/s | eta {eta}")
+        if self.stream.isatty() and not final:
+            self.stream.write('\r' + line + '\033[K')
+        else:
+            self.stream.write(line + '\n')
+        self.stream.flush()
+
+
+def run(args):
+    """
+    Verify every listed document not already in the output.
+
+    Returns:
+        int: Exit status, 1 if any document failed, 2 if the model didn't load.
+    """
+    done_paths, done_digests = load_checkpoint(args.output)
+
+    # Unchanged files recorded by an earlier run are skipped without being read
+    pending = []
+    skipped = 0
+    for path in iter_documents(args.paths, args.file_list):
+        try:
+            stat = os.stat(path)
+            if done_paths.get(path) == (stat.st_size, stat.st_mtime_ns):
+                skipped += 1
+                continue
+        except OSError:
+            pass  # Reported when it is hashed, like any other failure
+        pending.append(path)
+    logger.info(f"{len(pending)} documents to verify, {skipped} already in {args.output}")
+
+    progress = Progress(len(pending) + skipped)
+    progress.counts['skipped'] = skipped
+    if not pending:
+        progress.draw(final=True)
+        return 0
+
+    # Spawned, not forked: each worker gets a fresh interpreter for TensorFlow,
+    # with the thread caps in its environment from the start
+    os.environ.update(thread_environment(args))
+    pool = ProcessPoolExecutor(max_workers=args.workers,
+                               mp_context=multiprocessing.get_context('spawn'),
+                               initializer=_init_worker,
+                               initargs=(args.model, args.intra_op_threads, args.inter_op_threads))
+    try:
+        state, error = pool.submit(_model_status).result()
+    except BrokenProcessPool as e:
+        state, error = 'failed', str(e)
+    if state != 'ready':
+        pool.shutdown(cancel_futures=True)
+        logger.error(f"Model {args.model} is {state}{f' ({error})' if error else ''}; nothing was verified")
+        return 2
+
+    # Digests verified by earlier runs or submitted in this one; a file with one of
+    # them is a copy and never reaches a worker
+    seen_digests = set(done_digests)
+    # Bound the futures in flight so huge trees don't queue every path at once
+    in_flight = set()
+    queue = iter(pending)
+    with open(args.output, 'a', encoding='utf-8') as out, pool:
+
+        def write(record):
+            out.write(json.dumps(record) + '\n')
+            out.flush()
+            if 'result' in record:
+                progress.update('verified', forged=not record['result']['is_authentic'])
+            else:
+                logger.warning(f"Failed to verify {record['path']}: {record['error']}")
+                progress.update('failed')
+
+        try:
+            while True:
+                for path in queue:
+                    try:
+                        record = hash_file(path)
+                    except OSError as e:
+                        write({'path': path, 'error': f"{type(e).__name__}: {str(e)}", 'verified_at': time.time()})
+                        continue
+                    if record['sha256'] in seen_digests:
+                        progress.update('skipped')
+                        continue
+                    seen_digests.add(record['sha256'])
+                    in_flight.add(pool.submit(_verify_file, record))
+                    if len(in_flight) >= args.workers * 4:
+                        break
+                if not in_flight:
+                    break
+                finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    write(future.result())
+        except KeyboardInterrupt:
+            logger.warning("Interrupted; re-run with the same --output to resume")
+            for future in in_flight:
+                future.cancel()
+            raise
+        finally:
+            progress.draw(final=True)
+    return 1 if progress.counts['failed'] else 0
+
+
+def parse_args(argv=None):
+    cpu_count = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="Verify a directory tree or list of documents offline")
+    parser.add_argument('paths', nargs='*', help="documents, or directories searched recursively")
+    parser.add_argument('--file-list', help="file with one document path per line ('-' for stdin)")
+    parser.add_argument('--model', default=None,
+                        help="model file or SavedModel directory (default: the app's MODEL_PATH)")
+    parser.add_argument('--output', required=True, help="JSON Lines results file, appended to and resumed from")
+    parser.add_argument('--workers', type=int, default=cpu_count,
+                        help="number of worker processes (default: one per core)")
+    parser.add_argument('--intra-op-threads', type=int, default=None,
+                        help="TensorFlow/OpenCV threads per worker (default: cores / workers)")
+    parser.add_argument('--inter-op-threads', type=int, default=1,
+                        help="TensorFlow inter-op threads per worker")
+    parser.add_argument('--omp-thread-limit', type=int, default=1,
+                        help="OMP_THREAD_LIMIT for Tesseract processes started by a worker")
+    args = parser.parse_args(argv)
+
+    if not args.paths and not args.file_list:
+        parser.error("give at least one path or --file-list")
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.model is None:
+        import document_verification_app as app_module
+        args.model = app_module.app.config['MODEL_PATH']
+    if not os.path.exists(args.model):
+        parser.error(f"model {args.model} not found; pass --model")
+    if args.intra_op_threads is None:
+        args.intra_op_threads = max(1, cpu_count // args.workers)
+    return args
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    args = parse_args(argv)
+    try:
+        sys.exit(run(args))
+    except KeyboardInterrupt:
+        sys.exit(130)
+
+
+if __name__ == '__main__':
+    main()